@@ -0,0 +1,162 @@
+"""
+Reference copies of the implementations the optimized code replaced. The benchmarks time them against
+the current code and the tests check that both return the same results.
+"""
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from src.extract import list_filtered_months, read_filtered_month
+from src.feature_engineering import TemporalFeatures
+from src.filtering import filter_by_date_range, select_important_columns
+from src.model import get_pipeline
+from src.paths import PATH_DATETIME
+from src.schema import compact_schema
+from src.transform import get_cutoff_indices
+
+def legacy_add_missing_slots(df_grouped) -> pd.DataFrame:
+    """Reference copy of the per-location reindex loop formerly in `add_missing_slots`."""
+    location_ids = df_grouped['PULocationID'].unique()
+    full_range = pd.date_range(
+        start=df_grouped['pickup_hour'].min(), end=df_grouped['pickup_hour'].max(), freq='h'
+    )
+
+    output_list = []
+    for location_id in tqdm(location_ids):
+        df_location = df_grouped.loc[df_grouped['PULocationID'] == location_id, ['pickup_hour', 'rides']]
+        df_location = df_location.set_index('pickup_hour').reindex(full_range).fillna(0).reset_index()
+        df_location = df_location.rename(columns={'index': 'pickup_hour'})
+        df_location['PULocationID'] = location_id
+        output_list.append(df_location)
+
+    return pd.concat(output_list, ignore_index=True).reset_index(drop=True)
+
+def legacy_process_feature_target_by_PULocationID(df, n_features, step_size=1):
+    """Reference copy of the per-window loop formerly in `process_feature_target_by_PULocationID`."""
+    unique_pulocation_ids = df['PULocationID'].unique()
+    features = pd.DataFrame()
+    targets = pd.DataFrame()
+
+    for pulocation_id in tqdm(unique_pulocation_ids):
+        df_location = df[df['PULocationID'] == pulocation_id].sort_values('pickup_hour')
+        df_location = df_location.loc[
+            df_location['PULocationID'] == pulocation_id,
+            ['pickup_hour', 'rides']
+        ]
+
+        if len(df_location) < n_features:
+            continue
+
+        cutoff_indices = get_cutoff_indices(df_location, n_features, step_size)
+
+        n_examples = len(cutoff_indices)
+        feature_matrix = np.ndarray((n_examples, n_features), dtype=np.float32)
+        target_vector = np.ndarray((n_examples,), dtype=np.float32)
+        pickup_hours = []
+
+        for i, (start_idx, mid_idx, end_idx) in enumerate(cutoff_indices):
+            feature_matrix[i, :] = df_location.iloc[start_idx:mid_idx]['rides'].values
+            target_vector[i] = df_location.iloc[end_idx]['rides']
+            pickup_hours.append(df_location.iloc[mid_idx]['pickup_hour'])
+
+        df_location = pd.DataFrame(
+            feature_matrix,
+            columns=[f'rides_previous_{i+1}' for i in reversed(range(n_features))]
+        )
+        df_location['pickup_hour'] = pickup_hours
+        df_location['PULocationID'] = pulocation_id
+
+        target_vector = pd.DataFrame(target_vector, columns=['target_rides_next_hour'])
+
+        features = pd.concat([features, df_location])
+        targets = pd.concat([targets, target_vector])
+
+    features.reset_index(inplace=True, drop=True)
+    targets.reset_index(inplace=True, drop=True)
+
+    return features, targets['target_rides_next_hour']
+
+def legacy_read_raw_month(file_path, path, year, month) -> pd.DataFrame:
+    """Reference copy of the former raw read: every column is decoded before filtering the month."""
+    df = pd.read_parquet(file_path)
+    filtered_df = filter_by_date_range(df, year, month, PATH_DATETIME[path])
+    return select_important_columns(filtered_df, path).dropna()
+
+def legacy_predict_all_zones(model, df_time_series, at_hour, n_features=24 * 28) -> pd.DataFrame:
+    """Reference per-zone scoring: one feature row and one `predict` call per PULocationID."""
+    rows = []
+    pickup_hour = pd.Timestamp(at_hour) - pd.Timedelta(hours=1)
+    for pulocation_id in df_time_series['PULocationID'].unique():
+        df_location = df_time_series[df_time_series['PULocationID'] == pulocation_id].sort_values('pickup_hour')
+        df_location = df_location[df_location['pickup_hour'] < pickup_hour].iloc[-n_features:]
+
+        features = pd.DataFrame(
+            [df_location['rides'].to_numpy(dtype=np.float32)],
+            columns=[f'rides_previous_{i+1}' for i in reversed(range(n_features))]
+        )
+        features['pickup_hour'] = pickup_hour
+        features['PULocationID'] = pulocation_id
+        rows.append({
+            'pickup_hour': pd.Timestamp(at_hour),
+            'PULocationID': pulocation_id,
+            'predicted_rides': model.predict(features)[0],
+        })
+    return pd.DataFrame(rows)
+
+def legacy_train_zone_models(df, model, cutoff_date, target_column_name='target_rides_next_hour', **hyperparameters) -> dict:
+    """Fit and evaluate one pipeline per zone sequentially, the way `create_training_sets` is consumed."""
+    from sklearn.metrics import root_mean_squared_error
+    from src.training import train_test_split
+
+    rmse = {}
+    for pulocation_id in df['PULocationID'].unique():
+        location_data = df[df['PULocationID'] == pulocation_id].drop(columns=['PULocationID'])
+        X_train, y_train, X_test, y_test = train_test_split(location_data, cutoff_date, target_column_name)
+        pipeline = get_pipeline(model, **hyperparameters)
+        pipeline.fit(X_train, y_train)
+        rmse[int(pulocation_id)] = root_mean_squared_error(y_test, pipeline.predict(X_test))
+    return rmse
+
+def legacy_aggregate_filtered_data(path, filtered_dir) -> pd.DataFrame:
+    """Reference copy of the former aggregation: every filtered month is concatenated before grouping."""
+    df_filtered = pd.concat(
+        [read_filtered_month(path, year, month, filtered_dir) for year, month in list_filtered_months(path, filtered_dir)],
+        ignore_index=True
+    )
+    return legacy_process_filtered_dataframe(df_filtered)
+
+def legacy_process_filtered_dataframe(df) -> pd.DataFrame:
+    """Reference copy of the former hourly aggregation with `dt.floor` and `groupby().size()`."""
+    df['pickup_hour'] = df['pickup_datetime'].dt.floor('h')
+    df_grouped = df.groupby(['pickup_hour', 'PULocationID']).size().reset_index(name='rides')
+    return compact_schema(df_grouped)
+
+def legacy_backtest(df, model, cutoffs, horizon, **hyperparameters) -> list:
+    """Refit by hand at every cutoff with `train_test_split` masks, as in the notebooks. Returns the fold MAEs."""
+    from sklearn.metrics import mean_absolute_error
+    from src.training import train_test_split
+
+    maes = []
+    for cutoff in cutoffs:
+        X_train, y_train, X_test, y_test = train_test_split(df, cutoff, 'target_rides_next_hour')
+        in_horizon = (X_test['pickup_hour'] < cutoff + pd.Timedelta(horizon)).to_numpy()
+        pipeline = get_pipeline(model, **hyperparameters)
+        pipeline.fit(X_train.drop(columns=['PULocationID']), y_train)
+        y_pred = pipeline.predict(X_test[in_horizon].drop(columns=['PULocationID']))
+        maes.append(mean_absolute_error(y_test[in_horizon], y_pred))
+    return maes
+
+class LegacyTemporalFeatures(TemporalFeatures):
+    """`TemporalFeatures` before the calendar lookup: a full copy plus one `.dt` accessor per feature."""
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        X_ = X.copy()
+        X_['hour'] = X_.pickup_hour.dt.hour
+        X_['day_of_week'] = X_.pickup_hour.dt.dayofweek
+        X_['day_of_month'] = X_.pickup_hour.dt.day
+        X_['month'] = X_.pickup_hour.dt.month
+        X_['year'] = X_.pickup_hour.dt.year
+        return X_.drop(columns=['pickup_hour'])
+
+def legacy_average_rides_last_4_weeks(X: pd.DataFrame) -> pd.DataFrame:
+    avg_rides_last_4_weeks = X[[f'rides_previous_{24*7*i}' for i in range(1, 5)]].mean(axis=1)
+    return X.assign(avg_rides_last_4_weeks=avg_rides_last_4_weeks)
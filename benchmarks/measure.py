@@ -0,0 +1,100 @@
+"""Timing and memory measurements used by the benchmarks."""
+import sys
+import time
+import resource
+import subprocess
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+
+def time_function(func, *args, repeat: int = 1, **kwargs):
+    """
+    Run `func` `repeat` times and return its last result with the best wall time in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def measure_in_fresh_process(func, *args) -> dict:
+    """
+    Run `func(*args)` in a freshly spawned interpreter and report its wall time and peak RSS.
+
+    Returns:
+    - A dictionary with the wall time in seconds, the peak RSS in MB and the number of rows returned.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_measure, func, *args).result()
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of the current process in MB.
+
+    Reads `VmHWM`, which unlike `ru_maxrss` is not inherited from the parent across fork and exec.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _measure(func, *args) -> dict:
+    baseline_rss = peak_rss_mb()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    peak_rss = peak_rss_mb()
+    return {
+        'seconds': seconds,
+        'peak_rss_mb': peak_rss,
+        'rss_increase_mb': peak_rss - baseline_rss,
+        'rows': len(result),
+    }
+
+def peak_allocation(func, *args, **kwargs):
+    """Run `func` and return its result with the peak memory it allocated in MB (numpy and Python objects)."""
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak / 2**20
+
+def parse_importtime(stderr: str) -> pd.DataFrame:
+    """Parse the `-X importtime` report into one row per module with its self and cumulative microseconds."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append({
+            'module': module.strip(),
+            'depth': (len(module) - len(module.lstrip()) - 1) // 2,
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+        })
+    return pd.DataFrame(rows, columns=['module', 'depth', 'self_us', 'cumulative_us'])
+
+def cold_start_code(command: str) -> str:
+    """Python code importing what a CLI command needs; 'help' imports only the CLI itself."""
+    return 'import src.cli' if command == 'help' else f"from src.cli import load_command; load_command('{command}')"
+
+def cold_start(command: str, importtime: bool = False):
+    """
+    Run `cold_start_code(command)` in a fresh interpreter from the repository root.
+
+    Returns the wall time in seconds, or with `importtime=True` the `-X importtime` report.
+    """
+    options = ['-X', 'importtime'] if importtime else []
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, *options, '-c', cold_start_code(command)], check=True,
+                             capture_output=True, text=True, cwd=Path(__file__).resolve().parent.parent)
+    return process.stderr if importtime else time.perf_counter() - start
@@ -0,0 +1,936 @@
+"""
+Benchmarks of the pipeline hot paths against the implementations they replaced, on synthetic data.
+
+Each benchmark runs on its own, e.g. `python -m benchmarks.run predict_all_zones serving`; `--list`
+prints the available names. Correctness checks live in `tests/`.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import requests
+from src.logger import get_logger
+from src.extract import (fetch_data_if_not_exists, ingest_months, list_filtered_months, read_filtered_month, read_raw_month,
+                         validate_and_process_data)
+from src.filtering import select_important_columns
+from src.paths import FHV, GREEN, YELLOW
+from src.transform import (DEFAULT_LAG_SPEC, add_missing_slots, aggregate_filtered_data, process_feature_target_by_PULocationID,
+                           process_filtered_dataframe, time_series_to_dense_matrix, update_feature_target_data,
+                           update_time_series_data)
+from src.stage_cache import StageCache, code_version
+from src.training import create_training_sets, create_training_sets_from_matrix
+from src.training_matrix import TrainingMatrix, export_training_matrix
+from src.window_dataset import WindowDataset
+from src.backtest import backtest, walk_forward_cutoffs
+from src.feature_store import read_feature_group, write_feature_group
+from src.model import get_array_pipeline, get_pipeline
+from src.feature_engineering import TemporalFeatures, average_rides_last_4_weeks, feature_array
+from src.inference import predict_all_zones
+from src.parallel_training import lgbm_param_suggestion, train_zone_models, tune_hyperparameters
+from src.tuning import successive_halving, test_mae, tune_with_pruning
+from benchmarks.legacy import (LegacyTemporalFeatures, legacy_add_missing_slots, legacy_aggregate_filtered_data,
+                               legacy_average_rides_last_4_weeks, legacy_backtest, legacy_predict_all_zones,
+                               legacy_process_feature_target_by_PULocationID, legacy_process_filtered_dataframe,
+                               legacy_read_raw_month, legacy_train_zone_models)
+from benchmarks.measure import cold_start, measure_in_fresh_process, parse_importtime, peak_allocation, time_function
+from benchmarks.synthetic import (make_synthetic_grouped, make_synthetic_pickups, make_synthetic_time_series,
+                                  serve_directory, train_synthetic_model, write_synthetic_raw_files)
+
+logger = get_logger()
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+def benchmark_feature_target(n_locations=20, n_hours=24 * 60, n_features=24 * 28, step_size=23) -> dict:
+    """
+    Time the strided window engine against the legacy loop.
+
+    Returns:
+    - A dictionary with the timings in seconds and the speedup.
+    """
+    df = make_synthetic_time_series(n_locations, n_hours)
+
+    _, legacy_time = time_function(
+        legacy_process_feature_target_by_PULocationID, df, n_features, step_size
+    )
+    (features, targets), new_time = time_function(
+        process_feature_target_by_PULocationID, df, n_features, step_size, repeat=3
+    )
+
+    result = {
+        'rows': len(features),
+        'legacy_seconds': legacy_time,
+        'strided_seconds': new_time,
+        'speedup': legacy_time / new_time,
+    }
+    logger.info(f"process_feature_target_by_PULocationID: {result}")
+    return result
+
+def benchmark_add_missing_slots(n_locations=260, n_hours=24 * 365) -> dict:
+    """
+    Time the dense-grid `add_missing_slots` against the legacy reindex loop.
+
+    Returns:
+    - A dictionary with the timings in seconds, the output sizes in bytes and the speedup.
+    """
+    df_grouped = make_synthetic_grouped(n_locations, n_hours)
+
+    _, legacy_time = time_function(legacy_add_missing_slots, df_grouped)
+    output, new_time = time_function(add_missing_slots, df_grouped, repeat=3)
+
+    matrix, _, _ = add_missing_slots(df_grouped, as_matrix=True)
+
+    result = {
+        'rows': len(output),
+        'legacy_seconds': legacy_time,
+        'dense_seconds': new_time,
+        'speedup': legacy_time / new_time,
+        'long_bytes': int(output.memory_usage(deep=True).sum()),
+        'matrix_bytes': matrix.nbytes,
+    }
+    logger.info(f"add_missing_slots: {result}")
+    return result
+
+def benchmark_ingestion(path=YELLOW, years=(2022,), months=range(1, 13), n_rides=500_000) -> dict:
+    """
+    Time sequential against concurrent ingestion of synthetic months served from a local HTTP server,
+    and a second `ingest_months` run resuming from the manifest.
+
+    Returns:
+    - A dictionary with the timings in seconds and the speedup.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        write_synthetic_raw_files(tmp / 'served', path, years, months, n_rides)
+        server = serve_directory(tmp / 'served')
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+        try:
+            start = time.perf_counter()
+            for year in years:
+                for month in months:
+                    fetch_data_if_not_exists(path, year, month, base_url, tmp / 'sequential' / 'raw')
+                    validate_and_process_data(path, year, month, tmp / 'sequential' / 'raw', tmp / 'sequential' / 'filtered')
+            sequential_time = time.perf_counter() - start
+
+            manifest, concurrent_time = time_function(
+                ingest_months, path, years, months,
+                base_url=base_url, raw_dir=tmp / 'concurrent' / 'raw', filtered_dir=tmp / 'concurrent' / 'filtered'
+            )
+
+            _, resume_time = time_function(
+                ingest_months, path, years, months,
+                base_url=base_url, raw_dir=tmp / 'concurrent' / 'raw', filtered_dir=tmp / 'concurrent' / 'filtered'
+            )
+        finally:
+            server.shutdown()
+
+    result = {
+        'months': len(manifest),
+        'sequential_seconds': sequential_time,
+        'concurrent_seconds': concurrent_time,
+        'resume_seconds': resume_time,
+        'speedup': sequential_time / concurrent_time,
+    }
+    logger.info(f"ingest_months: {result}")
+    return result
+
+def projected_read_raw_month(file_path, path, year, month) -> pd.DataFrame:
+    """`read_raw_month` followed by the same column selection as `validate_and_process_data`."""
+    return select_important_columns(read_raw_month(file_path, path, year, month), path).dropna()
+
+def benchmark_raw_reads(paths=(YELLOW, FHV), n_rides=3_000_000, year=2022, month=1) -> dict:
+    """
+    Compare the wall time and peak RSS of the projected, month-filtered reader and of a full read
+    followed by `filter_by_date_range`, each in a fresh process.
+
+    Returns:
+    - A dictionary with one entry per path holding the measurements of both readers.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in paths:
+            file_path = write_synthetic_raw_files(tmp, path, [year], [month], n_rides)[0]
+            results[path] = {
+                'legacy': measure_in_fresh_process(legacy_read_raw_month, file_path, path, year, month),
+                'projected': measure_in_fresh_process(projected_read_raw_month, file_path, path, year, month),
+            }
+            logger.info(f"read_raw_month {path}: {results[path]}")
+    return results
+
+def benchmark_incremental_update(path=YELLOW, year=2022, n_months=6, n_rides=300_000, n_features=24 * 7, step_size=23) -> dict:
+    """
+    Time adding one month to an existing time series and feature-target table incrementally against
+    a full rebuild over all months.
+
+    Returns:
+    - A dictionary with the timings in seconds and the speedup.
+    """
+    months = list(range(1, n_months + 2))
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        write_synthetic_raw_files(tmp / 'raw', path, [year], months, n_rides)
+        for month in months:
+            validate_and_process_data(path, year, month, tmp / 'raw', tmp / 'filtered')
+
+        # Existing outputs built from every month but the last one
+        (tmp / 'filtered' / f"{path}_{year}-{str(months[-1]).zfill(2)}.parquet").rename(tmp / 'last_month.parquet')
+        df_time_series, _ = update_time_series_data(path, logger, tmp / 'filtered', tmp / 'time_series')
+        features, targets = process_feature_target_by_PULocationID(df_time_series, n_features, step_size)
+        df_features_target = features.join(pd.DataFrame(targets, columns=['target_rides_next_hour']))
+        (tmp / 'last_month.parquet').rename(tmp / 'filtered' / f"{path}_{year}-{str(months[-1]).zfill(2)}.parquet")
+
+        def incremental():
+            df_time_series, _ = update_time_series_data(path, logger, tmp / 'filtered', tmp / 'time_series')
+            return df_time_series, update_feature_target_data(df_time_series, df_features_target, n_features, step_size)
+
+        def full_rebuild():
+            df_filtered = pd.concat(
+                [read_filtered_month(path, year, month, tmp / 'filtered') for month in months], ignore_index=True
+            )
+            df_time_series = add_missing_slots(process_filtered_dataframe(df_filtered))
+            features, targets = process_feature_target_by_PULocationID(df_time_series, n_features, step_size)
+            return df_time_series, features.join(pd.DataFrame(targets, columns=['target_rides_next_hour']))
+
+        _, incremental_time = time_function(incremental)
+        _, full_time = time_function(full_rebuild)
+
+    result = {
+        'months': len(months),
+        'full_rebuild_seconds': full_time,
+        'incremental_seconds': incremental_time,
+        'speedup': full_time / incremental_time,
+    }
+    logger.info(f"incremental update: {result}")
+    return result
+
+def benchmark_feature_store(path=YELLOW, n_locations=260, n_hours=24 * 365 * 2, n_feature_locations=30,
+                            n_features=24 * 28, step_size=23) -> dict:
+    """
+    Compare reading one zone over one quarter from monolithic parquet files against the partitioned
+    feature store, for the time series and the feature-target table.
+
+    Returns:
+    - A dictionary with the timings in seconds and the speedups for each feature group.
+    """
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    feature_locations = df_time_series['PULocationID'].unique()[:n_feature_locations]
+    features, targets = process_feature_target_by_PULocationID(
+        df_time_series[df_time_series['PULocationID'].isin(feature_locations)], n_features, step_size
+    )
+    groups = {
+        'time_series': df_time_series,
+        'features_target': features.join(pd.DataFrame(targets, columns=['target_rides_next_hour'])),
+    }
+
+    zone = feature_locations[0]
+    start, end = pd.Timestamp('2022-04-01'), pd.Timestamp('2022-07-01')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for name, df in groups.items():
+            df.to_parquet(tmp / f'{name}.parquet')
+            _, write_time = time_function(write_feature_group, df, name, path, store_dir=tmp)
+
+            def read_monolithic():
+                data = pd.read_parquet(tmp / f'{name}.parquet')
+                data = data[
+                    (data['PULocationID'] == zone) & (data['pickup_hour'] >= start) & (data['pickup_hour'] < end)
+                ]
+                return data.reset_index(drop=True)
+
+            _, monolithic_time = time_function(read_monolithic, repeat=3)
+            _, store_time = time_function(
+                read_feature_group, name, path, zones=[zone], start=start, end=end, store_dir=tmp, repeat=3
+            )
+
+            results[name] = {
+                'rows': len(df),
+                'store_write_seconds': write_time,
+                'monolithic_read_seconds': monolithic_time,
+                'store_read_seconds': store_time,
+                'speedup': monolithic_time / store_time,
+            }
+            logger.info(f"feature store {name}: {results[name]}")
+    return results
+
+def benchmark_serving(n_locations=260, n_hours=24 * 60, n_requests=2000, concurrency=32, zones_per_request=4,
+                      max_batch_size=32, batch_timeout=0.005, port=8765) -> dict:
+    """
+    Start `src.serving` on a model trained on synthetic data and measure request latency and throughput.
+
+    Returns:
+    - A dictionary with p50/p99 latency in milliseconds and requests per second.
+    """
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        df_time_series = make_synthetic_time_series(n_locations, n_hours)
+        df_time_series.to_parquet(tmp / 'time_series.parquet')
+        train_synthetic_model(df_time_series, tmp / 'model.joblib', n_estimators=100)
+        location_ids = df_time_series['PULocationID'].unique()
+
+        server = subprocess.Popen([
+            sys.executable, '-m', 'src.serving',
+            '--model', str(tmp / 'model.joblib'), '--time-series', str(tmp / 'time_series.parquet'),
+            '--port', str(port), '--max-batch-size', str(max_batch_size), '--batch-timeout', str(batch_timeout),
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f'http://127.0.0.1:{port}'
+        try:
+            for _ in range(600):
+                try:
+                    if requests.get(f'{url}/health', timeout=1).status_code == 200:
+                        break
+                except requests.exceptions.ConnectionError:
+                    pass
+                time.sleep(0.1)
+            else:
+                raise RuntimeError('Serving process did not become healthy')
+
+            payloads = [
+                {'zones': rng.choice(location_ids, size=zones_per_request, replace=False).tolist()}
+                for _ in range(n_requests)
+            ]
+
+            def send(payload):
+                start = time.perf_counter()
+                response = requests.post(f'{url}/predict', json=payload, timeout=30)
+                response.raise_for_status()
+                return time.perf_counter() - start
+
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(send, payloads[:concurrency]))  # warm up
+                start = time.perf_counter()
+                latencies = np.array(list(pool.map(send, payloads)))
+                total_time = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+
+    result = {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'zones_per_request': zones_per_request,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'requests_per_second': n_requests / total_time,
+    }
+    logger.info(f"serving: {result}")
+    return result
+
+def benchmark_predict_all_zones(n_locations=260, n_hours=24 * 60, n_features=24 * 28) -> dict:
+    """
+    Time `predict_all_zones` against per-zone scoring, from the long time series and from the dense matrix.
+
+    Returns:
+    - A dictionary with the timings in seconds and the speedup.
+    """
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    with tempfile.TemporaryDirectory() as tmp:
+        model = train_synthetic_model(df_time_series, Path(tmp) / 'model.joblib', n_features, n_estimators=100)
+    at_hour = df_time_series['pickup_hour'].max() + pd.Timedelta(hours=1)
+    dense = time_series_to_dense_matrix(df_time_series)
+
+    _, legacy_time = time_function(legacy_predict_all_zones, model, df_time_series, at_hour, n_features)
+    _, long_time = time_function(predict_all_zones, model, df_time_series, at_hour, n_features, repeat=5)
+    _, matrix_time = time_function(predict_all_zones, model, dense, at_hour, n_features, repeat=5)
+
+    result = {
+        'zones': n_locations,
+        'per_zone_seconds': legacy_time,
+        'from_long_seconds': long_time,
+        'from_matrix_seconds': matrix_time,
+        'speedup': legacy_time / matrix_time,
+    }
+    logger.info(f"predict_all_zones: {result}")
+    return result
+
+def benchmark_compact_schema(path=YELLOW, year=2022, month=1, n_rides=3_000_000, n_features=24 * 28, step_size=23) -> pd.DataFrame:
+    """
+    Report the in-memory and parquet size of every pipeline stage in the previous schema (int64 zones,
+    float64/int64 counts, string type) against the compact schema of `compact_schema`.
+
+    Returns:
+    - A DataFrame with one row per stage and the sizes in MB with their reduction ratios.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        write_synthetic_raw_files(tmp / 'raw', path, [year], [month], n_rides)
+        validate_and_process_data(path, year, month, tmp / 'raw', tmp / 'filtered')
+
+        filtered = read_filtered_month(path, year, month, tmp / 'filtered')
+        grouped = process_filtered_dataframe(filtered.copy())
+        time_series = add_missing_slots(grouped)
+        features, targets = process_feature_target_by_PULocationID(time_series, n_features, step_size)
+        features_target = features.join(pd.DataFrame(targets, columns=['target_rides_next_hour']))
+
+        # The same tables with the dtypes the pipeline used to produce
+        legacy = {
+            'filtered': filtered.astype({'PULocationID': np.int64, 'type': object}),
+            'grouped': grouped.astype({'PULocationID': np.int64, 'rides': np.int64}),
+            'time_series': time_series.astype({'PULocationID': np.int64, 'rides': np.float64}),
+            'features_target': features_target.astype(
+                {column: np.float64 for column in features_target.columns if column.startswith(('rides_', 'target_'))}
+                | {'PULocationID': np.int64}
+            ),
+        }
+        compact = {
+            'filtered': filtered,
+            'grouped': grouped,
+            'time_series': time_series,
+            'features_target': features_target,
+        }
+
+        rows = []
+        for stage in compact:
+            sizes = {}
+            for schema, df in (('legacy', legacy[stage]), ('compact', compact[stage])):
+                file_path = tmp / f'{stage}_{schema}.parquet'
+                df.to_parquet(file_path)
+                sizes[f'{schema}_memory_mb'] = df.memory_usage(deep=True).sum() / 2**20
+                sizes[f'{schema}_file_mb'] = file_path.stat().st_size / 2**20
+            rows.append({
+                'stage': stage,
+                **sizes,
+                'memory_reduction': sizes['legacy_memory_mb'] / sizes['compact_memory_mb'],
+                'file_reduction': sizes['legacy_file_mb'] / sizes['compact_file_mb'],
+            })
+
+    report = pd.DataFrame(rows)
+    logger.info(f"compact schema:\n{report.to_string(index=False, float_format='%.2f')}")
+    return report
+
+def benchmark_parallel_training(n_locations=40, n_hours=24 * 90, n_features=24 * 28, step_size=5, n_workers=None) -> dict:
+    """
+    Time `train_zone_models` against a sequential per-zone loop, along with the bytes sent to each worker task.
+
+    Returns:
+    - A dictionary with the timings in seconds, the speedup and the task payload sizes.
+    """
+    import pickle
+    from lightgbm import LGBMRegressor
+
+    n_workers = n_workers or multiprocessing.cpu_count()
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    features, targets = process_feature_target_by_PULocationID(df_time_series, n_features, step_size)
+    df = features.assign(target_rides_next_hour=targets)
+    cutoff_date = df['pickup_hour'].quantile(0.8)
+    hyperparameters = dict(n_estimators=50, verbosity=-1, n_jobs=1)
+
+    _, legacy_time = time_function(legacy_train_zone_models, df, LGBMRegressor, cutoff_date, **hyperparameters)
+    with tempfile.TemporaryDirectory() as tmp:
+        _, parallel_time = time_function(
+            train_zone_models, df, LGBMRegressor, cutoff_date, hyperparameters=hyperparameters,
+            n_workers=n_workers, registry_dir=tmp
+        )
+
+    zone = df['PULocationID'].iloc[0]
+    result = {
+        'zones': n_locations,
+        'workers': n_workers,
+        'sequential_seconds': legacy_time,
+        'parallel_seconds': parallel_time,
+        'speedup': legacy_time / parallel_time,
+        'dataframe_task_bytes': len(pickle.dumps(df[df['PULocationID'] == zone])),
+        'memmap_task_bytes': len(pickle.dumps((f'zone_{zone}', [int(zone)], LGBMRegressor, hyperparameters, cutoff_date, tmp))),
+    }
+    logger.info(f"train_zone_models: {result}")
+    return result
+
+def benchmark_streaming_aggregation(path=YELLOW, year=2022, months=range(1, 7), n_rides=2_000_000) -> dict:
+    """
+    Compare the wall time and peak RSS of `aggregate_filtered_data` and of concatenating every filtered
+    month before grouping, each in a fresh process.
+
+    Returns:
+    - A dictionary with the measurements of both paths.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        write_synthetic_raw_files(tmp / 'raw', path, [year], months, n_rides)
+        for month in months:
+            validate_and_process_data(path, year, month, tmp / 'raw', tmp / 'filtered')
+
+        result = {
+            'months': len(months),
+            'rides': len(months) * n_rides,
+            'concatenate': measure_in_fresh_process(legacy_aggregate_filtered_data, path, tmp / 'filtered'),
+            'streaming': measure_in_fresh_process(aggregate_filtered_data, path, tmp / 'filtered'),
+        }
+    logger.info(f"aggregate_filtered_data: {result}")
+    return result
+
+def benchmark_hourly_counting(month_counts=(1, 12, 36), rides_per_month=500_000) -> pd.DataFrame:
+    """
+    Time the bincount kernel of `process_filtered_dataframe` against the former floor + groupby on one,
+    twelve and thirty-six months of synthetic rides.
+
+    Returns:
+    - A DataFrame with one row per month count and the timings in seconds with the speedup.
+    """
+    rows = []
+    for n_months in month_counts:
+        df = make_synthetic_pickups(n_months, rides_per_month)
+        _, legacy_time = time_function(legacy_process_filtered_dataframe, df.copy())
+        _, kernel_time = time_function(process_filtered_dataframe, df, repeat=3)
+        rows.append({
+            'months': n_months,
+            'rides': len(df),
+            'groupby_seconds': legacy_time,
+            'bincount_seconds': kernel_time,
+            'speedup': legacy_time / kernel_time,
+        })
+        del df
+
+    report = pd.DataFrame(rows)
+    logger.info(f"process_filtered_dataframe:\n{report.to_string(index=False, float_format='%.3f')}")
+    return report
+
+def run_cached_stages(cache, path, filtered_dir, n_features, step_size):
+    """The time series and feature-target stages of `run_pipeline`, reading filtered files from `filtered_dir`."""
+    import src.transform
+    from src.pipeline import build_feature_target
+
+    filtered_files = [
+        Path(filtered_dir) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
+        for year, month in list_filtered_months(path, filtered_dir)
+    ]
+    df_time_series, time_series_key = cache.get_or_compute(
+        'time_series', lambda: add_missing_slots(aggregate_filtered_data(path, filtered_dir)),
+        inputs=filtered_files, params={'path': path}, code=code_version(src.transform)
+    )
+    return cache.get_or_compute(
+        'features_target', build_feature_target, df_time_series, n_features, step_size,
+        params={'time_series': time_series_key, 'n_features': n_features, 'step_size': step_size},
+        code=code_version(src.transform)
+    )[0]
+
+def benchmark_stage_cache(path=YELLOW, year=2022, months=range(1, 7), n_rides=1_000_000, n_features=24 * 28, step_size=23) -> dict:
+    """
+    Time the transform stages through a `StageCache` cold and warm.
+
+    Returns:
+    - A dictionary with the cold and warm timings in seconds and the speedup.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        write_synthetic_raw_files(tmp / 'raw', path, [year], months, n_rides)
+        for month in months:
+            validate_and_process_data(path, year, month, tmp / 'raw', tmp / 'filtered')
+
+        cache = StageCache(tmp / 'cache')
+        _, cold_time = time_function(run_cached_stages, cache, path, tmp / 'filtered', n_features, step_size)
+        _, warm_time = time_function(run_cached_stages, StageCache(tmp / 'cache'), path, tmp / 'filtered', n_features, step_size)
+
+    result = {
+        'cold_seconds': cold_time,
+        'warm_seconds': warm_time,
+        'speedup': cold_time / warm_time,
+    }
+    logger.info(f"stage cache: {result}")
+    return result
+
+def benchmark_training_matrix(n_locations=100, n_hours=24 * 365, n_features=24 * 28, step_size=23) -> dict:
+    """
+    Compare building per-zone training sets from the memory-mapped training matrix and with
+    `create_training_sets` on the feature-target parquet, each in a fresh process.
+
+    Returns:
+    - A dictionary with the measurements of both loaders and the file sizes in MB.
+    """
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    features, targets = process_feature_target_by_PULocationID(df_time_series, n_features, step_size)
+    df = features.assign(target_rides_next_hour=targets)
+    cutoff_date = df['pickup_hour'].quantile(0.8)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        df.to_parquet(tmp / 'features_target.parquet')
+        export_training_matrix(df, tmp / 'training_matrix')
+        del df, features, targets
+
+        result = {
+            'parquet_mb': (tmp / 'features_target.parquet').stat().st_size / 2**20,
+            'matrix_mb': sum(f.stat().st_size for f in (tmp / 'training_matrix').iterdir()) / 2**20,
+            'parquet': measure_in_fresh_process(
+                create_training_sets, tmp / 'features_target.parquet', cutoff_date, 'target_rides_next_hour'
+            ),
+            'matrix': measure_in_fresh_process(create_training_sets_from_matrix, tmp / 'training_matrix', cutoff_date),
+        }
+    logger.info(f"training sets: {result}")
+    return result
+
+def benchmark_window_dataset(n_locations=260, n_hours=24 * 365, n_features=24 * 28, step_size=23, batch_size=4096) -> dict:
+    """
+    Compare the memory `WindowDataset` and the materialized feature-target table hold, and the time
+    to visit every row.
+
+    Returns:
+    - A dictionary with the sizes in MB and the timings in seconds.
+    """
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    dataset = WindowDataset(df_time_series, n_features, step_size)
+    (features, _), materialize_time = time_function(
+        process_feature_target_by_PULocationID, df_time_series, n_features, step_size
+    )
+
+    def visit_all():
+        return sum(float(batch.sum()) for batch, _ in dataset.batches(batch_size))
+
+    _, lazy_time = time_function(visit_all)
+    result = {
+        'windows': len(dataset),
+        'series_mb': dataset.nbytes / 2**20,
+        'materialized_mb': features.memory_usage(deep=True).sum() / 2**20,
+        'ratio': features.memory_usage(deep=True).sum() / dataset.nbytes,
+        'materialize_seconds': materialize_time,
+        'lazy_pass_seconds': lazy_time,
+    }
+    logger.info(f"WindowDataset: {result}")
+    return result
+
+def benchmark_backtest(n_locations=60, n_hours=24 * 120, n_features=24 * 28, step_size=5, n_folds=4,
+                       horizon='7D', n_workers=None) -> dict:
+    """
+    Time `backtest` against refitting by hand at every cutoff.
+
+    Returns:
+    - A dictionary with the timings in seconds and the speedup.
+    """
+    from lightgbm import LGBMRegressor
+
+    n_workers = n_workers or multiprocessing.cpu_count()
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    features, targets = process_feature_target_by_PULocationID(df_time_series, n_features, step_size)
+    # Same row order as the time-ordered training matrix, so both fits see identical data
+    df = features.assign(target_rides_next_hour=targets).sort_values(['pickup_hour', 'PULocationID'], ignore_index=True)
+    cutoffs = walk_forward_cutoffs(df['pickup_hour'], n_folds, horizon)
+    hyperparameters = dict(n_estimators=50, verbosity=-1, n_jobs=1)
+
+    _, legacy_time = time_function(legacy_backtest, df, LGBMRegressor, cutoffs, horizon, **hyperparameters)
+    _, backtest_time = time_function(
+        backtest, df, LGBMRegressor, cutoffs, horizon=horizon, hyperparameters=hyperparameters, n_workers=n_workers
+    )
+
+    summary = {
+        'folds': n_folds,
+        'workers': n_workers,
+        'legacy_seconds': legacy_time,
+        'backtest_seconds': backtest_time,
+        'speedup': legacy_time / backtest_time,
+    }
+    logger.info(f"backtest: {summary}")
+    return summary
+
+def benchmark_feature_engineering(n_locations=100, n_hours=24 * 365, n_features=24 * 28, step_size=23) -> dict:
+    """
+    Compare the time and peak allocations of the copy-free feature engineering, its array mode and the
+    previous transformers.
+
+    Returns:
+    - A dictionary with the timings in seconds and peak allocations in MB of each variant.
+    """
+    from lightgbm import LGBMRegressor
+
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    features, _ = process_feature_target_by_PULocationID(df_time_series, n_features, step_size)
+    X = features.drop(columns=['PULocationID'])
+    lag_columns = [column for column in X.columns if column != 'pickup_hour']
+    X_array = feature_array(X[lag_columns].to_numpy(), X['pickup_hour'])
+
+    def legacy_features():
+        return LegacyTemporalFeatures().transform(legacy_average_rides_last_4_weeks(X))
+
+    def dataframe_features():
+        return TemporalFeatures().transform(average_rides_last_4_weeks(X))
+
+    def array_features():
+        return get_array_pipeline(LGBMRegressor, lag_columns)[0].transform(X_array)
+
+    result = {'rows': len(X), 'input_mb': X.memory_usage(deep=True).sum() / 2**20}
+    for name, func in (('legacy', legacy_features), ('dataframe', dataframe_features), ('array', array_features)):
+        _, result[f'{name}_seconds'] = time_function(func, repeat=3)
+        _, result[f'{name}_peak_mb'] = peak_allocation(func)
+    logger.info(f"feature engineering: {result}")
+    return result
+
+def benchmark_import_time(commands=('help', 'fetch', 'transform', 'train', 'predict'), repeat=5, top=5) -> pd.DataFrame:
+    """
+    Cold-start latency of the CLI commands: the best wall time of a fresh interpreter over `repeat`
+    runs and the `-X importtime` breakdown of one of them, with the slowest top-level imports.
+
+    'help' only imports the CLI itself, i.e. the cost of `python -m src.cli --help`.
+
+    Returns:
+    - A DataFrame with one row per command.
+    """
+    rows = []
+    for command in commands:
+        timings = [cold_start(command) for _ in range(repeat)]
+        imports = parse_importtime(cold_start(command, importtime=True))
+        top_level = imports[imports['depth'] == 0].nlargest(top, 'cumulative_us')
+        rows.append({
+            'command': command,
+            'wall_seconds': min(timings),
+            'import_seconds': imports.loc[imports['depth'] == 0, 'cumulative_us'].sum() / 1e6,
+            'modules': len(imports),
+            'slowest_imports': ', '.join(f"{row.module} {row.cumulative_us / 1e6:.2f}s" for row in top_level.itertuples()),
+        })
+    result = pd.DataFrame(rows)
+    logger.info(f"Cold start:\n{result.to_string(index=False, float_format='%.3f')}")
+    return result
+
+def xgb_param_suggestion(trial) -> dict:
+    """A small XGBoost search space for `benchmark_dataset_cache`."""
+    return {
+        "max_depth": trial.suggest_int("max_depth", 2, 8),
+        "subsample": trial.suggest_float("subsample", 0.5, 1.0),
+        "min_child_weight": trial.suggest_float("min_child_weight", 1.0, 20.0),
+    }
+
+def benchmark_dataset_cache(n_locations=20, n_hours=24 * 180, n_features=24 * 28, step_size=5, n_trials=8,
+                            n_splits=3, n_workers=None) -> dict:
+    """
+    Time tuning on cached fold datasets against fitting `get_pipeline` on each fold, for LightGBM and XGBoost.
+
+    Trials are sampled with a fixed seed, so both studies evaluate the same hyperparameters.
+
+    Trials with a single boosting round are timed as well: they measure the per-trial overhead around
+    boosting (feature engineering, binning, data conversion) that the cache removes.
+
+    Returns:
+    - A dictionary with the total and per-trial seconds of each variant, of a second cached study
+      reusing the datasets on disk, and the one-round overhead per trial.
+    """
+    import optuna
+    from lightgbm import LGBMRegressor
+    from xgboost import XGBRegressor
+
+    n_workers = n_workers or multiprocessing.cpu_count()
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    features, targets = process_feature_target_by_PULocationID(df_time_series, n_features, step_size)
+    df = features.assign(target_rides_next_hour=targets)
+    cutoff_date = df['pickup_hour'].quantile(0.8)
+
+    result = {'rows': len(df), 'trials': n_trials}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, model, suggestion in (
+                ('lgbm', LGBMRegressor, lambda trial: {**lgbm_param_suggestion(trial), 'feature_pre_filter': False}),
+                ('xgb', XGBRegressor, xgb_param_suggestion)):
+            for variant, cache_dir in (('pipeline', None), ('cached', Path(tmp)), ('cached_reuse', Path(tmp))):
+                study = optuna.create_study(direction='minimize', sampler=optuna.samplers.TPESampler(seed=0))
+                _, seconds = time_function(
+                    tune_hyperparameters, df, model, suggestion, cutoff_date, n_trials=n_trials,
+                    n_splits=n_splits, n_workers=n_workers, study=study, dataset_cache_dir=cache_dir,
+                )
+                result[f'{name}_{variant}_seconds'] = seconds
+                result[f'{name}_{variant}_seconds_per_trial'] = seconds / n_trials
+            result[f'{name}_speedup'] = result[f'{name}_pipeline_seconds'] / result[f'{name}_cached_seconds']
+
+            def one_round(trial, suggestion=suggestion):
+                return {**suggestion(trial), 'n_estimators': 1}
+            for variant, cache_dir in (('pipeline', None), ('cached', Path(tmp))):
+                _, seconds = time_function(
+                    tune_hyperparameters, df, model, one_round, cutoff_date, n_trials=n_trials,
+                    n_splits=n_splits, n_workers=n_workers, dataset_cache_dir=cache_dir,
+                )
+                result[f'{name}_{variant}_overhead_per_trial'] = seconds / n_trials
+    logger.info(f"dataset cache: {result}")
+    return result
+
+def benchmark_tuning(n_locations=20, n_hours=24 * 365, n_features=24 * 28, step_size=23, n_trials=12,
+                     n_splits=3, test_months=2) -> pd.DataFrame:
+    """
+    Wall-clock time against final test MAE of LightGBM tuning: the exhaustive `tune_hyperparameters`
+    (every trial on all the training rows for a fixed 100 rounds), `tune_with_pruning` and
+    `successive_halving` with `n_trials` trials each.
+
+    The final MAE is that of the best hyperparameters refitted on the full training set and scored on
+    the last `test_months`.
+
+    Returns:
+    - One row per method with its tuning and total seconds, CV and test MAE and speedup.
+    """
+    import optuna
+    from lightgbm import LGBMRegressor
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    features, targets = process_feature_target_by_PULocationID(df_time_series, n_features, step_size)
+    df = features.assign(target_rides_next_hour=targets)
+    cutoff_date = df['pickup_hour'].max() - pd.DateOffset(months=test_months)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        study = optuna.create_study(direction='minimize', sampler=optuna.samplers.TPESampler(seed=0))
+        tune_hyperparameters(df, LGBMRegressor, lgbm_param_suggestion, cutoff_date, n_trials=n_trials, n_splits=n_splits,
+                             n_workers=1, threads_per_worker=None, study=study, dataset_cache_dir=Path(tmp) / 'datasets')
+        tuning_seconds = time.perf_counter() - start
+        hyperparameters = lgbm_param_suggestion(optuna.trial.FixedTrial(study.best_trial.params))
+        matrix = TrainingMatrix(export_training_matrix(df, Path(tmp) / 'matrix', order='time'))
+        mae = test_mae(matrix, LGBMRegressor, hyperparameters, cutoff_date)
+    rows.append({'method': 'exhaustive', 'tuning_seconds': tuning_seconds, 'total_seconds': time.perf_counter() - start,
+                 'cv_mae': None, 'test_mae': mae, 'n_estimators': 100})
+
+    for tune, kwargs in ((tune_with_pruning, {}), (successive_halving, {'eta': 3})):
+        result = tune(df, LGBMRegressor, lgbm_param_suggestion, cutoff_date, n_trials=n_trials, n_splits=n_splits, **kwargs)
+        rows.append({key: result[key] for key in ('method', 'tuning_seconds', 'total_seconds', 'cv_mae', 'test_mae')}
+                    | {'n_estimators': result['hyperparameters']['n_estimators']})
+
+    report = pd.DataFrame(rows)
+    report['speedup'] = report['total_seconds'].iloc[0] / report['total_seconds']
+    logger.info(f"tuning:\n{report.to_string(index=False)}")
+    return report
+
+def benchmark_lag_spec(n_locations=40, n_hours=24 * 365, n_features=24 * 28, step_size=5, test_months=2,
+                       lag_spec=DEFAULT_LAG_SPEC) -> pd.DataFrame:
+    """
+    Compare the dense feature-target table (every lag up to `n_features`) with a sparse `lag_spec` one:
+    build time, in-memory and parquet size, and the fit time and test MAE of a LightGBM pipeline.
+
+    Returns:
+    - One row per table with its columns, sizes, timings and test MAE.
+    """
+    from lightgbm import LGBMRegressor
+
+    df_time_series = make_synthetic_time_series(n_locations, n_hours)
+    (dense, dense_target), dense_seconds = time_function(
+        process_feature_target_by_PULocationID, df_time_series, n_features, step_size)
+    (sparse, sparse_target), sparse_seconds = time_function(
+        process_feature_target_by_PULocationID, df_time_series, n_features, step_size, lag_spec=lag_spec)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, features, targets, seconds in (('dense', dense, dense_target, dense_seconds),
+                                                 ('sparse', sparse, sparse_target, sparse_seconds)):
+            df = features.assign(target_rides_next_hour=targets)
+            file_path = Path(tmp) / f'{name}.parquet'
+            df.to_parquet(file_path)
+            cutoff_date = df['pickup_hour'].max() - pd.DateOffset(months=test_months)
+            matrix = TrainingMatrix(export_training_matrix(df, Path(tmp) / f'{name}_matrix'))
+            X_train, y_train, X_test, y_test = matrix.train_test_split(cutoff_date)
+            pipeline, fit_seconds = time_function(
+                lambda: get_pipeline(LGBMRegressor, verbosity=-1, n_jobs=1).fit(X_train, y_train))
+            rows.append({
+                'table': name,
+                'columns': features.shape[1],
+                'memory_mb': df.memory_usage(deep=True).sum() / 2**20,
+                'parquet_mb': file_path.stat().st_size / 2**20,
+                'matrix_mb': (Path(tmp) / f'{name}_matrix' / 'features.npy').stat().st_size / 2**20,
+                'build_seconds': seconds,
+                'fit_seconds': fit_seconds,
+                'test_mae': float(np.mean(np.abs(pipeline.predict(X_test) - y_test.to_numpy()))),
+            })
+
+    report = pd.DataFrame(rows)
+    logger.info(f"lag spec ({len(dense)} rows):\n{report.to_string(index=False)}")
+    return report
+
+# Per-step task count, wall time and artifact bytes of the latest run of a flow, through the Metaflow client
+FLOW_STATS_CODE = """
+import json
+from metaflow import Flow, namespace
+namespace(None)
+run = Flow('{flow}').latest_run
+stats = []
+for step in run:
+    tasks = list(step)
+    stats.append({{
+        'step': step.id,
+        'tasks': len(tasks),
+        'seconds': (max(task.finished_at for task in tasks) - min(task.created_at for task in tasks)).total_seconds(),
+        'artifact_bytes': sum(artifact.size for task in tasks for artifact in task),
+    }})
+print(json.dumps(stats))
+"""
+
+def run_flow(flow_file, directory, *args, flow: str = 'DataPipelineFlow') -> tuple:
+    """
+    Run a copy of `src` with `flow_file` as `src/metaflow_pipeline.py` in `directory`, so the flow reads and
+    writes `directory/data` and its local datastore is `directory/.metaflow`.
+
+    Returns:
+    - (wall seconds, per-step DataFrame of `FLOW_STATS_CODE`, bytes of the datastore on disk).
+    """
+    directory = Path(directory)
+    shutil.copytree(REPO_DIR / 'src', directory / 'src', dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns('__pycache__'))
+    shutil.copy(flow_file, directory / 'src' / 'metaflow_pipeline.py')
+    env = {**os.environ, 'PYTHONPATH': str(directory), 'USERNAME': os.environ.get('USERNAME', 'benchmark')}
+
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, 'src/metaflow_pipeline.py', 'run', *args], capture_output=True, text=True,
+                             cwd=directory, env=env)
+    if process.returncode != 0:
+        raise RuntimeError(f"{flow_file} failed:\n{process.stdout[-3000:]}")
+    seconds = time.perf_counter() - start
+    stats = subprocess.run([sys.executable, '-c', FLOW_STATS_CODE.format(flow=flow)], check=True, capture_output=True,
+                           text=True, cwd=directory, env=env)
+    datastore_bytes = sum(file.stat().st_size for file in (directory / '.metaflow').rglob('*') if file.is_file())
+    return seconds, pd.DataFrame(json.loads(stats.stdout)), datastore_bytes
+
+def benchmark_metaflow(flow_files=None, paths=(YELLOW, GREEN), years=(2022, 2023, 2024), n_rides=100_000) -> pd.DataFrame:
+    """
+    Run `DataPipelineFlow` variants end to end on synthetic raw files and compare their step durations,
+    artifact bytes and datastore size.
+
+    Raw files are written to each variant's `data/raw` beforehand, so downloads are skipped and every
+    variant filters, transforms and joins the same months.
+
+    Args:
+    - flow_files: Mapping of variant name to flow file, e.g. the current flow and the version of an
+      earlier commit from `git show`. The current `metaflow_pipeline.py` if None.
+    - paths: Taxi types of the run.
+    - years: Years of raw files to write; the flow ingests 2022-2024.
+    - n_rides: Rides per synthetic month.
+
+    Returns:
+    - One row per variant and step with its tasks, seconds and artifact bytes, plus a 'total' row per
+      variant with the wall time and the datastore bytes.
+    """
+    flow_files = flow_files or {'current': REPO_DIR / 'src' / 'metaflow_pipeline.py'}
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant, flow_file in flow_files.items():
+            directory = Path(tmp) / variant
+            for path in paths:
+                write_synthetic_raw_files(directory / 'data' / 'raw', path, years, range(1, 13), n_rides)
+            seconds, steps, datastore_bytes = run_flow(flow_file, directory, '--taxi_types', ','.join(paths))
+            rows.append(steps.assign(variant=variant))
+            rows.append(pd.DataFrame([{'variant': variant, 'step': 'total', 'tasks': steps['tasks'].sum(),
+                                       'seconds': seconds, 'artifact_bytes': datastore_bytes}]))
+
+    report = pd.concat(rows, ignore_index=True)[['variant', 'step', 'tasks', 'seconds', 'artifact_bytes']]
+    report['artifact_mb'] = report['artifact_bytes'] / 2**20
+    logger.info(f"metaflow:\n{report.to_string(index=False)}")
+    return report
+
+BENCHMARKS = {
+    name[len('benchmark_'):]: func for name, func in list(globals().items())
+    if name.startswith('benchmark_') and callable(func)
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run benchmarks of the pipeline hot paths on synthetic data.')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK', help='Benchmarks to run, see --list.')
+    parser.add_argument('--list', action='store_true', help='Print the available benchmarks and exit.')
+    args = parser.parse_args()
+
+    unknown = sorted(set(args.benchmarks) - set(BENCHMARKS))
+    if unknown:
+        parser.error(f"unknown benchmarks {', '.join(unknown)}, see --list")
+    if args.list or not args.benchmarks:
+        print('\n'.join(sorted(BENCHMARKS)))
+    for name in args.benchmarks:
+        BENCHMARKS[name]()
@@ -0,0 +1,207 @@
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.logger import get_logger
+from src.paths import FHV, GREEN, REPORTS_DIR, YELLOW
+from benchmarks.measure import cold_start
+from benchmarks.synthetic import make_synthetic_grouped, make_synthetic_time_series, write_synthetic_raw_files
+from src.extract import read_filtered_month, validate_and_process_data
+from src.feature_engineering import TemporalFeatures, average_rides_last_4_weeks
+from src.transform import (add_missing_slots, create_feature_matrix_and_target, get_cutoff_indices,
+                           process_feature_target_by_PULocationID, process_filtered_dataframe)
+
+logger = get_logger()
+
+BENCHMARKS_DIR = REPORTS_DIR / 'benchmarks'
+BASELINE_PATH = BENCHMARKS_DIR / 'baseline.json'
+
+# Sizes of the synthetic inputs at each scale
+SCALES = {
+    'small': {'n_rides': 200_000, 'n_locations': 20, 'n_hours': 24 * 30},
+    'medium': {'n_rides': 1_000_000, 'n_locations': 100, 'n_hours': 24 * 90},
+    'large': {'n_rides': 5_000_000, 'n_locations': 265, 'n_hours': 24 * 365},
+}
+N_FEATURES = 24 * 28
+STEP_SIZE = 23
+# CLI commands whose cold start is tracked, under the 'startup' scale
+STARTUP_COMMANDS = ('help', 'fetch', 'transform', 'train', 'predict')
+
+def _filtered_month(path, n_rides, directory):
+    """A filtered month of `path` produced offline by the real filtering stage from a synthetic raw file."""
+    write_synthetic_raw_files(directory / 'raw', path, [2022], [1], n_rides)
+    validate_and_process_data(path, 2022, 1, directory / 'raw', directory / 'filtered')
+    return read_filtered_month(path, 2022, 1, directory / 'filtered')
+
+def _single_location_series(scale):
+    df = make_synthetic_time_series(1, scale['n_hours'])
+    return df, get_cutoff_indices(df, N_FEATURES, 1)
+
+def _features_table(scale):
+    df = make_synthetic_time_series(scale['n_locations'], scale['n_hours'])
+    features, _ = process_feature_target_by_PULocationID(df, N_FEATURES, STEP_SIZE)
+    return features
+
+def _engineer_features(features):
+    return TemporalFeatures().transform(average_rides_last_4_weeks(features))
+
+def build_cases(scale_name: str, directory) -> list:
+    """
+    Build the benchmark cases of one scale as (name, function, args) tuples.
+
+    Inputs are generated before timing, from fixed seeds, so every run measures the same data.
+    """
+    scale = SCALES[scale_name]
+    directory = Path(directory) / scale_name
+    cases = []
+
+    for path in (YELLOW, GREEN, FHV):
+        df_filtered = _filtered_month(path, scale['n_rides'], directory / path)
+        cases.append((f'process_filtered_dataframe[{path.split("_")[0]}]', process_filtered_dataframe, (df_filtered,)))
+
+    df_grouped = make_synthetic_grouped(scale['n_locations'], scale['n_hours'])
+    cases.append(('add_missing_slots', add_missing_slots, (df_grouped,)))
+
+    df_location, cutoff_indices = _single_location_series(scale)
+    cases.append(('get_cutoff_indices', get_cutoff_indices, (df_location, N_FEATURES, 1)))
+    cases.append(('create_feature_matrix_and_target', create_feature_matrix_and_target, (df_location, cutoff_indices)))
+
+    df_time_series = make_synthetic_time_series(scale['n_locations'], scale['n_hours'])
+    cases.append(('process_feature_target_by_PULocationID', process_feature_target_by_PULocationID,
+                  (df_time_series, N_FEATURES, STEP_SIZE)))
+
+    cases.append(('feature_engineering', _engineer_features, (_features_table(scale),)))
+    return cases
+
+def startup_cases() -> list:
+    """Cold start of each CLI command in a fresh interpreter, independent of the data scale."""
+    return [(f'cold_start[{command}]', cold_start, (command,)) for command in STARTUP_COMMANDS]
+
+def _rows(result) -> int:
+    first = result[0] if isinstance(result, tuple) else result
+    return len(first) if hasattr(first, '__len__') else 0
+
+def time_case(func, args, repeat: int) -> dict:
+    """Time `func(*args)` `repeat` times with the garbage collector paused and summarise the runs."""
+    timings = []
+    for _ in range(repeat):
+        # Inputs that the function mutates are copied outside of the timed region
+        call_args = tuple(arg.copy() if isinstance(arg, pd.DataFrame) else arg for arg in args)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = func(*call_args)
+            timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return {
+        'rows': _rows(result),
+        'min_seconds': min(timings),
+        'median_seconds': float(np.median(timings)),
+        'repeat': repeat,
+    }
+
+def environment() -> dict:
+    """Versions and machine details stored with every result file."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'commit': commit,
+    }
+
+def run_suite(scales=('small', 'medium'), repeat: int = 5, startup: bool = True) -> dict:
+    """
+    Run every benchmark case at each scale, and with `startup` the cold start of the CLI commands.
+
+    Returns:
+    - A dictionary with the environment, the parameters and one result per (case, scale).
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale_name in scales:
+            for name, func, args in build_cases(scale_name, tmp):
+                result = {'case': name, 'scale': scale_name, **time_case(func, args, repeat)}
+                logger.info(f"{name} [{scale_name}]: {result['min_seconds']:.4f}s over {result['rows']} rows")
+                results.append(result)
+    if startup:
+        for name, func, args in startup_cases():
+            result = {'case': name, 'scale': 'startup', **time_case(func, args, repeat)}
+            logger.info(f"{name}: {result['min_seconds']:.4f}s")
+            results.append(result)
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'parameters': {'n_features': N_FEATURES, 'step_size': STEP_SIZE, 'scales': {s: SCALES[s] for s in scales}},
+        'results': results,
+    }
+
+def save_results(results: dict, file_path=None) -> Path:
+    """Save suite results as JSON, by default to a timestamped file under `BENCHMARKS_DIR`."""
+    file_path = Path(file_path or BENCHMARKS_DIR / f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Saved benchmark results to {file_path}")
+    return file_path
+
+def load_results(file_path) -> dict:
+    with open(file_path) as f:
+        return json.load(f)
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float = 0.2) -> pd.DataFrame:
+    """
+    Compare the best time of every (case, scale) with a baseline run.
+
+    A case regresses when it is more than `threshold` (0.2 = 20%) slower than in the baseline.
+    Cases missing from the baseline are reported with no ratio.
+
+    Returns:
+    - A DataFrame with the baseline and current times, their ratio and a 'regression' flag.
+    """
+    current = pd.DataFrame(results['results'])[['case', 'scale', 'rows', 'min_seconds']]
+    previous = pd.DataFrame(baseline['results'])[['case', 'scale', 'min_seconds']]
+    report = current.merge(previous, on=['case', 'scale'], how='left', suffixes=('', '_baseline'))
+    report['ratio'] = report['min_seconds'] / report['min_seconds_baseline']
+    report['regression'] = report['ratio'] > 1 + threshold
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the transform hot paths on synthetic data.')
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-startup', action='store_true', help='Skip the cold start of the CLI commands.')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH, help='Baseline results to compare against.')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown before failing, 0.2 = 20%%.')
+    args = parser.parse_args()
+
+    results = run_suite(args.scales, args.repeat, startup=not args.no_startup)
+    save_results(results)
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+    elif args.baseline.exists():
+        report = compare_to_baseline(results, load_results(args.baseline), args.threshold)
+        logger.info(f"Comparison with {args.baseline}:\n{report.to_string(index=False, float_format='%.4f')}")
+        if report['regression'].any():
+            logger.error(f"{int(report['regression'].sum())} cases regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+    else:
+        logger.warning(f"No baseline at {args.baseline}. Run with --save-baseline to create one.")
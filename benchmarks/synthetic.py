@@ -0,0 +1,149 @@
+"""Deterministic synthetic inputs shared by the benchmarks and the tests."""
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+from src.model import get_pipeline
+from src.paths import FHV, PATH_DATETIME
+from src.transform import process_feature_target_by_PULocationID
+
+def make_synthetic_time_series(n_locations: int, n_hours: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a deterministic dense time series with the same schema as `add_missing_slots`.
+
+    Args:
+    - n_locations: Number of PULocationIDs.
+    - n_hours: Number of consecutive hourly slots per location.
+    - seed: Seed of the random generator.
+
+    Returns:
+    - A DataFrame with columns ['pickup_hour', 'rides', 'PULocationID'].
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range('2022-01-01', periods=n_hours, freq='h')
+    location_ids = rng.choice(np.arange(1, 266), size=n_locations, replace=False)
+    daily_profile = 1 + np.sin(np.arange(n_hours) * 2 * np.pi / 24)
+    scale = rng.gamma(2.0, 10.0, size=(n_locations, 1))
+
+    return pd.DataFrame({
+        'pickup_hour': np.tile(hours, n_locations),
+        'rides': rng.poisson(scale * daily_profile).astype(np.float64).ravel(),
+        'PULocationID': np.repeat(location_ids, n_hours),
+    })
+
+def make_synthetic_trips(path: str, year: int, month: int, n_rides: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a deterministic raw trip table shaped like the NYC TLC file of `path` for one month.
+
+    About 1% of the pickups fall outside the month, like in the published files, and FHV files use
+    the `PUlocationID` spelling with some missing zones.
+
+    Returns:
+    - A DataFrame with the pickup datetime column of `PATH_DATETIME[path]`, the pickup and dropoff zones
+      and a few trip attributes.
+    """
+    rng = np.random.default_rng(seed)
+    month_start = pd.Timestamp(year=year, month=month, day=1)
+    month_seconds = int((month_start + pd.DateOffset(months=1) - month_start).total_seconds())
+
+    seconds = rng.integers(0, month_seconds, size=n_rides)
+    outside = rng.random(n_rides) < 0.01
+    seconds[outside] -= month_seconds
+    pickup_datetime = month_start + pd.to_timedelta(np.sort(seconds), unit='s')
+
+    # A few busy zones take most of the rides
+    zone_weights = rng.pareto(1.5, size=265) + 1e-3
+    pickup_zone = rng.choice(np.arange(1, 266), size=n_rides, p=zone_weights / zone_weights.sum())
+
+    trip_seconds = rng.gamma(2.0, 400.0, size=n_rides)
+    fare_amount = rng.gamma(3.0, 5.0, size=n_rides)
+    tip_amount = fare_amount * rng.beta(1.0, 5.0, size=n_rides)
+
+    location_column = 'PUlocationID' if path == FHV else 'PULocationID'
+    df = pd.DataFrame({
+        'VendorID': rng.integers(1, 3, size=n_rides).astype(np.int32),
+        PATH_DATETIME[path]: pickup_datetime,
+        PATH_DATETIME[path].replace('pickup', 'dropoff'): pickup_datetime + pd.to_timedelta(trip_seconds, unit='s'),
+        'passenger_count': rng.integers(1, 5, size=n_rides).astype(np.float64),
+        'trip_distance': rng.gamma(2.0, 1.5, size=n_rides),
+        'RatecodeID': np.ones(n_rides),
+        'store_and_fwd_flag': np.where(rng.random(n_rides) < 0.01, 'Y', 'N'),
+        location_column: pickup_zone.astype(np.int32),
+        'DOLocationID': rng.integers(1, 266, size=n_rides).astype(np.int32),
+        'payment_type': rng.integers(1, 5, size=n_rides),
+        'fare_amount': fare_amount,
+        'extra': rng.choice([0.0, 0.5, 1.0, 2.5], size=n_rides),
+        'mta_tax': np.full(n_rides, 0.5),
+        'tip_amount': tip_amount,
+        'tolls_amount': np.where(rng.random(n_rides) < 0.05, 6.55, 0.0),
+        'improvement_surcharge': np.full(n_rides, 0.3),
+        'total_amount': fare_amount + tip_amount + 0.8,
+        'congestion_surcharge': rng.choice([0.0, 2.5], size=n_rides),
+        'airport_fee': rng.choice([0.0, 1.25], size=n_rides, p=[0.9, 0.1]),
+    })
+    if path == FHV:
+        df[location_column] = df[location_column].astype(np.float64).where(rng.random(n_rides) > 0.1)
+    return df
+
+def write_synthetic_raw_files(directory, path: str, years, months, n_rides: int) -> list:
+    """Write one synthetic raw parquet file per (year, month) with the TLC file naming. Returns their paths."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    file_paths = []
+    for year in years:
+        for month in months:
+            file_path = directory / f"{path}_{year}-{str(month).zfill(2)}.parquet"
+            make_synthetic_trips(path, year, month, n_rides, seed=year * 100 + month).to_parquet(file_path)
+            file_paths.append(file_path)
+    return file_paths
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler that does not print a line per request."""
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_directory(directory) -> ThreadingHTTPServer:
+    """Serve `directory` over HTTP on a free local port as a stand-in for `MAIN_PATH_LINK`."""
+    handler = partial(QuietHTTPRequestHandler, directory=str(directory))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def make_synthetic_grouped(n_locations: int, n_hours: int, fill_ratio: float = 0.7, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a sparse grouped table like `process_filtered_dataframe` output, with a share of the slots missing.
+
+    Returns:
+    - A DataFrame with columns ['pickup_hour', 'PULocationID', 'rides'] sorted by hour and location.
+    """
+    rng = np.random.default_rng(seed)
+    df = make_synthetic_time_series(n_locations, n_hours, seed)
+    df = df[(df['rides'] > 0) & (rng.random(len(df)) < fill_ratio)]
+    df = df.sort_values(['pickup_hour', 'PULocationID'], kind='stable')
+    df['rides'] = df['rides'].astype(np.int64)
+    return df[['pickup_hour', 'PULocationID', 'rides']].reset_index(drop=True)
+
+def make_synthetic_pickups(n_months: int, rides_per_month: int, seed: int = 0) -> pd.DataFrame:
+    """Build a filtered ride table with only 'pickup_datetime' and 'PULocationID', starting in January 2022."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2022-01-01')
+    span = (start + pd.DateOffset(months=n_months) - start) // pd.Timedelta(seconds=1)
+    seconds = np.sort(rng.integers(0, span, size=n_months * rides_per_month))
+    return pd.DataFrame({
+        'pickup_datetime': start.to_datetime64() + seconds.astype('timedelta64[s]'),
+        'PULocationID': rng.integers(1, 266, size=n_months * rides_per_month).astype(np.uint16),
+    })
+
+def train_synthetic_model(df_time_series, model_path, n_features=24 * 28, step_size=23, lag_spec=None, **hyperparameters):
+    """Fit a LightGBM pipeline from `get_pipeline` on a synthetic time series, with the columns of `lag_spec` if given, and save it with joblib."""
+    from lightgbm import LGBMRegressor
+
+    features, targets = process_feature_target_by_PULocationID(df_time_series, n_features, step_size, lag_spec)
+    pipeline = get_pipeline(LGBMRegressor, verbosity=-1, **hyperparameters)
+    pipeline.fit(features, targets)
+    joblib.dump(pipeline, model_path)
+    return pipeline
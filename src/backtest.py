@@ -0,0 +1,135 @@
+import os
+import time
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+from src.logger import get_logger
+from src.model import get_pipeline
+from src.parallel_training import training_matrix_pool, with_threads, worker_matrix
+from src.training_matrix import TrainingMatrix, export_training_matrix
+
+logger = get_logger()
+
+def walk_forward_cutoffs(pickup_hours, n_folds: int = 4, horizon='7D', freq=None) -> list:
+    """
+    Cutoff dates of a walk-forward backtest whose last test window ends with the data.
+
+    Args:
+    - pickup_hours: The pickup hours of the feature-target table.
+    - n_folds: Number of folds.
+    - horizon: Length of each test window.
+    - freq: Distance between consecutive cutoffs. Defaults to `horizon`, so test windows tile the end of the data.
+
+    Returns:
+    - The cutoffs in chronological order.
+    """
+    horizon = pd.Timedelta(horizon)
+    freq = pd.Timedelta(freq) if freq is not None else horizon
+    last_cutoff = (pd.Timestamp(np.max(pickup_hours)) + pd.Timedelta(hours=1) - horizon).floor('h')
+    return [last_cutoff - k * freq for k in reversed(range(n_folds))]
+
+def _fit_fold(fold: int, cutoff, horizon, train_window, model: Callable, hyperparameters: dict) -> dict:
+    """Fit one fold on the rows before `cutoff` and score the `horizon` after it, in a worker."""
+    matrix = worker_matrix()
+    cutoff = pd.Timestamp(cutoff)
+    train_start = cutoff - pd.Timedelta(train_window) if train_window is not None else None
+    train_rows = matrix.between(train_start, cutoff)
+    test_rows = matrix.between(cutoff, cutoff + pd.Timedelta(horizon))
+
+    X_train, y_train = matrix.frame(train_rows)
+    X_test, y_test = matrix.frame(test_rows)
+
+    start = time.perf_counter()
+    pipeline = get_pipeline(model, **hyperparameters)
+    pipeline.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+    predictions = pipeline.predict(X_test)
+
+    errors = pd.DataFrame({
+        'PULocationID': matrix.location_ids[test_rows],
+        'absolute_error': np.abs(y_test.to_numpy(dtype=np.float64) - predictions),
+    })
+    zones = errors.groupby('PULocationID')['absolute_error'].agg(mae='mean', n_test='size').reset_index()
+    zones.insert(0, 'cutoff', cutoff)
+    zones.insert(0, 'fold', fold)
+
+    return {
+        'fold': {
+            'fold': fold,
+            'cutoff': cutoff,
+            'n_train': len(X_train),
+            'n_test': len(X_test),
+            'mae': float(errors['absolute_error'].mean()) if len(errors) else np.nan,
+            'fit_seconds': fit_seconds,
+        },
+        'zones': zones,
+    }
+
+def backtest(
+        data,
+        model: Callable,
+        cutoffs: Optional[list] = None,
+        n_folds: int = 4,
+        horizon='7D',
+        freq=None,
+        train_window=None,
+        hyperparameters: Optional[dict] = None,
+        target_column_name: str = 'target_rides_next_hour',
+        n_workers: int = os.cpu_count(),
+        threads_per_worker: Optional[int] = 1) -> dict:
+    """
+    Walk-forward evaluation of a `get_pipeline` model over several cutoffs, folds fitted in parallel.
+
+    The features are computed once: every fold slices the same time-ordered training matrix with a
+    binary search on pickup_hour, so train and test sets are views of the memory-mapped arrays
+    instead of masked copies of the table.
+
+    Args:
+    - data: A feature-target DataFrame, or the directory of a training matrix exported with `order='time'`.
+    - model: Estimator class passed to `get_pipeline`, e.g. LGBMRegressor.
+    - cutoffs: Cutoff dates. If None, `n_folds` cutoffs from `walk_forward_cutoffs`.
+    - n_folds: Number of folds when `cutoffs` is None.
+    - horizon: Length of each test window after its cutoff.
+    - freq: Distance between generated cutoffs, `horizon` by default.
+    - train_window: Length of the training window before each cutoff. All earlier rows if None.
+    - hyperparameters: Keyword arguments of `model`.
+    - target_column_name: The name of the target column.
+    - n_workers: Number of worker processes.
+    - threads_per_worker: `n_jobs` of estimators that support it. None leaves it to the estimator.
+
+    Returns:
+    - A dictionary with 'folds' (one row per fold: cutoff, sizes, MAE, fit time), 'zones' (one row
+      per fold and PULocationID with its MAE) and 'total_seconds'.
+    """
+    hyperparameters = with_threads(model, hyperparameters or {}, threads_per_worker)
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if isinstance(data, pd.DataFrame):
+            directory = export_training_matrix(data, Path(tmp) / 'matrix', target_column_name, order='time')
+        else:
+            directory = Path(data)
+        matrix = TrainingMatrix(directory)
+        if matrix.metadata['order'] != 'time':
+            raise ValueError(f"{directory} is ordered by {matrix.metadata['order']}, backtests need order='time'")
+        if cutoffs is None:
+            cutoffs = walk_forward_cutoffs(matrix.pickup_hour, n_folds, horizon, freq)
+
+        logger.info(f"Backtesting {model.__name__} over {len(cutoffs)} folds with {n_workers} workers")
+        with training_matrix_pool(directory, n_workers) as executor:
+            futures = [
+                executor.submit(_fit_fold, fold, pd.Timestamp(cutoff), horizon, train_window, model, hyperparameters)
+                for fold, cutoff in enumerate(cutoffs)
+            ]
+            results = [future.result() for future in futures]
+
+    total_seconds = time.perf_counter() - start
+    folds = pd.DataFrame([result['fold'] for result in results])
+    zones = pd.concat([result['zones'] for result in results], ignore_index=True)
+    logger.info(
+        f"Backtest of {model.__name__}: mean MAE {folds['mae'].mean():.4f} over {len(folds)} folds "
+        f"in {total_seconds:.1f}s"
+    )
+    return {'folds': folds, 'zones': zones, 'total_seconds': total_seconds}
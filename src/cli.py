@@ -0,0 +1,132 @@
+"""
+Command line entry point: `python -m src.cli {fetch,transform,train,predict} ...`.
+
+Only the standard library and `src.paths` are imported here. Each command imports the modules it
+needs when it runs, so `fetch` never loads scikit-learn and `--help` loads nothing heavy at all.
+"""
+import os
+import argparse
+import importlib
+import sys
+from src.paths import REGISTRY_DIR, TAXI_TYPES, TRANSFORMED_DATA_DIR, YELLOW
+
+# Modules each command imports, used by the commands below and by the import-time benchmark
+COMMAND_MODULES = {
+    'fetch': ['src.extract'],
+    'transform': ['src.pipeline'],
+    'train': ['src.parallel_training', 'src.training', 'lightgbm'],
+    'predict': ['src.inference', 'src.feature_store', 'joblib'],
+}
+
+def load_command(command: str) -> list:
+    """Import the modules of `command`."""
+    return [importlib.import_module(module) for module in COMMAND_MODULES[command]]
+
+def fetch(args):
+    extract, = load_command('fetch')
+    for path in args.paths:
+        extract.ingest_months(path, args.years, args.months)
+
+def lag_spec(args):
+    """Lag specification of the --lags and --rolling-windows options, None for every lag."""
+    if not args.lags:
+        return None
+    from src.transform import parse_lag_spec
+
+    return parse_lag_spec(args.lags, args.rolling_windows)
+
+def transform(args):
+    pipeline, = load_command('transform')
+    pipeline.run_pipeline(n_features=args.n_features, step_size=args.step_size, incremental=args.incremental,
+                          years=args.years, use_cache=not args.no_cache, paths=args.paths, n_workers=args.workers,
+                          fetch=False, lag_spec=args.lag_spec)
+
+def train(args):
+    parallel_training, training, lightgbm = load_command('train')
+    import pandas as pd
+
+    df = pd.read_parquet(TRANSFORMED_DATA_DIR / f"{args.path}_features_target.parquet")
+    cutoff_date = pd.Timestamp(args.cutoff_date) if args.cutoff_date else training.get_cutoff_training_date(df, args.test_months)
+    zone_groups = {'all': sorted(df['PULocationID'].unique())} if args.single_model else None
+    metrics = parallel_training.train_zone_models(
+        df, lightgbm.LGBMRegressor, cutoff_date, hyperparameters={'verbosity': -1}, zone_groups=zone_groups,
+        n_workers=args.workers or os.cpu_count(), name=args.name,
+    )
+    print(metrics[['group', 'n_train', 'n_test', 'rmse', 'mae']].to_string(index=False))
+
+def predict(args):
+    inference, feature_store, joblib = load_command('predict')
+    import pandas as pd
+
+    model = joblib.load(args.model)
+    if args.time_series:
+        time_series = pd.read_parquet(args.time_series)
+    else:
+        # Only the partitions of the hours the windows need are read from the feature store
+        end = pd.Timestamp(args.at_hour) if args.at_hour else None
+        time_series = feature_store.read_latest_hours('time_series', args.path, args.n_features + 1, end)
+    at_hour = pd.Timestamp(args.at_hour) if args.at_hour else time_series['pickup_hour'].max() + pd.Timedelta(hours=1)
+    predictions = inference.predict_all_zones(model, time_series, at_hour, args.n_features, args.lag_spec)
+    if args.output:
+        predictions.to_csv(args.output, index=False)
+    else:
+        print(predictions.to_string(index=False))
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='taxi-demand', description='Taxi demand predictor.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fetch_parser = commands.add_parser('fetch', help='Download and filter the monthly trip files.')
+    fetch_parser.add_argument('--paths', nargs='+', choices=TAXI_TYPES, default=[YELLOW])
+    fetch_parser.add_argument('--years', nargs='+', type=int, default=[2022, 2023, 2024])
+    fetch_parser.add_argument('--months', nargs='+', type=int, default=list(range(1, 13)))
+    fetch_parser.set_defaults(func=fetch)
+
+    transform_parser = commands.add_parser('transform', help='Build the time series, feature-target tables and training matrices.')
+    transform_parser.add_argument('--paths', nargs='+', choices=TAXI_TYPES, default=[YELLOW])
+    transform_parser.add_argument('--years', nargs='+', type=int, default=[2022, 2023, 2024])
+    transform_parser.add_argument('--n-features', type=int, default=24 * 28)
+    transform_parser.add_argument('--step-size', type=int, default=23)
+    transform_parser.add_argument('--incremental', action='store_true', help='Only process filtered months not seen before.')
+    transform_parser.add_argument('--no-cache', action='store_true', help='Recompute every stage instead of using the stage cache.')
+    transform_parser.add_argument('--workers', type=int, default=None, help='Taxi types processed in parallel.')
+    transform_parser.add_argument('--lags', nargs='+', default=None, metavar='LAG',
+                                  help='Only compute these lags, e.g. 1-24 168 336 504 672. Every lag if omitted.')
+    transform_parser.add_argument('--rolling-windows', nargs='*', type=int, default=[], metavar='HOURS',
+                                  help='Windows of the rolling mean and max features added to --lags.')
+    transform_parser.set_defaults(func=transform)
+
+    train_parser = commands.add_parser('train', help='Train LightGBM models per zone into the model registry.')
+    train_parser.add_argument('--path', choices=TAXI_TYPES, default=YELLOW)
+    train_parser.add_argument('--cutoff-date', default=None, help='Start of the test period. Defaults to --test-months before the end.')
+    train_parser.add_argument('--test-months', type=int, default=6)
+    train_parser.add_argument('--single-model', action='store_true', help="One model for all zones, saved as group 'all'.")
+    train_parser.add_argument('--name', default='lgbm', help='Name of the registry entry.')
+    train_parser.add_argument('--workers', type=int, default=None)
+    train_parser.set_defaults(func=train)
+
+    predict_parser = commands.add_parser('predict', help='Predict the rides of every zone for one hour.')
+    predict_parser.add_argument('--model', default=REGISTRY_DIR / 'lgbm' / 'all.joblib', help='A fitted pipeline, e.g. from train --single-model.')
+    predict_parser.add_argument('--path', choices=TAXI_TYPES, default=YELLOW, help='Dataset read from the time_series feature group.')
+    predict_parser.add_argument('--time-series', default=None, help='Time series parquet file to read instead of the feature store.')
+    predict_parser.add_argument('--at-hour', default=None, help='Hour to predict. Defaults to the hour after the time series.')
+    predict_parser.add_argument('--n-features', type=int, default=24 * 28)
+    predict_parser.add_argument('--lags', nargs='+', default=None, metavar='LAG', help='Lags the model was trained on.')
+    predict_parser.add_argument('--rolling-windows', nargs='*', type=int, default=[], metavar='HOURS',
+                                help='Rolling windows the model was trained on.')
+    predict_parser.add_argument('--output', default=None, help='CSV file to write instead of printing.')
+    predict_parser.set_defaults(func=predict)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        # Reject an unusable --lags before any data is read
+        args.lag_spec = lag_spec(args) if hasattr(args, 'lags') else None
+    except ValueError as error:
+        parser.error(str(error))
+    args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,23 @@
-import dotenv
 import os
+from functools import cache
 from src.paths import PARENT_DIR
 
-dotenv.load_dotenv(PARENT_DIR / '.env')
+# Settings read from the environment, and from the .env file the first time one of them is used
+SETTINGS = {
+    'PROJECT_NAME': 'HOPSWORKS_PROJECT_NAME',
+    'API_KEY': 'HOPSWORKS_API_KEY',
+    'FEATURE_GROUP_NAME': 'FEATURE_GROUP_NAME',
+    'FEATURE_GROUP_VERSION': 'FEATURE_GROUP_VERSION',
+}
 
-try:
-    PROJECT_NAME = os.getenv('HOPSWORKS_PROJECT_NAME')
-    API_KEY = os.getenv('HOPSWORKS_API_KEY')
-    FEATURE_GROUP_NAME = os.getenv('FEATURE_GROUP_NAME')
-    FEATURE_GROUP_VERSION = os.getenv('FEATURE_GROUP_VERSION')
-except:
-    raise Exception("Create an .env file with HOPSWORKS_PROJECT_NAME and HOPSWORKS_API_KEY")
+@cache
+def load_env():
+    """Load the .env file once. Create it with HOPSWORKS_PROJECT_NAME and HOPSWORKS_API_KEY."""
+    import dotenv
+    dotenv.load_dotenv(PARENT_DIR / '.env')
+
+def __getattr__(name):
+    if name not in SETTINGS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    load_env()
+    return os.getenv(SETTINGS[name])
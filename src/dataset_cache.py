@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+import src.feature_engineering
+from src.logger import get_logger
+from src.paths import CACHE_DIR
+from src.feature_engineering import CALENDAR_COLUMNS, engineer_feature_array, feature_array
+from src.stage_cache import code_version
+from src.training_matrix import TrainingMatrix
+
+logger = get_logger()
+
+DATASET_CACHE_DIR = CACHE_DIR / 'datasets'
+LIBRARIES = ('lightgbm', 'xgboost')
+
+# Parameters fixed when LightGBM bins a dataset. `feature_pre_filter` is off so that trials may change
+# `min_child_samples` on the same binned data.
+LGBM_DATASET_PARAMS = {'max_bin': 255, 'feature_pre_filter': False, 'verbosity': -1}
+XGB_DATASET_PARAMS = {'max_bin': 256}
+
+# Fold datasets opened by this process, reused by every trial it evaluates
+_datasets = {}
+
+def library_of(model: Callable) -> Optional[str]:
+    """'lightgbm' or 'xgboost' for the estimators of these libraries, None for any other model."""
+    library = model.__module__.split('.')[0]
+    return library if library in LIBRARIES else None
+
+def engineered_arrays(matrix: TrainingMatrix, rows) -> tuple:
+    """
+    Features of `get_pipeline` for `rows` of a training matrix, computed once as float32 arrays.
+
+    Returns:
+    - (X, y, column names), X holding the lags, avg_rides_last_4_weeks and the calendar features.
+    """
+    lags, target = matrix.arrays(rows)
+    X = engineer_feature_array(feature_array(lags, matrix.pickup_hour[rows]), matrix.feature_columns)
+    columns = matrix.feature_columns + ['avg_rides_last_4_weeks'] + CALENDAR_COLUMNS
+    return X, np.asarray(target, dtype=np.float32), columns
+
+def _key(matrix: TrainingMatrix, cutoff_date, zones, **config) -> str:
+    """
+    Hash of the source matrix, the rows taken from it, the dataset configuration and the code that
+    engineers and bins the features, so a cached directory is found before any feature is computed.
+    """
+    payload = {
+        'matrix': matrix.fingerprint,
+        'cutoff_date': str(pd.Timestamp(cutoff_date)),
+        'zones': sorted(int(zone) for zone in zones) if zones is not None else None,
+        'code': code_version(src.feature_engineering, sys.modules[__name__]),
+        **config,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def build_fold_datasets(matrix: TrainingMatrix, cutoff_date, zones=None, n_splits: int = 5,
+                        library: str = 'lightgbm', dataset_params: Optional[dict] = None,
+                        cache_dir=DATASET_CACHE_DIR) -> Path:
+    """
+    Build the native datasets of the `TimeSeriesSplit` folds of the rows before `cutoff_date`, once.
+
+    The features of `get_pipeline` are computed a single time for all folds. For LightGBM every
+    fold's training set is binned into an `lgb.Dataset` and saved in LightGBM's binary format with its
+    validation set binned against it. XGBoost has no on-disk format for binned data, so its folds are
+    stored as float32 arrays that `load_fold` bins into a `QuantileDMatrix` once per process.
+
+    The directory is keyed on the fingerprint of the matrix, the training rows and the dataset
+    configuration, and looked up before the features are engineered, so every trial and every later
+    study on the same data reuses it at the cost of reading a few metadata files.
+
+    Args:
+    - matrix: The training matrix.
+    - cutoff_date: Only rows before it are used, as in `tune_hyperparameters`.
+    - zones: PULocationIDs to include. All zones if None.
+    - n_splits: Number of `TimeSeriesSplit` folds.
+    - library: 'lightgbm' or 'xgboost'.
+    - dataset_params: Binning parameters, `LGBM_DATASET_PARAMS` or `XGB_DATASET_PARAMS` by default.
+    - cache_dir: Root directory of the dataset cache.
+
+    Returns:
+    - The directory of the fold datasets.
+    """
+    from sklearn.model_selection import TimeSeriesSplit
+
+    if library not in LIBRARIES:
+        raise ValueError(f"Unsupported library {library}, expected one of {LIBRARIES}")
+    dataset_params = dataset_params or (LGBM_DATASET_PARAMS if library == 'lightgbm' else XGB_DATASET_PARAMS)
+    directory = Path(cache_dir) / _key(matrix, cutoff_date, zones, library=library, n_splits=n_splits,
+                                       dataset_params=dataset_params)
+    if (directory / 'metadata.json').exists():
+        logger.info(f"Reusing {library} fold datasets {directory.name[:12]}")
+        return directory
+
+    train_rows, _ = matrix.split_rows(cutoff_date, zones)
+    X, y, columns = engineered_arrays(matrix, train_rows)
+
+    tmp_dir = directory.with_name(f'{directory.name}.part')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    folds = []
+    for fold, (train_index, valid_index) in enumerate(TimeSeriesSplit(n_splits=n_splits).split(X)):
+        # TimeSeriesSplit folds are contiguous, slices keep the fold inputs views of X
+        train, valid = slice(train_index[0], train_index[-1] + 1), slice(valid_index[0], valid_index[-1] + 1)
+        if library == 'lightgbm':
+            import lightgbm as lgb
+
+            train_set = lgb.Dataset(X[train], y[train], feature_name=columns, params=dataset_params,
+                                    free_raw_data=True).construct()
+            valid_set = lgb.Dataset(X[valid], y[valid], reference=train_set).construct()
+            train_set.save_binary(str(tmp_dir / f'fold_{fold}_train.bin'))
+            valid_set.save_binary(str(tmp_dir / f'fold_{fold}_valid.bin'))
+        else:
+            for part, rows in (('train', train), ('valid', valid)):
+                np.save(tmp_dir / f'fold_{fold}_{part}_X.npy', X[rows])
+                np.save(tmp_dir / f'fold_{fold}_{part}_y.npy', y[rows])
+        folds.append({'n_train': len(train_index), 'n_valid': len(valid_index)})
+
+    with open(tmp_dir / 'metadata.json', 'w') as f:
+        json.dump({'library': library, 'n_splits': n_splits, 'columns': columns,
+                   'dataset_params': dataset_params, 'folds': folds}, f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    logger.info(f"Built {n_splits} {library} fold datasets of {len(X)} rows x {len(columns)} features in {directory}")
+    return directory
+
+def load_fold(directory, fold: int) -> tuple:
+    """(train, valid) native datasets of one fold, opened once per process."""
+    directory = Path(directory)
+    if (directory, fold) in _datasets:
+        return _datasets[directory, fold]
+    with open(directory / 'metadata.json') as f:
+        metadata = json.load(f)
+
+    if metadata['library'] == 'lightgbm':
+        import lightgbm as lgb
+
+        # The binary files do not keep the binning parameters, and `feature_pre_filter` must stay off
+        train_set = lgb.Dataset(str(directory / f'fold_{fold}_train.bin'), params=metadata['dataset_params']).construct()
+        valid_set = lgb.Dataset(str(directory / f'fold_{fold}_valid.bin'), reference=train_set).construct()
+    else:
+        import xgboost as xgb
+
+        def part(name):
+            return (np.load(directory / f'fold_{fold}_{name}_X.npy', mmap_mode='r'),
+                    np.load(directory / f'fold_{fold}_{name}_y.npy'))
+        X_train, y_train = part('train')
+        X_valid, y_valid = part('valid')
+        params = metadata['dataset_params']
+        train_set = xgb.QuantileDMatrix(X_train, y_train, feature_names=metadata['columns'], **params)
+        valid_set = xgb.QuantileDMatrix(X_valid, y_valid, feature_names=metadata['columns'], ref=train_set, **params)
+
+    _datasets[directory, fold] = (train_set, valid_set)
+    return train_set, valid_set
+
+def train_fold(directory, fold: int, hyperparameters: dict) -> float:
+    """
+    Boost one fold with the native API and return its validation RMSE.
+
+    `hyperparameters` are those of LGBMRegressor / XGBRegressor: `n_estimators` becomes the number of
+    boosting rounds and the sklearn names of the thread count and seed are mapped to the native ones.
+    """
+    train_set, valid_set = load_fold(directory, fold)
+    params = dict(hyperparameters)
+    num_boost_round = params.pop('n_estimators', 100) or 100
+    evals = {}
+
+    if type(train_set).__module__.startswith('lightgbm'):
+        import lightgbm as lgb
+
+        params = {'objective': 'regression', **train_set.params, **params, 'metric': 'rmse'}
+        lgb.train(params, train_set, num_boost_round, valid_sets=[valid_set], valid_names=['valid'],
+                  callbacks=[lgb.record_evaluation(evals)])
+    else:
+        import xgboost as xgb
+
+        renames = {'n_jobs': 'nthread', 'random_state': 'seed'}
+        params = {renames.get(name, name): value for name, value in params.items() if value is not None}
+        params = {'objective': 'reg:squarederror', **params, 'eval_metric': 'rmse'}
+        xgb.train(params, train_set, num_boost_round, evals=[(valid_set, 'valid')], evals_result=evals,
+                  verbose_eval=False)
+    return float(evals['valid']['rmse'][-1])
+
+def cross_validate_cached(directory, hyperparameters: dict) -> float:
+    """Mean validation RMSE of `hyperparameters` over the fold datasets in `directory`."""
+    with open(Path(directory) / 'metadata.json') as f:
+        n_splits = json.load(f)['n_splits']
+    return float(np.mean([train_fold(directory, fold, hyperparameters) for fold in range(n_splits)]))
@@ -0,0 +1,54 @@
+import hashlib
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+from src.logger import get_logger
+
+logger = get_logger()
+
+def file_sha256(file_path, chunk_size: int = 16 * 1024 * 1024) -> str:
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def dataset_ref(file_path, n_rows: Optional[int] = None) -> dict:
+    """
+    Lightweight reference to a dataset written to disk, to pass between pipeline steps instead of the data.
+
+    The content is hashed once, here; readers compare the size and modification time by default.
+
+    Returns:
+    - A dictionary with the 'path', the 'sha256' of the content, its 'bytes', 'mtime_ns' and 'n_rows'.
+    """
+    file_path = Path(file_path).resolve()
+    stat = file_path.stat()
+    return {
+        'path': str(file_path),
+        'sha256': file_sha256(file_path),
+        'bytes': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'n_rows': n_rows,
+    }
+
+def load_dataset(ref: dict, columns=None, verify: bool = False) -> pd.DataFrame:
+    """
+    Read the parquet file of a `dataset_ref`, checking that its size and modification time are still
+    the ones it was referenced with.
+
+    Args:
+    - ref: The reference.
+    - columns: Columns to read. All columns if None.
+    - verify: Also hash the whole file and compare it with the referenced content.
+
+    Returns:
+    - The DataFrame.
+    """
+    stat = Path(ref['path']).stat()
+    if (stat.st_size, stat.st_mtime_ns) != (ref['bytes'], ref['mtime_ns']):
+        raise ValueError(f"{ref['path']} changed since it was referenced")
+    if verify and file_sha256(ref['path']) != ref['sha256']:
+        raise ValueError(f"{ref['path']} changed since it was referenced")
+    return pd.read_parquet(ref['path'], columns=columns)
@@ -1,59 +1,297 @@
-import requests
+import os
+import json
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 from src.logger import get_logger
 from src.filtering import filter_by_date_range, select_important_columns
+from src.schema import compact_schema
 from src.paths import (RAW_DATA_DIR, MAIN_PATH_LINK, FILTERED_DATA_DIR, TIME_SERIES_DATA_DIR, PATH_DATETIME)
 
 logger = get_logger()
 
-def download_file(url, file_path):
-    """Auxiliary function to download a file and save it to a specific path."""
+def download_file(url, file_path, chunk_size=1024 * 1024):
+    """
+    Auxiliary function to download a file and save it to a specific path.
+
+    The response is streamed to a temporary `.part` file in chunks and renamed once complete,
+    so an interrupted download never leaves a truncated parquet file behind.
+    """
+    import requests  # only downloads need it, keep it off the import path of readers
+
+    tmp_path = file_path.with_name(f'{file_path.name}.part')
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
+        with requests.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+        os.replace(tmp_path, file_path)
         logger.info(f'{file_path.name} downloaded successfully to {file_path.parent}')
         return True
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching data from {file_path.name}: {e}")
         return False
+    finally:
+        # Gone after a successful rename; left over after any error, including OSErrors while writing
+        tmp_path.unlink(missing_ok=True)
 
-def check_file_exists(path, year, month):
+def check_file_exists(path, year, month, raw_dir=RAW_DATA_DIR):
     """Check if the file for a specific year and month exists."""
-    file_path = Path(RAW_DATA_DIR) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
+    file_path = Path(raw_dir) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
     return file_path.exists()
 
-def  fetch_data_if_not_exists(path, year, month):
-    """Download data if it doesn't already exist."""
-    if check_file_exists(path, year, month):
+def  fetch_data_if_not_exists(path, year, month, base_url=MAIN_PATH_LINK, raw_dir=RAW_DATA_DIR):
+    """Download data if it doesn't already exist. Returns True when the raw file is available."""
+    if check_file_exists(path, year, month, raw_dir):
         logger.info(f'{path}_{year}-{str(month).zfill(2)}.parquet already exists. Skipping download.')
-        return
-    url = f"{MAIN_PATH_LINK}{path}_{year}-{str(month).zfill(2)}.parquet"
+        return True
+    url = f"{base_url}{path}_{year}-{str(month).zfill(2)}.parquet"
     file_name = f"{path}_{year}-{str(month).zfill(2)}.parquet"
-    download_file(url, Path(RAW_DATA_DIR) / file_name)
+    return download_file(url, Path(raw_dir) / file_name)
+
+def read_raw_month(file_path, path, year, month):
+    """
+    Read the pickup datetime and pickup location of the rides of one month from a raw trip file.
+
+    Only those two columns are decoded, and the month range is pushed down to the parquet reader
+    so row groups entirely outside it are skipped from their statistics. The location column is
+    resolved case-insensitively, which covers the `PUlocationID` spelling of the FHV files.
+
+    Args:
+        file_path (Path): Raw parquet file.
+        path (str): Identifier for the dataset, used to look up its datetime column in `PATH_DATETIME`.
+        year (int): Year of the rides to keep.
+        month (int): Month of the rides to keep.
+
+    Returns:
+        pd.DataFrame: The `PATH_DATETIME[path]` column and the pickup location as 'PULocationID'.
+    """
+    dataset = ds.dataset(file_path, format='parquet')
+    datetime_column = PATH_DATETIME[path]
+    location_column = next(
+        (name for name in dataset.schema.names if name.lower() == 'pulocationid'), None
+    )
+    if location_column is None:
+        raise KeyError(f"No pickup location column in {file_path}")
+
+    columns = [datetime_column, location_column]
+    datetime_type = dataset.schema.field(datetime_column).type
+
+    if pa.types.is_timestamp(datetime_type):
+        month_start = pd.Timestamp(year=year, month=month, day=1)
+        month_end = month_start + pd.DateOffset(months=1)
+        month_filter = (
+            (ds.field(datetime_column) >= pa.scalar(month_start.to_pydatetime(), type=datetime_type)) &
+            (ds.field(datetime_column) < pa.scalar(month_end.to_pydatetime(), type=datetime_type))
+        )
+        df = dataset.to_table(columns=columns, filter=month_filter).to_pandas()
+    else:
+        # Datetimes stored as strings cannot be compared in the scan, filter them after parsing
+        df = filter_by_date_range(dataset.to_table(columns=columns).to_pandas(), year, month, datetime_column)
+
+    return df.rename(columns={location_column: 'PULocationID'})
 
-def validate_and_process_data(path, year, month):
-    """Validates, filters, and processes data for a specific year and month."""
-    file_path = Path(RAW_DATA_DIR) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
-    filtered_file_path = Path(FILTERED_DATA_DIR) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
+def validate_and_process_data(path, year, month, raw_dir=RAW_DATA_DIR, filtered_dir=FILTERED_DATA_DIR):
+    """Validates, filters, and processes data for a specific year and month. Returns True on success."""
+    file_path = Path(raw_dir) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
+    filtered_file_path = Path(filtered_dir) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
     
     if filtered_file_path.exists():
         logger.info(f"{filtered_file_path} already exists. Skipping validation.")
-        return
+        return True
 
     try:
-        df = pd.read_parquet(file_path)
-        filtered_df = filter_by_date_range(df, year, month, PATH_DATETIME[path])
+        filtered_df = read_raw_month(file_path, path, year, month)
         filtered_df = select_important_columns(filtered_df, path).dropna()
         filtered_df['type'] = path.split('_')[0]
+        filtered_df = compact_schema(filtered_df)
         filtered_file_path.parent.mkdir(parents=True, exist_ok=True)
         filtered_df.to_parquet(filtered_file_path)
         logger.info(f'Saved filtered data to {filtered_file_path}')
+        return True
     except Exception as e:
         logger.error(f"Error processing {file_path}: {e}")
+        return False
+
+def load_manifest(manifest_path):
+    """Load the per-month ingestion manifest, or an empty one if it does not exist yet."""
+    manifest_path = Path(manifest_path)
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def save_manifest(manifest, manifest_path):
+    """Atomically write the per-month ingestion manifest."""
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_name(f'{manifest_path.name}.part')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def ingest_months(
+        path,
+        years,
+        months,
+        max_download_workers=4,
+        max_filter_workers=2,
+        base_url=MAIN_PATH_LINK,
+        raw_dir=RAW_DATA_DIR,
+        filtered_dir=FILTERED_DATA_DIR,
+        manifest_path=None,
+        profiler=None):
+    """
+    Download and filter every (year, month) of a path concurrently, recording progress in a manifest.
+
+    Downloads run in a bounded thread pool and each finished month is handed straight to a process
+    pool for `validate_and_process_data`. The status of every month ('downloaded', 'filtered' or
+    'failed') is written to `{raw_dir}/{path}_manifest.json` as soon as it changes, so an interrupted
+    run resumes with the months that are not 'filtered' yet.
+
+    With a `profiler` the months are all downloaded first, then filtered, as the 'fetch' and 'validate'
+    stages of its report: the two no longer overlap, but each one is measured on its own.
+
+    Args:
+        path (str): Identifier for the dataset, e.g. YELLOW.
+        years (Iterable[int]): Years to ingest.
+        months (Iterable[int]): Months to ingest for every year.
+        max_download_workers (int): Number of concurrent downloads.
+        max_filter_workers (int): Number of processes filtering raw files. Each one holds a full month in memory.
+        base_url (str): Location of the raw files, `MAIN_PATH_LINK` unless pointing at a mirror or a local server.
+        raw_dir (Path): Directory for the raw files and the manifest.
+        filtered_dir (Path): Directory for the filtered files.
+        manifest_path (Path): Manifest to use instead of `{raw_dir}/{path}_manifest.json`, e.g. one per
+            year when years of the same path are ingested by concurrent processes.
+        profiler (RunProfiler): Profiler recording the 'fetch' and 'validate' stages.
+
+    Returns:
+        dict: The manifest, mapping 'YYYY-MM' to the status of that month.
+    """
+    manifest_path = Path(manifest_path or Path(raw_dir) / f"{path}_manifest.json")
+    manifest = load_manifest(manifest_path)
+
+    pending = []
+    for year in years:
+        for month in months:
+            key = f"{year}-{str(month).zfill(2)}"
+            filtered_file_path = Path(filtered_dir) / f"{path}_{key}.parquet"
+            if manifest.get(key) == 'filtered' and filtered_file_path.exists():
+                continue
+            pending.append((year, month, key))
+
+    logger.info(f"{len(pending)} months of {path} to ingest.")
+    if not pending:
+        return manifest
+
+    if profiler is not None:
+        with profiler.stage('fetch', rows_in=len(pending)) as record:
+            downloaded = download_months(path, pending, manifest, manifest_path, max_download_workers, base_url, raw_dir)
+            record['rows_out'] = len(downloaded)
+        with profiler.stage('validate', rows_in=len(downloaded)) as record:
+            filter_months(path, downloaded, manifest, manifest_path, max_filter_workers, raw_dir, filtered_dir)
+            record['rows_out'] = sum(manifest[key] == 'filtered' for _, _, key in downloaded)
+        return log_failed_months(path, pending, manifest)
+
+    with ThreadPoolExecutor(max_workers=max_download_workers) as download_pool, \
+            ProcessPoolExecutor(max_workers=max_filter_workers) as filter_pool:
+        download_futures = {
+            download_pool.submit(fetch_data_if_not_exists, path, year, month, base_url, raw_dir): (year, month, key)
+            for year, month, key in pending
+        }
+        filter_futures = {}
+
+        for future in as_completed(download_futures):
+            year, month, key = download_futures[future]
+            if future.result():
+                manifest[key] = 'downloaded'
+                filter_futures[filter_pool.submit(
+                    validate_and_process_data, path, year, month, raw_dir, filtered_dir
+                )] = key
+            else:
+                manifest[key] = 'failed'
+            save_manifest(manifest, manifest_path)
+
+        for future in as_completed(filter_futures):
+            key = filter_futures[future]
+            manifest[key] = 'filtered' if future.result() else 'failed'
+            save_manifest(manifest, manifest_path)
+
+    return log_failed_months(path, pending, manifest)
+
+def download_months(path, pending, manifest, manifest_path, max_workers=4, base_url=MAIN_PATH_LINK, raw_dir=RAW_DATA_DIR) -> list:
+    """
+    Download the (year, month, key) triples of `pending` in a bounded thread pool, recording each
+    status in the manifest.
+
+    Returns:
+    - The triples that were downloaded.
+    """
+    downloaded = []
+    with ThreadPoolExecutor(max_workers=max_workers) as download_pool:
+        download_futures = {
+            download_pool.submit(fetch_data_if_not_exists, path, year, month, base_url, raw_dir): (year, month, key)
+            for year, month, key in pending
+        }
+        for future in as_completed(download_futures):
+            year, month, key = download_futures[future]
+            if future.result():
+                manifest[key] = 'downloaded'
+                downloaded.append((year, month, key))
+            else:
+                manifest[key] = 'failed'
+            save_manifest(manifest, manifest_path)
+    return downloaded
+
+def filter_months(path, downloaded, manifest, manifest_path, max_workers=2, raw_dir=RAW_DATA_DIR,
+                  filtered_dir=FILTERED_DATA_DIR):
+    """Run `validate_and_process_data` on the downloaded (year, month, key) triples in a process pool, recording each status in the manifest."""
+    with ProcessPoolExecutor(max_workers=max_workers) as filter_pool:
+        filter_futures = {
+            filter_pool.submit(validate_and_process_data, path, year, month, raw_dir, filtered_dir): key
+            for year, month, key in downloaded
+        }
+        for future in as_completed(filter_futures):
+            key = filter_futures[future]
+            manifest[key] = 'filtered' if future.result() else 'failed'
+            save_manifest(manifest, manifest_path)
+
+def log_failed_months(path, pending, manifest) -> dict:
+    """Warn about the months of `pending` that failed and return the manifest."""
+    # Only the months of this call: the manifest also holds months of earlier runs over other years
+    n_failed = sum(manifest.get(key) == 'failed' for _, _, key in pending)
+    if n_failed:
+        logger.warning(f"{n_failed} months of {path} failed to ingest. Re-run to retry them.")
+    return manifest
+
+def read_filtered_month(path, year, month, filtered_dir=FILTERED_DATA_DIR):
+    """
+    Read a filtered month with the column names used by the transform stage.
+
+    `select_important_columns` stores the pickup zone as 'pickup_location_id', while the time-series
+    steps group by 'PULocationID', so the column is renamed back on read.
+    """
+    file_path = Path(filtered_dir) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
+    df = pd.read_parquet(file_path)
+    return df.rename(columns={'pickup_location_id': 'PULocationID'})
+
+def list_filtered_months(path, filtered_dir=FILTERED_DATA_DIR, years=None):
+    """
+    List the (year, month) pairs with a filtered file for a specific path, in chronological order,
+    only those of `years` if given.
+    """
+    months = []
+    for file_path in Path(filtered_dir).glob(f"{path}_*.parquet"):
+        year, month = file_path.stem[len(path) + 1:].split('-')
+        months.append((int(year), int(month)))
+    if years is not None:
+        years = set(years)
+        months = [(year, month) for year, month in months if year in years]
+    return sorted(months)
 
 def concatenate_filtered_data(path):
     """Concatenate filtered data for a specific path and save it to a single file."""
@@ -63,7 +301,7 @@ def concatenate_filtered_data(path):
             file_path = Path(FILTERED_DATA_DIR) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
             if file_path.exists():
                 try:
-                    df = pd.read_parquet(file_path)
+                    df = read_filtered_month(path, year, month)
                     dataframes.append(df)
                 except Exception as e:
                     logger.error(f"Error reading {file_path}: {e}")
@@ -1,22 +1,104 @@
+import numpy as np
 import pandas as pd
 from sklearn.base import BaseEstimator, TransformerMixin
 
+NS_PER_HOUR = 3_600_000_000_000
+CALENDAR_COLUMNS = ['hour', 'day_of_week', 'day_of_month', 'month', 'year']
+LAST_4_WEEKS_COLUMNS = [f'rides_previous_{24*7*i}' for i in range(1, 5)]
+
+def hours_since_epoch(pickup_hour) -> np.ndarray:
+    """Pickup hours as int64 hours since 1970-01-01."""
+    return np.asarray(pickup_hour, dtype='datetime64[ns]').view(np.int64) // NS_PER_HOUR
+
+def calendar_features(hours: np.ndarray) -> dict:
+    """
+    Calendar features of int64 hours since the epoch, with the same values and int32 dtype as the
+    pandas `.dt` accessors.
+
+    Hour and day of week are modular arithmetic on the hours. Day of month, month and year come from a
+    lookup table with one entry per day of the covered range, so dates are decomposed once per day
+    rather than once per row.
+    """
+    hours = np.asarray(hours, dtype=np.int64)
+    if len(hours) == 0:
+        return {name: np.empty(0, dtype=np.int32) for name in CALENDAR_COLUMNS}
+
+    days = hours // 24
+    first_day = days.min()
+    table_days = np.arange(first_day, days.max() + 1).astype('datetime64[D]')
+    table_months = table_days.astype('datetime64[M]')
+    table_years = table_days.astype('datetime64[Y]')
+    day_offset = days - first_day
+
+    return {
+        'hour': (hours % 24).astype(np.int32),
+        'day_of_week': ((days + 3) % 7).astype(np.int32),  # 1970-01-01 was a Thursday
+        'day_of_month': ((table_days - table_months).astype(np.int32) + 1)[day_offset],
+        'month': ((table_months - table_years).astype(np.int32) + 1)[day_offset],
+        'year': (table_years.astype(np.int32) + 1970)[day_offset],
+    }
+
+def _mean_of_columns(columns: list) -> np.ndarray:
+    """Row-wise mean skipping NaN, summed in float32 in column order like `DataFrame.mean(axis=1)`."""
+    total = np.zeros(len(columns[0]), dtype=np.float32)
+    count = np.zeros(len(columns[0]), dtype=np.float32)
+    for column in columns:
+        valid = ~np.isnan(column)
+        total += np.where(valid, column, np.float32(0))
+        count += valid
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / count
+
 class TemporalFeatures(BaseEstimator, TransformerMixin):
 
     def fit(self, X, y=None):
         return self
-    
-    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
-        X_ = X.copy()
-        X_['hour'] = X_.pickup_hour.dt.hour
-        X_['day_of_week'] = X_.pickup_hour.dt.dayofweek
-        X_['day_of_month'] = X_.pickup_hour.dt.day
-        X_['month'] = X_.pickup_hour.dt.month
-        X_['year'] = X_.pickup_hour.dt.year
 
-        return X_.drop(columns=['pickup_hour'])
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        # `drop` would copy the lag block; deleting from a shallow copy keeps it a view
+        X_ = X.copy(deep=False)
+        del X_['pickup_hour']
+        for name, values in calendar_features(hours_since_epoch(X['pickup_hour'])).items():
+            X_[name] = values
+        return X_
 
 # Function to calculate the average rides over the last 4 weeks
 def average_rides_last_4_weeks(X: pd.DataFrame) -> pd.DataFrame:
-    avg_rides_last_4_weeks = X[[f'rides_previous_{24*7*i}' for i in range(1, 5)]].mean(axis=1)
-    return X.assign(avg_rides_last_4_weeks=avg_rides_last_4_weeks)
+    avg_rides_last_4_weeks = _mean_of_columns([X[column].to_numpy() for column in LAST_4_WEEKS_COLUMNS])
+    # Adding the column to a shallow copy leaves the lag block alone; `assign` or a concat with another
+    # float32 block would copy it into one consolidated block
+    X_ = X.copy(deep=False)
+    X_['avg_rides_last_4_weeks'] = avg_rides_last_4_weeks
+    return X_
+
+def feature_array(lags: np.ndarray, pickup_hour) -> np.ndarray:
+    """
+    Input of the array pipeline: the float32 lag block of the feature-target table followed by one
+    column of pickup hours as hours since the epoch (exact in float32 until the year 3884).
+    """
+    X = np.empty((len(lags), lags.shape[1] + 1), dtype=np.float32)
+    X[:, :-1] = lags
+    X[:, -1] = hours_since_epoch(pickup_hour)
+    return X
+
+def engineer_feature_array(X: np.ndarray, lag_columns: list) -> np.ndarray:
+    """
+    Array version of `average_rides_last_4_weeks` followed by `TemporalFeatures`.
+
+    Args:
+    - X: A `feature_array`, i.e. float32 lags in the order of `lag_columns` and a last column of hours.
+    - lag_columns: Names of the lag columns of X.
+
+    Returns:
+    - A float32 array with the lags, avg_rides_last_4_weeks and the calendar features, in the column
+      order of the DataFrame pipeline.
+    """
+    n_lags = len(lag_columns)
+    positions = {column: position for position, column in enumerate(lag_columns)}
+    out = np.empty((len(X), n_lags + 1 + len(CALENDAR_COLUMNS)), dtype=np.float32)
+    out[:, :n_lags] = X[:, :n_lags]
+    out[:, n_lags] = _mean_of_columns([X[:, positions[column]] for column in LAST_4_WEEKS_COLUMNS])
+    calendar = calendar_features(X[:, n_lags].astype(np.int64))
+    for offset, name in enumerate(CALENDAR_COLUMNS, start=n_lags + 1):
+        out[:, offset] = calendar[name]
+    return out
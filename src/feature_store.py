@@ -0,0 +1,191 @@
+from typing import Iterable, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from src.logger import get_logger
+from src.paths import FEATURE_STORE_DIR
+
+logger = get_logger()
+
+# Hive partition keys of every feature group: taxi type, year and month of `pickup_hour`, PULocationID
+PARTITION_SCHEMA = pa.schema([
+    ('type', pa.string()),
+    ('year', pa.int16()),
+    ('month', pa.int8()),
+    ('zone', pa.int32()),
+])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+
+def get_feature_group_dir(name: str, version: int = 1, store_dir=FEATURE_STORE_DIR):
+    """Directory of a feature group, named and versioned like the Hopsworks feature groups."""
+    return store_dir / f"{name}_v{version}"
+
+def write_feature_group(
+        df: pd.DataFrame,
+        name: str,
+        path: str,
+        version: int = 1,
+        store_dir=FEATURE_STORE_DIR):
+    """
+    Write a time series or feature-target table to a local feature group, partitioned by
+    type/year/month/zone.
+
+    Partitions present in `df` replace the ones already stored, the others are left untouched,
+    so writing only the latest months of a table updates it in place.
+
+    Args:
+        df (pd.DataFrame): Table with 'pickup_hour' and 'PULocationID' columns.
+        name (str): Feature group name, e.g. 'time_series' or 'features_target'.
+        path (str): Identifier for the dataset (e.g. YELLOW), stored as the 'type' partition.
+        version (int): Feature group version.
+        store_dir (Path): Root directory of the feature store.
+
+    Returns:
+        Path: Directory of the feature group.
+    """
+    group_dir = get_feature_group_dir(name, version, store_dir)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = (
+        table
+        .append_column('type', pa.array([path.split('_')[0]] * len(df), type=pa.string()))
+        .append_column('year', pa.array(df['pickup_hour'].dt.year.to_numpy(), type=pa.int16()))
+        .append_column('month', pa.array(df['pickup_hour'].dt.month.to_numpy(), type=pa.int8()))
+        .append_column('zone', pa.array(df['PULocationID'].to_numpy(), type=pa.int32()))
+    )
+    ds.write_dataset(
+        table,
+        group_dir,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template='part-{i}.parquet',
+        max_partitions=1_000_000,
+        existing_data_behavior='delete_matching',
+    )
+    logger.info(f"Saved {len(df)} rows of {path} to feature group {group_dir}")
+    return group_dir
+
+def read_feature_group(
+        name: str,
+        path: Optional[str] = None,
+        zones: Optional[Iterable[int]] = None,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+        columns: Optional[list] = None,
+        version: int = 1,
+        store_dir=FEATURE_STORE_DIR) -> pd.DataFrame:
+    """
+    Read a slice of a local feature group, opening only the partitions that can match.
+
+    Args:
+        name (str): Feature group name.
+        path (str, optional): Identifier for the dataset. All types if None.
+        zones (Iterable[int], optional): PULocationIDs to read, e.g. `range(1, 100)`. All zones if None.
+        start (pd.Timestamp, optional): First `pickup_hour` to read, inclusive.
+        end (pd.Timestamp, optional): Last `pickup_hour` to read, exclusive.
+        columns (list, optional): Columns to read. All stored columns if None.
+        version (int): Feature group version.
+        store_dir (Path): Root directory of the feature store.
+
+    Returns:
+        pd.DataFrame: The matching rows sorted by 'PULocationID' and 'pickup_hour', without the partition keys.
+    """
+    group_dir = get_feature_group_dir(name, version, store_dir)
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    zones = list(zones) if zones is not None else None
+
+    files = _partition_files(group_dir, path, zones, start, end)
+    if not files:
+        logger.warning(f"No data in feature group {group_dir} for the requested slice.")
+        return pd.DataFrame(columns=columns)
+    dataset = ds.dataset(files, format='parquet', partitioning=PARTITIONING, partition_base_dir=str(group_dir))
+
+    conditions = []
+    if path is not None:
+        conditions.append(ds.field('type') == path.split('_')[0])
+    if zones is not None:
+        conditions.append(ds.field('zone').isin(zones))
+    if start is not None:
+        conditions.append(ds.field('pickup_hour') >= start.to_datetime64())
+    if end is not None:
+        conditions.append(ds.field('pickup_hour') < end.to_datetime64())
+
+    row_filter = None
+    for condition in conditions:
+        row_filter = condition if row_filter is None else row_filter & condition
+
+    stored_columns = [field for field in dataset.schema.names if field not in PARTITION_SCHEMA.names]
+    table = dataset.to_table(columns=columns or stored_columns, filter=row_filter)
+
+    df = table.to_pandas()
+    if {'PULocationID', 'pickup_hour'}.issubset(df.columns):
+        df = df.sort_values(['PULocationID', 'pickup_hour'], kind='stable')
+    return df.reset_index(drop=True)
+
+def _partition_files(group_dir, path, zones, start, end) -> list:
+    """
+    List the parquet files of the partitions a read can touch, walking only the matching
+    type/year/month/zone directories instead of the whole feature group.
+    """
+    types = [path.split('_')[0]] if path is not None else ['*']
+    zone_dirs = [f"zone={zone}" for zone in zones] if zones is not None else ['zone=*']
+
+    if start is not None and end is not None:
+        months = pd.period_range(start.to_period('M'), (end - pd.Timedelta(1)).to_period('M'), freq='M')
+        month_dirs = [f"year={month.year}/month={month.month}" for month in months]
+    else:
+        month_dirs = ['year=*/month=*']
+
+    files = []
+    for type_ in types:
+        for month_dir in month_dirs:
+            for zone_dir in zone_dirs:
+                files.extend(group_dir.glob(f"type={type_}/{month_dir}/{zone_dir}/*.parquet"))
+    return sorted(str(file) for file in files)
+
+def last_pickup_hour(name: str, path: str, version: int = 1, store_dir=FEATURE_STORE_DIR) -> Optional[pd.Timestamp]:
+    """
+    Latest `pickup_hour` of a dataset in a feature group, reading only its last year/month partitions.
+
+    Returns:
+        pd.Timestamp: The latest hour, None if the feature group holds no data for `path`.
+    """
+    group_dir = get_feature_group_dir(name, version, store_dir)
+    month_dirs = group_dir.glob(f"type={path.split('_')[0]}/year=*/month=*")
+    months = [(int(d.parent.name.split('=')[1]), int(d.name.split('=')[1])) for d in month_dirs]
+    if not months:
+        return None
+    start = pd.Timestamp(year=max(months)[0], month=max(months)[1], day=1)
+    df = read_feature_group(name, path, start=start, end=start + pd.offsets.MonthBegin(1), columns=['pickup_hour'],
+                            version=version, store_dir=store_dir)
+    return df['pickup_hour'].max()
+
+def read_latest_hours(
+        name: str,
+        path: str,
+        n_hours: int,
+        end: Optional[pd.Timestamp] = None,
+        version: int = 1,
+        store_dir=FEATURE_STORE_DIR) -> pd.DataFrame:
+    """
+    Read the `n_hours` hours of a feature group before `end`, e.g. the history inference needs.
+
+    Args:
+        name (str): Feature group name.
+        path (str): Identifier for the dataset.
+        n_hours (int): Number of hours to read.
+        end (pd.Timestamp, optional): Hour after the last one to read. Defaults to the hour after the latest stored one.
+        version (int): Feature group version.
+        store_dir (Path): Root directory of the feature store.
+
+    Returns:
+        pd.DataFrame: The rows of those hours, as returned by `read_feature_group`.
+    """
+    if end is None:
+        last_hour = last_pickup_hour(name, path, version, store_dir)
+        if last_hour is None:
+            raise FileNotFoundError(f"No {path} data in feature group {get_feature_group_dir(name, version, store_dir)}")
+        end = last_hour + pd.Timedelta(hours=1)
+    end = pd.Timestamp(end)
+    return read_feature_group(name, path, start=end - pd.Timedelta(hours=n_hours), end=end,
+                              version=version, store_dir=store_dir)
@@ -0,0 +1,85 @@
+from typing import TYPE_CHECKING
+import numpy as np
+import pandas as pd
+from src.logger import get_logger
+from src.transform import lag_features, lag_spec_columns, lag_spec_span, time_series_to_dense_matrix
+
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
+
+logger = get_logger()
+
+def build_latest_windows(matrix, pickup_hours, location_ids, at_hour, n_features=24 * 28, lag_spec=None) -> pd.DataFrame:
+    """
+    Assemble the feature rows of every zone for predicting `at_hour` straight from the dense matrix.
+
+    A row of `process_feature_target_by_PULocationID` with `pickup_hour` h holds the `n_features` hours
+    before h, and its target is the rides of h + 1. The rows predicting `at_hour` are therefore labelled
+    `at_hour` - 1 and hold the hours before it: they are copied once into a contiguous float32 block of
+    shape (n_locations, n_features), oldest hour first, and wrapped with the columns of the table.
+    With a `lag_spec` its columns are gathered from that block.
+
+    Args:
+    - matrix: Array of shape (n_hours, n_locations) as returned by `build_dense_matrix`.
+    - pickup_hours: The hour of each matrix row.
+    - location_ids: The PULocationID of each matrix column.
+    - at_hour: The hour to predict. Must be at most two hours after the last row of `matrix`.
+    - n_features: Number of previous hours in each window.
+    - lag_spec: The lag specification of the feature-target table, None for every lag. It must read at
+      most `n_features` hours.
+
+    Returns:
+    - A DataFrame with one feature row per location, with `pickup_hour` `at_hour` - 1.
+    """
+    if lag_spec is not None and lag_spec_span(lag_spec) > n_features:
+        raise ValueError(f"The lag specification reads {lag_spec_span(lag_spec)} hours, more than n_features={n_features}")
+    at_hour = pd.Timestamp(at_hour)
+    pickup_hour = at_hour - pd.Timedelta(hours=1)
+    end = int((pickup_hour - pickup_hours[0]) / pd.Timedelta(hours=1))
+    start = end - n_features
+    if start < 0 or end > len(pickup_hours):
+        raise ValueError(
+            f"Cannot build {n_features}-hour windows for {at_hour}: "
+            f"time series covers {pickup_hours[0]} to {pickup_hours[-1]}"
+        )
+
+    block = np.ascontiguousarray(matrix[start:end].T, dtype=np.float32)
+
+    if lag_spec is not None:
+        # Each location's window ends right before its pickup hour
+        anchors = np.arange(1, len(block) + 1) * n_features
+        features = pd.DataFrame(lag_features(block.ravel(), anchors, lag_spec), columns=lag_spec_columns(lag_spec), copy=False)
+    else:
+        features = pd.DataFrame(block, columns=[f'rides_previous_{i+1}' for i in reversed(range(n_features))], copy=False)
+    features['pickup_hour'] = pickup_hour
+    features['PULocationID'] = location_ids
+    return features
+
+def predict_all_zones(model: 'Pipeline', time_series, at_hour, n_features=24 * 28, lag_spec=None) -> pd.DataFrame:
+    """
+    Predict the rides of every zone for one hour with a single `predict` call.
+
+    Args:
+    - model: A fitted pipeline from `get_pipeline`, which adds `average_rides_last_4_weeks` and
+      `TemporalFeatures` to the window block before scoring.
+    - time_series: A dense time series, either the long DataFrame of `add_missing_slots` or its
+      (matrix, pickup_hours, location_ids) tuple from `add_missing_slots(..., as_matrix=True)`.
+    - at_hour: The hour to predict.
+    - n_features: Number of previous hours the model was trained on.
+    - lag_spec: The lag specification the model was trained with, None for every lag.
+
+    Returns:
+    - A DataFrame with columns ['pickup_hour', 'PULocationID', 'predicted_rides'], 'pickup_hour' being `at_hour`.
+    """
+    if isinstance(time_series, pd.DataFrame):
+        time_series = time_series_to_dense_matrix(time_series)
+    matrix, pickup_hours, location_ids = time_series
+
+    features = build_latest_windows(matrix, pickup_hours, location_ids, at_hour, n_features, lag_spec)
+    predictions = model.predict(features)
+
+    return pd.DataFrame({
+        'pickup_hour': features['pickup_hour'] + pd.Timedelta(hours=1),
+        'PULocationID': features['PULocationID'],
+        'predicted_rides': predictions,
+    })
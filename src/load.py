@@ -1,16 +1,10 @@
-from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Optional, List, Tuple
-from pdb import set_trace as stop
-from src.extract import fetch_data_if_not_exists
-from src.filtering import select_important_columns,filter_by_date_range
+from typing import Optional, List
+from src.extract import fetch_data_if_not_exists, read_raw_month
+from src.filtering import select_important_columns
 
-import numpy as np
 import pandas as pd
-import requests
-from tqdm import tqdm
 
-from src.paths import RAW_DATA_DIR, TRANSFORMED_DATA_DIR
+from src.paths import RAW_DATA_DIR
 
 #refactoring the load_raw_data function
 def load_raw_data(
@@ -54,13 +48,11 @@ def load_raw_data(
         else:
             print(f'File {year}-{month:02d} was already in local storage') 
 
-        # load the file into Pandas
-        rides_one_month = pd.read_parquet(local_file)
+        # load only the pickup columns of this month into Pandas
+        rides_one_month = read_raw_month(local_file, PATH, year, month)
 
         # rename columns
         rides_one_month = select_important_columns(rides_one_month, PATH)
-        
-        rides_one_month = filter_by_date_range(rides_one_month, year, month, date_column='pickup_datetime')
 
         # append to existing data
         rides = pd.concat([rides, rides_one_month])
@@ -1,73 +1,160 @@
+from contextlib import contextmanager
 from pathlib import Path
-from src.extract import fetch_data_if_not_exists, validate_and_process_data 
-from src.transform import process_feature_target_by_PULocationID,transform_to_time_series_data
+from src.extract import ingest_months
+from src.transform import combine_time_series, parse_lag_spec
+from src.pipeline import feature_target_stage, schedule_paths, time_series_stage
 from src.paths import *
 from src.logger import get_logger
-import pandas as pd
-from metaflow import FlowSpec, step
+from src.schema import compact_schema
+from src.profiling import RunProfiler
+from src.stage_cache import StageCache
+from src.dataset_ref import dataset_ref, load_dataset
+from metaflow import FlowSpec, Parameter, current, resources, step
+
+logger = get_logger()
 
 class DataPipelineFlow(FlowSpec):
-    
-    def save_dataframe(self, df, path, filename, message):
-        """Helper function to save a DataFrame and log the action."""
+    """
+    Data pipeline as a Metaflow flow: a branch per taxi type, whose ingestion fans out again over the
+    years, and a join summing the types into one demand series.
+
+    DataFrames never become artifacts. Steps write them to parquet and pass `dataset_ref` references
+    (path, content hash, size, modification time), so the datastore only holds a few small objects per
+    step, and the next step reads the file it needs. The transform steps run the stages of
+    `run_pipeline` through the same per-type `StageCache`, with the same lag specification.
+
+    The flow runs locally only: references are paths on the local disk, which steps on remote compute
+    (`--with batch` or `--with kubernetes`) could not read. The `resources` hints record what each step
+    needs and have no effect on local runs.
+    """
+    profile_steps = Parameter('profile', default='', help='Comma-separated steps to profile with cProfile.')
+    taxi_types = Parameter('taxi_types', default=YELLOW, help=f"Comma-separated taxi types, e.g. {','.join(TAXI_TYPES)}.")
+    lags = Parameter('lags', default='', help='Comma-separated lags or ranges to compute, e.g. 1-24,168,336,504,672. Every lag if empty.')
+    rolling_windows = Parameter('rolling_windows', default='', help='Comma-separated windows of the rolling mean and max features added to lags.')
+    use_cache = Parameter('use_cache', default=True, type=bool, help='Read unchanged stages back from the stage cache.')
+    verify = Parameter('verify', default=False, type=bool, help='Hash every dataset a step reads instead of comparing its size and modification time.')
+
+    @contextmanager
+    def profiled(self, name):
+        """
+        Measure a step with `RunProfiler`, appending it to the report shared by the steps of this run.
+        Yields the profiler, for the stages run inside the step, and the record of the step.
+        Steps of a foreach branch append to the report of their taxi type (and year), as branches run
+        concurrently.
+        """
+        branch = '_'.join(str(part) for part in (getattr(self, 'path', None), getattr(self, 'year', None)) if part)
+        profiler = RunProfiler(
+            f"{current.flow_name}_{current.run_id}" + (f"_{branch}" if branch else ''),
+            profile_stages=[stage for stage in self.profile_steps.split(',') if stage],
+        )
+        with profiler.stage(name) as record:
+            yield profiler, record
+        profiler.write_report(append=True)
+
+    def save_dataframe(self, df, path, filename, message) -> dict:
+        """Save a DataFrame in the compact schema, log the action and return its `dataset_ref`."""
         file_path = Path(path) / filename
         file_path.parent.mkdir(parents=True, exist_ok=True)
-        df.to_parquet(file_path)
-        self.logger.info(f'{message} {file_path}')
-        return file_path
+        compact_schema(df).to_parquet(file_path)
+        logger.info(f'{message} {file_path}')
+        return dataset_ref(file_path, len(df))
 
     @step
     def start(self):
-        """Initializes parameters and starts the pipeline."""
-        self.n_features = 24 * 28
-        self.step_size = 23
-        self.paths = [YELLOW]  # Expand paths as needed
-        self.years = range(2022, 2025)
-        self.months = range(1, 13)
-        self.logger = get_logger()
-        self.next(self.download_and_validate_data)
+        """Initializes parameters and fans out over the taxi types, largest first."""
+        with self.profiled('start'):
+            lags = [lag for lag in self.lags.split(',') if lag]
+            windows = [window for window in self.rolling_windows.split(',') if window]
+            self.lag_spec = parse_lag_spec(lags, windows) if lags else None
+            self.n_features = 24 * 28
+            self.step_size = 23
+            self.years = list(range(2022, 2025))
+            self.months = list(range(1, 13))
+            self.paths = schedule_paths(self.taxi_types.split(','), self.years)
+        self.next(self.fan_out_years, foreach='paths')
 
+    @step
+    def fan_out_years(self):
+        """Fans the branch PATH out over its years."""
+        self.path = self.input
+        self.next(self.download_and_validate_data, foreach='years')
+
+    @resources(cpu=4, memory=8000)
     @step
     def download_and_validate_data(self):
-        """Downloads and validates data for each PATH, year, and month."""
-        for path in self.paths:
-            for year in self.years:
-                for month in self.months:
-                    fetch_data_if_not_exists(path, year, month)
-                    validate_and_process_data(path, year, month)
+        """Downloads and validates the months of one year of the branch PATH."""
+        self.year = self.input
+        with self.profiled('download_and_validate_data') as (profiler, record):
+            # One manifest per year: the years of a path are ingested concurrently
+            manifest = ingest_months(self.path, [self.year], self.months,
+                                     manifest_path=RAW_DATA_DIR / f"{self.path}_{self.year}_manifest.json",
+                                     profiler=profiler)
+            self.n_filtered = sum(status == 'filtered' for status in manifest.values())
+            record['rows_out'] = self.n_filtered
+        self.next(self.join_years)
+
+    @step
+    def join_years(self, inputs):
+        """Waits for every year of the branch PATH."""
+        with self.profiled('join_years'):
+            self.merge_artifacts(inputs, include=['n_features', 'step_size', 'years', 'months', 'paths', 'lag_spec', 'path'])
+            self.filtered_months = {inp.year: inp.n_filtered for inp in inputs}
         self.next(self.transform_data_to_time_series)
 
+    @resources(cpu=1, memory=16000)
     @step
     def transform_data_to_time_series(self):
-        """Transforms filtered data into time-series format for each PATH."""
-        self.time_series_data_dict = {}
-        for path in self.paths:
-            df_time_series = transform_to_time_series_data(path, self.logger)
+        """Transforms the filtered data of the branch PATH into time-series format."""
+        with self.profiled('transform_data_to_time_series') as (profiler, record):
+            cache = StageCache(CACHE_DIR / self.path) if self.use_cache else None
+            df_time_series, self.time_series_key = time_series_stage(self.path, self.years, cache, profiler, logger)
+            self.time_series = None
             if df_time_series.empty:
-                self.logger.info(f"No data available for transformation for {path}.")
+                logger.info(f"No data available for transformation for {self.path}.")
             else:
                 # Save the final transformed time-series data
-                self.save_dataframe(df_time_series, TIME_SERIES_DATA_DIR, f"{path}_time_series.parquet", "Saved final time-series data to")
-                self.time_series_data_dict[path] = df_time_series
+                self.time_series = self.save_dataframe(df_time_series, TIME_SERIES_DATA_DIR, f"{self.path}_time_series.parquet", "Saved final time-series data to")
+            record['rows_out'] = len(df_time_series)
         self.next(self.transform_to_feature_target)
 
+    @resources(cpu=1, memory=16000)
     @step
     def transform_to_feature_target(self):
-        """Transforms time-series data into feature-target format for modeling."""
-        self.transformed_data = {}
-        for path, df_time_series in self.time_series_data_dict.items():
-            feature_df, target_df = process_feature_target_by_PULocationID(
-                df_time_series, n_features=self.n_features, step_size=self.step_size
-            )
-            feature_target_df = feature_df.join(pd.DataFrame(target_df, columns=['target_rides_next_hour']))
-            self.save_dataframe(feature_target_df, TRANSFORMED_DATA_DIR, f"{path}_features_target.parquet", "Saved transformed feature-target data to")
-            self.transformed_data[path] = feature_target_df
+        """Transforms the time-series data of the branch PATH into feature-target format for modeling."""
+        with self.profiled('transform_to_feature_target') as (profiler, record):
+            self.features_target = None
+            if self.time_series is not None:
+                df_time_series = load_dataset(self.time_series, verify=self.verify)
+                cache = StageCache(CACHE_DIR / self.path) if self.use_cache else None
+                feature_target_df, _ = feature_target_stage(df_time_series, self.time_series_key, self.n_features,
+                                                            self.step_size, cache, profiler, self.lag_spec)
+                self.features_target = self.save_dataframe(feature_target_df, TRANSFORMED_DATA_DIR, f"{self.path}_features_target.parquet", "Saved transformed feature-target data to")
+                record['rows_in'] = len(df_time_series)
+                record['rows_out'] = len(feature_target_df)
+        self.next(self.join)
+
+    @resources(cpu=1, memory=8000)
+    @step
+    def join(self, inputs):
+        """Collects the branches and sums their time series into one all-types demand series per zone."""
+        with self.profiled('join') as (_, record):
+            self.merge_artifacts(inputs, include=['n_features', 'step_size', 'years', 'months', 'paths', 'lag_spec'])
+            self.filtered_months = {inp.path: inp.filtered_months for inp in inputs}
+            self.time_series = {inp.path: inp.time_series for inp in inputs if inp.time_series is not None}
+            self.features_target = {inp.path: inp.features_target for inp in inputs if inp.features_target is not None}
+            self.combined_time_series = None
+            if len(self.time_series) > 1:
+                df_combined = combine_time_series(load_dataset(ref, verify=self.verify) for ref in self.time_series.values())
+                self.combined_time_series = self.save_dataframe(df_combined, TIME_SERIES_DATA_DIR, f"{ALL_TRIPDATA}_time_series.parquet", "Saved combined time-series data to")
+                record['rows_out'] = len(df_combined)
+            record['rows_in'] = sum(ref['n_rows'] for ref in self.time_series.values())
         self.next(self.end)
 
     @step
     def end(self):
         """Finalizes the pipeline and logs completion."""
-        self.logger.info("Data pipeline completed successfully.")
+        with self.profiled('end'):
+            logger.info("Data pipeline completed successfully.")
 
 if __name__ == '__main__':
     DataPipelineFlow()
@@ -1,6 +1,6 @@
 from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import FunctionTransformer
-from src.feature_engineering import TemporalFeatures, average_rides_last_4_weeks
+from src.feature_engineering import TemporalFeatures, average_rides_last_4_weeks, engineer_feature_array
 from sklearn.pipeline import Pipeline
 # Function that builds and returns the complete pipeline
 def get_pipeline(model, **hyperparameter) -> Pipeline:
@@ -24,3 +24,16 @@ def get_pipeline(model, **hyperparameter) -> Pipeline:
         add_temporal_features,
         model_instance
     )
+
+# Same features as `get_pipeline` on plain float32 arrays built with `feature_array`
+def get_array_pipeline(model, lag_columns, **hyperparameter) -> Pipeline:
+    add_features = FunctionTransformer(
+        engineer_feature_array, kw_args={'lag_columns': list(lag_columns)}, validate=False
+        )
+
+    if hyperparameter:
+        model_instance = model(**hyperparameter)
+    else:
+        model_instance = model()
+
+    return make_pipeline(add_features, model_instance)
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error, root_mean_squared_error
+from sklearn.model_selection import TimeSeriesSplit
+from src.logger import get_logger
+from src.model import get_pipeline
+from src.paths import REGISTRY_DIR
+from src.training_matrix import TrainingMatrix, export_training_matrix
+from src.dataset_cache import DATASET_CACHE_DIR, build_fold_datasets, cross_validate_cached, library_of
+
+logger = get_logger()
+
+# Training matrix opened once per worker process by `_open_training_matrix`
+_matrix = {}
+
+def lgbm_param_suggestion(trial: 'optuna.trial.Trial') -> dict:
+    """ Define the hyperparameters search space """
+
+    return {
+        "metric": "rmse",
+        "verbosity": -1,
+        "num_leaves": trial.suggest_int("num_leaves", 2, 256),
+        "feature_fraction": trial.suggest_float("feature_fraction", 0.2, 1.0),
+        "bagging_fraction": trial.suggest_float("bagging_fraction", 0.2, 1.0),
+        "min_child_samples": trial.suggest_int("min_child_samples", 3, 100),
+    }
+
+def _open_training_matrix(directory):
+    """Process pool initializer: memory-map the training matrix written by `export_training_matrix`."""
+    _matrix['matrix'] = TrainingMatrix(directory)
+
+def with_threads(model: Callable, hyperparameters: dict, threads_per_worker: Optional[int]) -> dict:
+    """Cap the threads of estimators that take `n_jobs` so that workers do not oversubscribe the CPUs."""
+    if threads_per_worker is None or 'n_jobs' in hyperparameters or 'n_jobs' not in model().get_params():
+        return hyperparameters
+    return {**hyperparameters, 'n_jobs': threads_per_worker}
+
+def _fit_group(group: str, zones, model: Callable, hyperparameters: dict, cutoff_date, model_dir) -> dict:
+    """Fit and evaluate the model of one zone group in a worker, save it and return its registry entry."""
+    start = time.perf_counter()
+    X_train, y_train, X_test, y_test = worker_matrix().train_test_split(cutoff_date, zones)
+    load_seconds = time.perf_counter() - start
+
+    entry = {
+        'group': group,
+        'zones': [int(zone) for zone in zones],
+        'n_train': len(X_train),
+        'n_test': len(X_test),
+        'rmse': None,
+        'mae': None,
+        'model_path': None,
+        'load_seconds': load_seconds,
+    }
+    if len(X_train) == 0:
+        entry['fit_seconds'] = 0.0
+        return entry
+
+    start = time.perf_counter()
+    pipeline = get_pipeline(model, **hyperparameters)
+    pipeline.fit(X_train, y_train)
+    entry['fit_seconds'] = time.perf_counter() - start
+
+    if len(X_test):
+        y_pred = pipeline.predict(X_test)
+        entry['rmse'] = float(root_mean_squared_error(y_test, y_pred))
+        entry['mae'] = float(mean_absolute_error(y_test, y_pred))
+
+    model_path = Path(model_dir) / f'{group}.joblib'
+    joblib.dump(pipeline, model_path)
+    entry['model_path'] = model_path.name
+    return entry
+
+def _cross_validate(hyperparameters: dict, model: Callable, zones, cutoff_date, n_splits: int) -> float:
+    """Mean RMSE of `hyperparameters` over `TimeSeriesSplit` folds of the training rows, in a worker."""
+    X_train, y_train, _, _ = worker_matrix().train_test_split(cutoff_date, zones)
+
+    scores = []
+    for train_index, test_index in TimeSeriesSplit(n_splits=n_splits).split(X_train):
+        pipeline = get_pipeline(model, **hyperparameters)
+        pipeline.fit(X_train.iloc[train_index, :], y_train.iloc[train_index])
+        y_pred = pipeline.predict(X_train.iloc[test_index, :])
+        scores.append(root_mean_squared_error(y_train.iloc[test_index], y_pred))
+    return float(np.mean(scores))
+
+def worker_matrix() -> TrainingMatrix:
+    """The training matrix opened by the worker process running the current task."""
+    return _matrix['matrix']
+
+def training_matrix_pool(directory, n_workers: int) -> ProcessPoolExecutor:
+    """Process pool whose workers each memory-map the training matrix in `directory` once."""
+    # spawn rather than fork: LightGBM/XGBoost OpenMP pools do not survive a fork
+    return ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_open_training_matrix,
+        initargs=(str(directory),),
+    )
+
+def train_zone_models(
+        df: pd.DataFrame,
+        model: Callable,
+        cutoff_date,
+        target_column_name: str = 'target_rides_next_hour',
+        hyperparameters: Optional[dict] = None,
+        zone_groups: Optional[dict] = None,
+        n_workers: int = os.cpu_count(),
+        threads_per_worker: Optional[int] = 1,
+        name: str = 'lgbm',
+        registry_dir=REGISTRY_DIR) -> pd.DataFrame:
+    """
+    Fit one model per zone, or per zone cluster, in a process pool and record them in a model registry.
+
+    The feature-target table is exported once with `export_training_matrix`. Workers memory-map it
+    and slice their zones' rows, so only the zone list travels to each task.
+
+    The registry is `registry_dir/name/`, holding a `{group}.joblib` pipeline per group and a
+    `registry.json` with the hyperparameters and the per-group metrics and timings. It is built in
+    `registry_dir/name.part/` and replaces the previous entry only once every model is saved.
+
+    Args:
+    - df: Feature-target table as built by `process_feature_target_by_PULocationID`.
+    - model: Estimator class passed to `get_pipeline`, e.g. LGBMRegressor.
+    - cutoff_date: Rows before it are used for training, the others for the test metrics.
+    - target_column_name: The name of the target column.
+    - hyperparameters: Keyword arguments of `model`.
+    - zone_groups: Mapping of group name to the PULocationIDs sharing one model. One group
+      per zone if None.
+    - n_workers: Number of worker processes.
+    - threads_per_worker: `n_jobs` of estimators that support it. None leaves it to the estimator.
+    - name: Name of the registry entry.
+    - registry_dir: Root directory of the model registry.
+
+    Returns:
+    - A DataFrame with one row of metrics and timings per group.
+    """
+    hyperparameters = with_threads(model, hyperparameters or {}, threads_per_worker)
+    if zone_groups is None:
+        zone_groups = {f'zone_{zone}': [zone] for zone in sorted(df['PULocationID'].unique())}
+
+    model_dir = Path(registry_dir) / name
+    # Models are written to a sibling directory and swapped in once all of them are saved, so a run
+    # that fails part way leaves the previous entry untouched
+    part_dir = model_dir.with_name(f'{name}.part')
+    if part_dir.exists():
+        shutil.rmtree(part_dir)
+    part_dir.mkdir(parents=True)
+
+    start = time.perf_counter()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = export_training_matrix(df, Path(tmp) / 'matrix', target_column_name)
+            logger.info(f"Training {len(zone_groups)} {model.__name__} models with {n_workers} workers")
+
+            with training_matrix_pool(directory, n_workers) as executor:
+                futures = [
+                    executor.submit(_fit_group, group, [int(zone) for zone in zones], model, hyperparameters,
+                                    cutoff_date, part_dir)
+                    for group, zones in zone_groups.items()
+                ]
+                entries = [future.result() for future in futures]
+
+        registry = {
+            'name': name,
+            'model': model.__name__,
+            'hyperparameters': hyperparameters,
+            'cutoff_date': str(pd.Timestamp(cutoff_date)),
+            'n_workers': n_workers,
+            'total_seconds': time.perf_counter() - start,
+            'groups': entries,
+        }
+        save_registry(registry, part_dir)
+    except BaseException:
+        shutil.rmtree(part_dir, ignore_errors=True)
+        raise
+
+    replace_directory(part_dir, model_dir)
+    logger.info(f"Saved {len(entries)} models to {model_dir} in {registry['total_seconds']:.1f}s")
+    return pd.DataFrame(entries)
+
+def tune_hyperparameters(
+        df: pd.DataFrame,
+        model: Callable,
+        param_suggestion_func: Callable,
+        cutoff_date,
+        target_column_name: str = 'target_rides_next_hour',
+        zones=None,
+        n_trials: int = 10,
+        n_splits: int = 5,
+        n_workers: int = os.cpu_count(),
+        threads_per_worker: Optional[int] = 1,
+        study: Optional['optuna.Study'] = None,
+        dataset_cache_dir=DATASET_CACHE_DIR) -> 'optuna.Study':
+    """
+    Run an Optuna study with its trials evaluated in parallel worker processes.
+
+    The study stays in this process: trials are asked `n_workers` at a time, their hyperparameters
+    cross-validated by the workers on the memory-mapped training matrix, and the scores told back.
+
+    For LightGBM and XGBoost models the features and the binned fold datasets are built once by
+    `build_fold_datasets` and shared by all trials, which then only boost. Other models, or
+    `dataset_cache_dir=None`, fit the `get_pipeline` pipeline on every fold of every trial.
+
+    Args:
+    - df: Feature-target table as built by `process_feature_target_by_PULocationID`.
+    - model: Estimator class passed to `get_pipeline`.
+    - param_suggestion_func: Function mapping a trial to hyperparameters, e.g. `lgbm_param_suggestion`.
+    - cutoff_date: Only rows before it are used for cross-validation.
+    - target_column_name: The name of the target column.
+    - zones: PULocationIDs to tune on. All zones if None.
+    - n_trials: Number of trials.
+    - n_splits: Number of `TimeSeriesSplit` folds per trial.
+    - n_workers: Number of worker processes.
+    - threads_per_worker: `n_jobs` of estimators that support it. None leaves it to the estimator.
+    - study: Study to continue. A new minimizing study if None.
+    - dataset_cache_dir: Where fold datasets are kept between trials and studies. None disables them.
+
+    Returns:
+    - The study, with `best_trial.params` holding the best hyperparameters.
+    """
+    import optuna
+
+    study = study or optuna.create_study(direction='minimize')
+    zones = [int(zone) for zone in zones] if zones is not None else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = export_training_matrix(df, Path(tmp) / 'matrix', target_column_name)
+        library = library_of(model) if dataset_cache_dir is not None else None
+        if library is not None:
+            folds_dir = build_fold_datasets(TrainingMatrix(directory), cutoff_date, zones, n_splits, library,
+                                            cache_dir=dataset_cache_dir)
+
+        with training_matrix_pool(directory, n_workers) as executor:
+            remaining = n_trials
+            while remaining > 0:
+                trials = [study.ask() for _ in range(min(n_workers, remaining))]
+                hyperparameters = [with_threads(model, param_suggestion_func(trial), threads_per_worker) for trial in trials]
+                futures = [
+                    executor.submit(cross_validate_cached, folds_dir, trial_hyperparameters) if library is not None else
+                    executor.submit(_cross_validate, trial_hyperparameters, model, zones, cutoff_date, n_splits)
+                    for trial_hyperparameters in hyperparameters
+                ]
+                for trial, future in zip(trials, futures):
+                    study.tell(trial, future.result())
+                remaining -= len(trials)
+
+    logger.info(f"Best RMSE {study.best_value:.4f} with {study.best_trial.params}")
+    return study
+
+def replace_directory(source, destination):
+    """Move `source` to `destination`, replacing it: the old directory is renamed aside before it is deleted."""
+    source, destination = Path(source), Path(destination)
+    old_dir = destination.with_name(f'{destination.name}.old')
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+    if destination.exists():
+        os.replace(destination, old_dir)
+    os.replace(source, destination)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+def save_registry(registry: dict, model_dir):
+    """Write `registry.json` and a flat `metrics.csv` of a registry entry atomically."""
+    model_dir = Path(model_dir)
+    tmp_path = model_dir / 'registry.json.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(registry, f, indent=2, default=str)
+    os.replace(tmp_path, model_dir / 'registry.json')
+    pd.DataFrame(registry['groups']).to_csv(model_dir / 'metrics.csv', index=False)
+
+def load_registry(name: str = 'lgbm', registry_dir=REGISTRY_DIR) -> dict:
+    """Read the `registry.json` of a registry entry."""
+    with open(Path(registry_dir) / name / 'registry.json') as f:
+        return json.load(f)
+
+def load_zone_model(zone: int, name: str = 'lgbm', registry_dir=REGISTRY_DIR):
+    """Load the pipeline that serves `zone` from a registry entry."""
+    registry = load_registry(name, registry_dir)
+    for entry in registry['groups']:
+        if zone in entry['zones'] and entry['model_path'] is not None:
+            return joblib.load(Path(registry_dir) / name / entry['model_path'])
+    raise KeyError(f"No model for PULocationID {zone} in registry entry {name}")
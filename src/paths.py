@@ -8,7 +8,11 @@ RAW_DATA_DIR = DATA_DIR / 'raw'
 FILTERED_DATA_DIR = DATA_DIR / 'filtered'
 TRANSFORMED_DATA_DIR = DATA_DIR / 'transformed'
 TIME_SERIES_DATA_DIR = DATA_DIR / 'time_series_data'
+FEATURE_STORE_DIR = DATA_DIR / 'feature_store'
+CACHE_DIR = DATA_DIR / 'cache'
+REPORTS_DIR = DATA_DIR / 'reports'
 MODELS_DIR = PARENT_DIR / '../models'
+REGISTRY_DIR = MODELS_DIR / 'registry'
 
 # Link Settings and Constants
 MAIN_PATH_LINK = 'https://d37ci6vzurychx.cloudfront.net/trip-data/'
@@ -16,6 +20,9 @@ YELLOW = 'yellow_tripdata'
 GREEN = 'green_tripdata'
 FHV = 'fhv_tripdata'
 FHVHV = 'fhvhv_tripdata'
+TAXI_TYPES = [YELLOW, GREEN, FHV, FHVHV]
+# Sum of all taxi types, written by the join step of the pipelines
+ALL_TRIPDATA = 'all_tripdata'
 
 YELLOW_DATETIME = 'tpep_pickup_datetime'
 GREEN_DATETIME = 'lpep_pickup_datetime'
@@ -30,6 +37,10 @@ PATH_DATETIME = {
     FHVHV: FHVHV_DATETIME
 }
 
-# Creates all directories if they do not exist
-for directory in [DATA_DIR, RAW_DATA_DIR, FILTERED_DATA_DIR, TRANSFORMED_DATA_DIR, TIME_SERIES_DATA_DIR, MODELS_DIR]:
-    directory.mkdir(parents=True, exist_ok=True)
+DIRECTORIES = [DATA_DIR, RAW_DATA_DIR, FILTERED_DATA_DIR, TRANSFORMED_DATA_DIR, TIME_SERIES_DATA_DIR, FEATURE_STORE_DIR, CACHE_DIR, REPORTS_DIR, MODELS_DIR]
+
+# Importing this module has no side effects: writers create the directories they write to
+def create_directories():
+    """Creates all directories if they do not exist."""
+    for directory in DIRECTORIES:
+        directory.mkdir(parents=True, exist_ok=True)
@@ -1,41 +1,360 @@
-from src.extract import fetch_data_if_not_exists, validate_and_process_data
-from src.transform import process_feature_target_by_PULocationID, transform_to_time_series_data
+import os
+import sys
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+import src.extract
+import src.schema
+import src.transform
+from src.extract import ingest_months, list_filtered_months
+from src.transform import (process_feature_target_by_PULocationID, aggregate_filtered_data, add_missing_slots, combine_time_series,
+                           load_time_series_state, save_time_series_state,
+                           update_time_series_data, update_feature_target_data, parse_lag_spec,
+                           validate_lag_spec)
+from src.feature_store import write_feature_group
+from src.schema import compact_schema
+from src.stage_cache import StageCache, code_version
+from src.profiling import RunProfiler
+from src.training_matrix import export_training_matrix
 from src.paths import *
 from src.logger import get_logger
 import pandas as pd
 from pathlib import Path
 
 def save_dataframe(df, path, filename, message, logger):
-    """Helper function to save a DataFrame and log the action."""
+    """Helper function to save a DataFrame in the compact schema and log the action."""
     file_path = Path(path) / filename
     file_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_parquet(file_path)
+    compact_schema(df).to_parquet(file_path)
     logger.info(f'{message} {file_path}')
     return file_path
 
-def run_pipeline(n_features=24, step_size=1):
-    """Runs the data processing pipeline for each PATH."""
+def build_feature_target(df_time_series, n_features, step_size, lag_spec=None):
+    """Transform a time series into the feature-target table, with every lag or those of `lag_spec`."""
+    feature_df, target_df = process_feature_target_by_PULocationID(df_time_series, n_features=n_features, step_size=step_size,
+                                                                   lag_spec=lag_spec)
+    return feature_df.join(pd.DataFrame(target_df, columns=['target_rides_next_hour']))
+
+def update_feature_target(path, df_time_series, n_features, step_size, logger, lag_spec=None):
+    """
+    Bring the saved feature-target table of a path up to date with its time series.
+
+    Returns:
+    - (table, since): the table, or None when it already matches the time series watermark, and the
+      first month whose rows may have changed, None when the whole table was rebuilt. Extending the
+      table only adds windows from the month of the previous watermark on.
+    """
+    state = load_time_series_state(path)
+    features_state = state['features']
+    file_path = TRANSFORMED_DATA_DIR / f"{path}_features_target.parquet"
+    same_windows = (
+        features_state is not None and file_path.exists() and
+        (features_state['n_features'], features_state['step_size'], features_state.get('lag_spec')) ==
+        (n_features, step_size, lag_spec)
+    )
+
+    if same_windows and features_state['watermark'] == state['watermark']:
+        logger.info(f"Feature-target data for {path} is up to date.")
+        return None, None
+    if same_windows:
+        feature_target_df = update_feature_target_data(df_time_series, pd.read_parquet(file_path), n_features, step_size,
+                                                       lag_spec)
+        since = month_start(features_state['watermark'])
+    else:
+        feature_target_df = build_feature_target(df_time_series, n_features, step_size, lag_spec)
+        since = None
+
+    save_dataframe(feature_target_df, TRANSFORMED_DATA_DIR, f"{path}_features_target.parquet", "Saved transformed feature-target data to", logger)
+    state['features'] = {'n_features': n_features, 'step_size': step_size, 'lag_spec': lag_spec,
+                         'watermark': state['watermark']}
+    save_time_series_state(state, path)
+    return feature_target_df, since
+
+def month_start(key) -> pd.Timestamp:
+    """First hour of a 'YYYY-MM' month key of the incremental state."""
+    return pd.Timestamp(f"{key}-01")
+
+def changed_rows(df, since, new_zones=()):
+    """
+    Rows of `df` from `since` on, i.e. those of the feature store partitions to rewrite, and every row of
+    `new_zones`, whose earlier hours were zero-filled and never written. All rows if `since` is None.
+    """
+    if since is None:
+        return df
+    return df[(df['pickup_hour'] >= since) | df['PULocationID'].isin(list(new_zones))]
+
+def saved_zones(file_path) -> set:
+    """PULocationIDs of a saved time series or feature-target table, empty if it does not exist."""
+    if not Path(file_path).exists():
+        return set()
+    return set(pd.read_parquet(file_path, columns=['PULocationID'])['PULocationID'].unique())
+
+def build_time_series(path, profiler, logger, years=None):
+    """
+    Aggregate the filtered months of a path, those of `years` if given, to hourly counts and densify
+    them, as two profiled stages.
+    """
+    with profiler.stage('group') as record:
+        df_grouped = aggregate_filtered_data(path, years=years)
+        record['rows_in'] = int(df_grouped['rides'].sum())
+        record['rows_out'] = len(df_grouped)
+    if df_grouped.empty:
+        return df_grouped
+
+    with profiler.stage('densify', rows_in=len(df_grouped)) as record:
+        df_time_series = add_missing_slots(df_grouped)
+        record['rows_out'] = len(df_time_series)
+    logger.info(f"Data transformed to time-series format for {path}")
+    return df_time_series
+
+def build_profiled_feature_target(df_time_series, n_features, step_size, profiler, lag_spec=None):
+    """`build_feature_target` as the profiled 'window' stage."""
+    with profiler.stage('window', rows_in=len(df_time_series)) as record:
+        feature_target_df = build_feature_target(df_time_series, n_features, step_size, lag_spec)
+        record['rows_out'] = len(feature_target_df)
+    return feature_target_df
+
+def publish(df, key, cache, path, name, directory, filename, message, logger, profiler):
+    """
+    Save a stage output to its parquet file and feature group, unless the cache records that this exact
+    output (same stage key) was already written there. Returns True if the output was written.
+    """
+    destination = f"{path}/{name}"
+    if cache is not None and cache.is_published(destination, key) and (Path(directory) / filename).exists():
+        logger.info(f"{name} of {path} is up to date.")
+        return False
+    with profiler.stage(f'save_{name}', rows_in=len(df)):
+        save_dataframe(df, directory, filename, message, logger)
+        write_feature_group(df, name, path)
+    if cache is not None:
+        cache.mark_published(destination, key)
+    return True
+
+# Rough raw size of one month of each taxi type in MB, to schedule types before their data is downloaded
+TYPICAL_MONTH_MB = {GREEN: 1.5, FHV: 20, YELLOW: 50, FHVHV: 450}
+
+def estimated_size(path, years) -> float:
+    """Input size of a taxi type in MB: its raw files on disk, or a typical size per month if there are none."""
+    raw_files = list(RAW_DATA_DIR.glob(f"{path}_*.parquet"))
+    if raw_files:
+        return sum(file_path.stat().st_size for file_path in raw_files) / 2**20
+    return TYPICAL_MONTH_MB.get(path, 50) * 12 * len(years)
+
+def schedule_paths(paths, years) -> list:
+    """
+    Order taxi types largest first. Pool workers take tasks in submission order, so the longest branch
+    (FHVHV is a few hundred times green) starts right away and the small ones fill the other workers
+    around it instead of leaving it to run alone at the end.
+    """
+    return sorted(paths, key=lambda path: estimated_size(path, years), reverse=True)
+
+def run_path(path, n_features=24, step_size=1, incremental=False, years=range(2022, 2025), use_cache=True,
+             profile_stages=(), profiler='cprofile', run_id=None, fetch=True, lag_spec=None) -> bool:
+    """
+    Run the pipeline of one taxi type: ingest, time series, feature-target table and training matrix.
+
+    Each taxi type has its own stage cache directory and run report, so branches running in parallel
+    processes never write the same index. With `fetch=False` the filtered months already on disk are used.
+    `lag_spec` selects the feature columns as in `process_feature_target_by_PULocationID`.
+
+    Returns:
+    - True if the taxi type has a time series saved under `TIME_SERIES_DATA_DIR`.
+    """
     logger = get_logger()
-    for path in [YELLOW]:  # Expand paths as needed
-        for year in range(2022, 2025):
-            for month in range(1, 13):
-                fetch_data_if_not_exists(path, year, month)
-                validate_and_process_data(path, year, month)
-        
-        # Transform data to time-series format
-        df_time_series = transform_to_time_series_data(path, logger)
-        if df_time_series.empty:
-            continue
-
-        # Save the final transformed time-series data
-        save_dataframe(df_time_series, TIME_SERIES_DATA_DIR, f"{path}_time_series.parquet", "Saved final time-series data to", logger)
-
-        # Transform to feature-target format and save
-        feature_df, target_df = process_feature_target_by_PULocationID(df_time_series, n_features=n_features, step_size=step_size)
-        feature_target_df = feature_df.join(pd.DataFrame(target_df, columns=['target_rides_next_hour']))
-        save_dataframe(feature_target_df, TRANSFORMED_DATA_DIR, f"{path}_features_target.parquet", "Saved transformed feature-target data to", logger)
-        
-        logger.info(f"Pipeline completed for {path}.")
+    cache = StageCache(CACHE_DIR / path) if use_cache and not incremental else None
+    run_profiler = RunProfiler(f"{run_id}_{path}" if run_id else None, profile_stages=profile_stages, profiler=profiler)
+
+    # Download, then filter, all months concurrently as the fetch and validate stages, resuming from the manifest
+    if fetch:
+        ingest_months(path, years, range(1, 13), profiler=run_profiler)
+
+    try:
+        if incremental:
+            run_incremental_path(path, n_features, step_size, run_profiler, logger, lag_spec)
+        else:
+            run_full_path(path, n_features, step_size, years, cache, run_profiler, logger, lag_spec)
+    finally:
+        if cache is not None:
+            cache.log_stats()
+        run_profiler.write_report()
+    return (TIME_SERIES_DATA_DIR / f"{path}_time_series.parquet").exists()
+
+def run_incremental_path(path, n_features, step_size, run_profiler, logger, lag_spec=None):
+    """
+    Merge the filtered months not seen before into the saved time series and extend the feature-target table.
+
+    Only the rows of the months that changed, and the whole history of zones seen for the first time, are
+    written to the feature groups, so the other zone/month partitions are left untouched.
+    """
+    months_before = set(load_time_series_state(path)['months'])
+    time_series_zones = saved_zones(TIME_SERIES_DATA_DIR / f"{path}_time_series.parquet")
+    features_target_zones = saved_zones(TRANSFORMED_DATA_DIR / f"{path}_features_target.parquet")
+    with run_profiler.stage('update_time_series') as record:
+        df_time_series, changed = update_time_series_data(path, logger)
+        record['rows_out'] = len(df_time_series)
+    if df_time_series.empty:
+        return
+    if changed:
+        state = load_time_series_state(path)
+        new_months = sorted(set(state['months']) - months_before)
+        # A rebuilt time series (first run, backfilled month, file rewritten by a full run) resets the
+        # feature state, and all its partitions are written again
+        since = month_start(new_months[0]) if state['features'] is not None else None
+        new_zones = set(df_time_series['PULocationID'].unique()) - time_series_zones
+        df_changed = changed_rows(df_time_series, since, new_zones)
+        with run_profiler.stage('save_time_series', rows_in=len(df_changed)):
+            write_feature_group(df_changed, 'time_series', path)
+    with run_profiler.stage('window', rows_in=len(df_time_series)) as record:
+        feature_target_df, since = update_feature_target(path, df_time_series, n_features, step_size, logger, lag_spec)
+        record['rows_out'] = len(feature_target_df) if feature_target_df is not None else 0
+    if feature_target_df is not None:
+        new_zones = set(feature_target_df['PULocationID'].unique()) - features_target_zones
+        df_changed = changed_rows(feature_target_df, since, new_zones)
+        with run_profiler.stage('save_features_target', rows_in=len(df_changed)):
+            write_feature_group(df_changed, 'features_target', path)
+        with run_profiler.stage('export_training_matrix', rows_in=len(feature_target_df)):
+            export_training_matrix(feature_target_df, TRANSFORMED_DATA_DIR / f"{path}_training_matrix")
+    logger.info(f"Pipeline completed for {path}.")
+
+def time_series_stage(path, years, cache, profiler, logger):
+    """
+    `build_time_series` of the months of `years` of a path, read back from `cache` when those filtered
+    months did not change.
+
+    Returns:
+    - (df_time_series, key): the time series and its cache key, None without a cache.
+    """
+    if cache is None:
+        return build_time_series(path, profiler, logger, years), None
+    filtered_files = [
+        FILTERED_DATA_DIR / f"{path}_{year}-{str(month).zfill(2)}.parquet"
+        for year, month in list_filtered_months(path, years=years)
+    ]
+    return cache.get_or_compute(
+        'time_series', build_time_series, path, profiler, logger, years,
+        inputs=filtered_files,
+        params={'path': path, 'years': sorted(years)},
+        # This module holds the stage functions themselves
+        code=code_version(src.extract, src.transform, src.schema, sys.modules[__name__]),
+    )
+
+def feature_target_stage(df_time_series, time_series_key, n_features, step_size, cache, profiler, lag_spec=None):
+    """
+    `build_profiled_feature_target` of a time series, read back from `cache` for the same time series
+    key and parameters.
+
+    Returns:
+    - (feature_target_df, key): the table and its cache key, None without a cache.
+    """
+    if cache is None:
+        return build_profiled_feature_target(df_time_series, n_features, step_size, profiler, lag_spec), None
+    return cache.get_or_compute(
+        'features_target', build_profiled_feature_target, df_time_series, n_features, step_size, profiler, lag_spec,
+        params={'time_series': time_series_key, 'n_features': n_features, 'step_size': step_size, 'lag_spec': lag_spec},
+        code=code_version(src.transform, src.schema, sys.modules[__name__]),
+    )
+
+def run_full_path(path, n_features, step_size, years, cache, run_profiler, logger, lag_spec=None):
+    """Rebuild the time series and feature-target table of a path, through the stage cache if given."""
+    # Transform data to time-series format
+    df_time_series, time_series_key = time_series_stage(path, years, cache, run_profiler, logger)
+    if df_time_series.empty:
+        return
+
+    # Save the final transformed time-series data
+    publish(df_time_series, time_series_key, cache, path, 'time_series', TIME_SERIES_DATA_DIR,
+            f"{path}_time_series.parquet", "Saved final time-series data to", logger, run_profiler)
+
+    # Transform to feature-target format and save
+    feature_target_df, feature_target_key = feature_target_stage(df_time_series, time_series_key, n_features, step_size,
+                                                                  cache, run_profiler, lag_spec)
+    published = publish(feature_target_df, feature_target_key, cache, path, 'features_target', TRANSFORMED_DATA_DIR,
+                        f"{path}_features_target.parquet", "Saved transformed feature-target data to", logger, run_profiler)
+    if published or not (TRANSFORMED_DATA_DIR / f"{path}_training_matrix").exists():
+        with run_profiler.stage('export_training_matrix', rows_in=len(feature_target_df)):
+            export_training_matrix(feature_target_df, TRANSFORMED_DATA_DIR / f"{path}_training_matrix")
+
+    logger.info(f"Pipeline completed for {path}.")
+
+def combine_paths(paths, logger) -> pd.DataFrame:
+    """
+    Join step: sum the saved time series of `paths` into the all-types demand series per zone, saved as
+    `{ALL_TRIPDATA}_time_series.parquet` and the 'combined_time_series' feature group.
+    """
+    files = [TIME_SERIES_DATA_DIR / f"{path}_time_series.parquet" for path in paths]
+    df_combined = combine_time_series(pd.read_parquet(file_path) for file_path in files if file_path.exists())
+    if df_combined.empty:
+        logger.warning("No time series to combine.")
+        return df_combined
+    save_dataframe(df_combined, TIME_SERIES_DATA_DIR, f"{ALL_TRIPDATA}_time_series.parquet",
+                   "Saved combined time-series data to", logger)
+    write_feature_group(df_combined, 'combined_time_series', ALL_TRIPDATA)
+    return df_combined
+
+def run_pipeline(n_features=24, step_size=1, incremental=False, years=range(2022, 2025), use_cache=True,
+                 profile_stages=(), profiler='cprofile', paths=(YELLOW,), n_workers=None, fetch=True, lag_spec=None):
+    """
+    Runs the data processing pipeline for each PATH.
+
+    Taxi types are independent branches run by `run_path` in a pool of `n_workers` processes (one per
+    type and CPU by default), submitted largest first by `schedule_paths`. Once every branch is done,
+    the time series of all types are summed into one demand series per zone by `combine_paths`.
+    With `fetch=False` nothing is downloaded and only the filtered months already on disk are used.
+    With a `lag_spec` (e.g. `DEFAULT_LAG_SPEC`) the feature-target tables only hold its lags and rolling
+    features instead of all `n_features` lags.
+
+    With `incremental=True` only filtered months that were not processed before are aggregated and
+    merged into the saved time series, and only the new windows of the feature-target table are computed.
+
+    Otherwise, with `use_cache=True`, the time series and feature-target stages go through a `StageCache`
+    keyed on the filtered files, the stage parameters and the code of the transform modules: unchanged
+    stages are read back from the cache and outputs already published are not written again.
+
+    Every stage is measured by a `RunProfiler` whose report is saved under `REPORTS_DIR`, one per type;
+    the stages named in `profile_stages` are also profiled with `profiler` ('cprofile' or 'pyinstrument').
+    """
+    logger = get_logger()
+    if lag_spec is not None:
+        # Fail before any branch starts rather than after its ingestion
+        validate_lag_spec(lag_spec)
+    paths = schedule_paths(paths, years)
+    n_workers = min(len(paths), n_workers or os.cpu_count())
+    run_id = datetime.now().strftime('run_%Y%m%d_%H%M%S')
+    branch = partial(run_path, n_features=n_features, step_size=step_size, incremental=incremental, years=years,
+                     use_cache=use_cache, profile_stages=profile_stages, profiler=profiler, run_id=run_id, fetch=fetch,
+                     lag_spec=lag_spec)
+
+    logger.info(f"Running the pipeline for {paths} with {n_workers} workers")
+    if n_workers == 1:
+        results = [branch(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = list(executor.map(branch, paths))
+
+    if len(paths) > 1:
+        combine_paths([path for path, has_time_series in zip(paths, results) if has_time_series], logger)
 
 if __name__ == '__main__':
-    run_pipeline(n_features=24*28, step_size=23)
+    parser = argparse.ArgumentParser(description='Run the taxi demand data pipeline.')
+    parser.add_argument('--incremental', action='store_true', help='Only process filtered months not seen before.')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute every stage instead of using the stage cache.')
+    parser.add_argument('--profile', nargs='*', default=[], metavar='STAGE',
+                        help='Stages to profile, e.g. group densify window.')
+    parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile')
+    parser.add_argument('--paths', nargs='+', choices=TAXI_TYPES, default=[YELLOW], help='Taxi types to process.')
+    parser.add_argument('--workers', type=int, default=None, help='Taxi types processed in parallel.')
+    parser.add_argument('--lags', nargs='+', default=None, metavar='LAG',
+                        help='Only compute these lags, e.g. 1-24 168 336 504 672. Every lag if omitted.')
+    parser.add_argument('--rolling-windows', nargs='*', type=int, default=[], metavar='HOURS',
+                        help='Windows of the rolling mean and max features added to --lags.')
+    args = parser.parse_args()
+
+    try:
+        lag_spec = parse_lag_spec(args.lags, args.rolling_windows) if args.lags else None
+    except ValueError as error:
+        parser.error(str(error))
+    run_pipeline(n_features=24*28, step_size=23, incremental=args.incremental, use_cache=not args.no_cache,
+                 profile_stages=args.profile, profiler=args.profiler, paths=args.paths, n_workers=args.workers,
+                 lag_spec=lag_spec)
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import resource
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+import pandas as pd
+from src.logger import get_logger
+from src.paths import REPORTS_DIR
+
+logger = get_logger()
+
+REPORT_COLUMNS = [
+    'stage', 'started_at', 'wall_seconds', 'cpu_seconds', 'child_cpu_seconds', 'peak_rss_mb',
+    'rows_in', 'rows_out', 'bytes_read', 'bytes_written', 'profile',
+]
+
+def _read_proc(name: str) -> dict:
+    """Parse a `key: value` file of /proc/self into a dict, empty where /proc is not available."""
+    try:
+        with open(f'/proc/self/{name}') as f:
+            return {key: value.strip() for key, value in (line.split(':', 1) for line in f if ':' in line)}
+    except OSError:
+        return {}
+
+def _io_counters() -> tuple:
+    """Bytes read and written by this process so far, files and sockets alike (`rchar`/`wchar`)."""
+    io = _read_proc('io')
+    return int(io.get('rchar', 0)), int(io.get('wchar', 0))
+
+def _reset_peak_rss() -> bool:
+    """Reset the peak RSS of this process so the next reading covers one stage only. Linux only."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_mb() -> float:
+    hwm = _read_proc('status').get('VmHWM')
+    if hwm is not None:
+        return int(hwm.split()[0]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _cpu_seconds(who) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+class RunProfiler:
+    """
+    Per-stage instrumentation of a pipeline run.
+
+    Every `stage` block records its wall time, CPU time (of this process and of the child processes it
+    waited for), peak RSS, bytes read and written, and the rows in and out that the stage reports.
+    `write_report` saves the records as `{report_dir}/{run_id}.json` and `.csv`. Stages named in
+    `profile_stages` are also profiled, with cProfile or, if installed, pyinstrument.
+
+    Stages may be nested: the peak RSS of a stage is the maximum over its whole block, including the
+    stages inside it, although each of those resets the high-water mark of the process.
+    """
+
+    def __init__(self, run_id: str = None, report_dir=REPORTS_DIR, profile_stages: Iterable[str] = (),
+                 profiler: str = 'cprofile'):
+        self.run_id = run_id or datetime.now().strftime('run_%Y%m%d_%H%M%S')
+        self.report_dir = Path(report_dir)
+        self.profile_stages = set(profile_stages)
+        self.profiler = profiler
+        self.records = []
+        self._peaks = []  # peak RSS seen so far by each open stage, innermost last
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = None):
+        """
+        Measure the enclosed block as stage `name`.
+
+        Yields the stage record; set its 'rows_in' / 'rows_out' (and 'bytes_read' / 'bytes_written'
+        for work done in other processes) from inside the block.
+        """
+        record = dict.fromkeys(REPORT_COLUMNS)
+        record.update(stage=name, started_at=datetime.now(timezone.utc).isoformat(), rows_in=rows_in)
+
+        bytes_read, bytes_written = _io_counters()
+        if self._peaks:
+            # The reset below discards the high-water mark the enclosing stage reached until now
+            self._peaks[-1] = max(self._peaks[-1], _peak_rss_mb())
+        peak_reset = _reset_peak_rss()
+        self._peaks.append(0.0)
+        cpu, child_cpu = _cpu_seconds(resource.RUSAGE_SELF), _cpu_seconds(resource.RUSAGE_CHILDREN)
+        profile = self._start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - start
+            record['profile'] = self._stop_profile(name, profile)
+            record['cpu_seconds'] = _cpu_seconds(resource.RUSAGE_SELF) - cpu
+            record['child_cpu_seconds'] = _cpu_seconds(resource.RUSAGE_CHILDREN) - child_cpu
+            peak = max(self._peaks.pop(), _peak_rss_mb())
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            # Without a reset the high-water mark may come from an earlier stage
+            record['peak_rss_mb'] = peak if peak_reset else None
+            end_read, end_written = _io_counters()
+            record['bytes_read'] = (record['bytes_read'] or 0) + end_read - bytes_read
+            record['bytes_written'] = (record['bytes_written'] or 0) + end_written - bytes_written
+
+            self.records.append(record)
+            logger.info(
+                f"Stage {name}: {record['wall_seconds']:.2f}s wall, {record['cpu_seconds']:.2f}s CPU, "
+                f"peak RSS {record['peak_rss_mb'] or 0:.0f} MB, rows {record['rows_in']} -> {record['rows_out']}"
+            )
+
+    def _start_profile(self, name: str):
+        if name not in self.profile_stages:
+            return None
+        if self.profiler == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("pyinstrument is not installed, profiling with cProfile instead.")
+            else:
+                profile = Profiler()
+                profile.start()
+                return profile
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def _stop_profile(self, name: str, profile):
+        if profile is None:
+            return None
+        profile_dir = self.report_dir / self.run_id
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        if isinstance(profile, cProfile.Profile):
+            profile.disable()
+            file_path = profile_dir / f'{name}.prof'
+            profile.dump_stats(file_path)
+        else:
+            profile.stop()
+            file_path = profile_dir / f'{name}.html'
+            file_path.write_text(profile.output_html())
+        logger.info(f"Saved profile of stage {name} to {file_path}")
+        return str(file_path)
+
+    def report(self) -> pd.DataFrame:
+        """The stage records of this run as a DataFrame."""
+        return pd.DataFrame(self.records, columns=REPORT_COLUMNS)
+
+    def write_report(self, append: bool = False) -> Path:
+        """
+        Write the run report to `{report_dir}/{run_id}.json` and `{run_id}.csv`.
+
+        With `append=True` the stages are added to an existing report of the same run, for runs split
+        across processes such as Metaflow steps.
+        """
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        json_path = self.report_dir / f'{self.run_id}.json'
+
+        records = list(self.records)
+        if append and json_path.exists():
+            with open(json_path) as f:
+                records = json.load(f)['stages'] + records
+
+        tmp_path = json_path.with_name(f'{json_path.name}.part')
+        with open(tmp_path, 'w') as f:
+            json.dump({'run_id': self.run_id, 'pid': os.getpid(), 'stages': records}, f, indent=2)
+        os.replace(tmp_path, json_path)
+        pd.DataFrame(records, columns=REPORT_COLUMNS).to_csv(json_path.with_suffix('.csv'), index=False)
+
+        logger.info(f"Saved run report to {json_path}")
+        return json_path
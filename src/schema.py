@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+# Compact dtypes shared by every stage of the data pipeline
+ZONE_DTYPE = np.uint16        # PULocationID goes up to 265
+FEATURE_DTYPE = np.float32    # rides_previous_*, rides_rolling_* and target_rides_next_hour
+ZONE_COLUMNS = ['PULocationID', 'pickup_location_id']
+FEATURE_PREFIXES = ('rides_previous_', 'rides_rolling_', 'target_rides_')
+
+def count_dtype(counts) -> np.dtype:
+    """Smallest signed integer dtype (int16 or int32) that holds every value of `counts`."""
+    counts = np.asarray(counts)
+    if counts.size == 0 or counts.max() <= np.iinfo(np.int16).max:
+        return np.dtype(np.int16)
+    return np.dtype(np.int32)
+
+def compact_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast the known pipeline columns of a DataFrame to their compact dtypes, in place.
+
+    - 'PULocationID' / 'pickup_location_id': uint16
+    - 'rides': int16, or int32 if an hourly count does not fit
+    - 'rides_previous_*' / 'rides_rolling_*' / 'target_rides_next_hour': float32
+    - 'type': dictionary-encoded (category)
+
+    Other columns, timestamps included, are left as they are.
+
+    Args:
+    - df: A DataFrame from any stage of the pipeline.
+
+    Returns:
+    - The same DataFrame with compact dtypes.
+    """
+    for column in ZONE_COLUMNS:
+        if column in df.columns and df[column].dtype != ZONE_DTYPE:
+            df[column] = df[column].astype(ZONE_DTYPE)
+
+    if 'rides' in df.columns:
+        dtype = count_dtype(df['rides'])
+        if df['rides'].dtype != dtype:
+            df['rides'] = df['rides'].astype(dtype)
+
+    feature_columns = [
+        column for column in df.columns
+        if column.startswith(FEATURE_PREFIXES) and df[column].dtype != FEATURE_DTYPE
+    ]
+    if feature_columns:
+        df[feature_columns] = df[feature_columns].astype(FEATURE_DTYPE)
+
+    if 'type' in df.columns and not isinstance(df['type'].dtype, pd.CategoricalDtype):
+        df['type'] = df['type'].astype('category')
+
+    return df
@@ -0,0 +1,226 @@
+import argparse
+import time
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+import litserve as ls
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from src.feature_store import last_pickup_hour, read_feature_group, read_latest_hours
+from src.logger import get_logger
+from src.paths import MODELS_DIR, YELLOW
+from src.transform import lag_features, lag_spec_columns, lag_spec_span, parse_lag_spec
+
+logger = get_logger()
+
+N_FEATURES = 24 * 28
+
+class RideHistoryBuffer:
+    """
+    Ring buffer holding the latest `n_hours` hourly ride counts of every zone.
+
+    Appending an hour overwrites the oldest column in place, so keeping the history current costs
+    one column write per hour instead of shifting the whole window. With a `lag_spec` the feature rows
+    hold its columns instead of every lag, as in `process_feature_target_by_PULocationID`.
+    """
+
+    def __init__(self, location_ids, last_hour: pd.Timestamp, n_hours: int = N_FEATURES, lag_spec=None):
+        if lag_spec is not None and lag_spec_span(lag_spec) > n_hours - 1:
+            raise ValueError(f"The lag specification reads {lag_spec_span(lag_spec)} hours, more than the {n_hours - 1} hours of the feature rows")
+        self.location_ids = np.asarray(location_ids)
+        self.n_hours = n_hours
+        self.lag_spec = lag_spec
+        self.last_hour = pd.Timestamp(last_hour)
+        self.counts = np.zeros((len(self.location_ids), n_hours), dtype=np.float32)
+        self.position = 0  # column of the oldest hour
+        self._rows = pd.Index(self.location_ids)
+
+    @classmethod
+    def from_time_series(cls, df_time_series: pd.DataFrame, n_hours: int = N_FEATURES, lag_spec=None) -> 'RideHistoryBuffer':
+        """Fill a buffer with the last `n_hours` of a dense time series as returned by `add_missing_slots`."""
+        last_hour = df_time_series['pickup_hour'].max()
+        hours = pd.date_range(end=last_hour, periods=n_hours, freq='h')
+        recent = df_time_series[df_time_series['pickup_hour'] >= hours[0]]
+        matrix = (
+            recent.pivot(index='PULocationID', columns='pickup_hour', values='rides')
+            .reindex(columns=hours, fill_value=0)
+            .fillna(0)
+        )
+        buffer = cls(matrix.index.to_numpy(), last_hour, n_hours, lag_spec)
+        buffer.counts[:] = matrix.to_numpy(dtype=np.float32)
+        return buffer
+
+    def append(self, pickup_hour: pd.Timestamp, rides: pd.Series):
+        """
+        Push the counts of the hour following `last_hour`, overwriting the oldest one.
+
+        Args:
+        - pickup_hour: The hour of the counts, must be `last_hour` + 1 hour.
+        - rides: Rides per PULocationID. Zones missing from it get 0, unknown zones are ignored.
+        """
+        pickup_hour = pd.Timestamp(pickup_hour)
+        if pickup_hour != self.last_hour + pd.Timedelta(hours=1):
+            raise ValueError(f"Expected counts for {self.last_hour + pd.Timedelta(hours=1)}, got {pickup_hour}")
+
+        column = rides.reindex(self.location_ids, fill_value=0).to_numpy(dtype=np.float32)
+        self.counts[:, self.position] = column
+        self.position = (self.position + 1) % self.n_hours
+        self.last_hour = pickup_hour
+
+    def windows(self, zones) -> np.ndarray:
+        """Return the history of `zones`, oldest hour first, as a (len(zones), n_hours) float32 array."""
+        rows = self._rows.get_indexer(zones)
+        if (rows < 0).any():
+            raise KeyError(f"Unknown PULocationIDs: {list(np.asarray(zones)[rows < 0])}")
+        order = (self.position + np.arange(self.n_hours)) % self.n_hours
+        return self.counts[rows[:, None], order[None, :]]
+
+    def features(self, zones) -> pd.DataFrame:
+        """
+        Build the feature rows that predict the hour after `last_hour` for `zones`, with the same
+        columns as `process_feature_target_by_PULocationID`.
+
+        A row of that table with `pickup_hour` h holds the hours before h and targets h + 1, so the rows
+        are labelled `last_hour` and hold the `n_hours` - 1 hours before it.
+        """
+        block = np.ascontiguousarray(self.windows(zones)[:, :-1])
+        if self.lag_spec is not None:
+            # Each zone's window ends right before its pickup hour, as in `build_latest_windows`
+            anchors = np.arange(1, len(block) + 1) * block.shape[1]
+            features = pd.DataFrame(lag_features(block.ravel(), anchors, self.lag_spec),
+                                    columns=lag_spec_columns(self.lag_spec), copy=False)
+        else:
+            features = pd.DataFrame(block, columns=[f'rides_previous_{i+1}' for i in reversed(range(self.n_hours - 1))],
+                                    copy=False)
+        features['pickup_hour'] = self.last_hour
+        features['PULocationID'] = np.asarray(zones)
+        return features
+
+class ZonesRequest(BaseModel):
+    """Body of a prediction request. Requests without a list of integer zones are rejected with a 422."""
+    zones: list[int]
+
+class NextHourDemandAPI(ls.LitAPI):
+    """
+    litserve API answering "predict next hour for zones X".
+
+    Requests look like {"zones": [43, 161]}. With batching enabled, the zones of every request in a
+    batch are scored in a single `predict` call of the pipeline. A request naming zones without history
+    is answered with a 422 on its own, the other requests of its batch are still scored.
+
+    Every `refresh_interval` seconds the hours written since the last one of the history, e.g. by the
+    incremental pipeline, are appended to it, so predictions follow the latest data without a restart.
+    A model trained with a `lag_spec` is served with the same one.
+    """
+
+    def __init__(self, model_path=MODELS_DIR / 'lgbm_model.joblib', time_series_path=None, path: str = YELLOW,
+                 n_features: int = N_FEATURES, refresh_interval: float = 300, lag_spec=None):
+        super().__init__()
+        self.model_path = Path(model_path)
+        self.time_series_path = Path(time_series_path) if time_series_path else None
+        self.path = path
+        self.n_features = n_features
+        self.refresh_interval = refresh_interval
+        self.lag_spec = lag_spec
+
+    def setup(self, device):
+        self.model = joblib.load(self.model_path)
+        if self.time_series_path:
+            df_time_series = pd.read_parquet(self.time_series_path)
+        else:
+            df_time_series = read_latest_hours('time_series', self.path, self.n_features + 1)
+        # The windows of the next hour end one hour before the last one, see `RideHistoryBuffer.features`
+        self.history = RideHistoryBuffer.from_time_series(df_time_series, self.n_features + 1, self.lag_spec)
+        self.refreshed_at = time.monotonic()
+        logger.info(f"Loaded {self.model_path.name} with history up to {self.history.last_hour}")
+
+    def new_hours(self) -> pd.DataFrame:
+        """Read the rows of the hours after the last one of the history."""
+        start = self.history.last_hour + pd.Timedelta(hours=1)
+        if self.time_series_path:
+            return pd.read_parquet(self.time_series_path, filters=[('pickup_hour', '>=', start)])
+        last_hour = last_pickup_hour('time_series', self.path)
+        if last_hour is None or last_hour < start:
+            return pd.DataFrame(columns=['pickup_hour', 'PULocationID', 'rides'])
+        return read_feature_group('time_series', self.path, start=start, end=last_hour + pd.Timedelta(hours=1))
+
+    def refresh(self):
+        """Append the new hours of the time series to the history, oldest first."""
+        df_new = self.new_hours()
+        for pickup_hour, df_hour in df_new.groupby('pickup_hour', sort=True):
+            self.history.append(pickup_hour, df_hour.set_index('PULocationID')['rides'])
+        self.refreshed_at = time.monotonic()
+        if not df_new.empty:
+            logger.info(f"Extended the history up to {self.history.last_hour}")
+
+    def decode_request(self, request: ZonesRequest):
+        # Raising here would fail every request of the batch, unknown zones are answered in `encode_response`
+        known = np.isin(request.zones, self.history.location_ids)
+        return {'zones': request.zones, 'unknown': [zone for zone, ok in zip(request.zones, known) if not ok]}
+
+    def batch(self, inputs):
+        return inputs
+
+    def predict(self, x):
+        # Without batching `x` is the decoded request itself
+        batched = isinstance(x, list)
+        requests = x if batched else [x]
+
+        if time.monotonic() - self.refreshed_at >= self.refresh_interval:
+            self.refresh()
+        scored = [request for request in requests if not request['unknown']]
+        zones = np.concatenate([np.asarray(request['zones'], dtype=np.int64) for request in scored] or [np.empty(0, np.int64)])
+        predictions = self.model.predict(self.history.features(zones)) if len(zones) else np.empty(0)
+
+        split_points = np.cumsum([len(request['zones']) for request in scored])[:-1]
+        parts = iter(np.split(predictions, split_points))
+        outputs = [(request, None if request['unknown'] else next(parts)) for request in requests]
+        return outputs if batched else outputs[0]
+
+    def unbatch(self, output):
+        return output
+
+    def encode_response(self, output):
+        request, predictions = output
+        if request['unknown']:
+            return JSONResponse(status_code=422, content={'detail': f"Unknown PULocationIDs: {request['unknown']}"})
+        return {
+            'pickup_hour': str(self.history.last_hour + pd.Timedelta(hours=1)),
+            'predictions': {str(zone): float(prediction) for zone, prediction in zip(request['zones'], predictions)},
+        }
+
+def serve(model_path, time_series_path=None, path=YELLOW, port=8000, max_batch_size=32, batch_timeout=0.005, workers=1,
+          refresh_interval=300, lag_spec=None):
+    """Start the next-hour demand server, with the history of `path` from the feature store unless a time series file is given."""
+    api = NextHourDemandAPI(model_path, time_series_path, path, refresh_interval=refresh_interval, lag_spec=lag_spec)
+    server = ls.LitServer(
+        api,
+        accelerator='cpu',
+        max_batch_size=max_batch_size,
+        batch_timeout=batch_timeout,
+        workers_per_device=workers,
+    )
+    server.run(port=port, generate_client_file=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve next-hour taxi demand predictions.')
+    parser.add_argument('--model', default=MODELS_DIR / 'lgbm_model.joblib')
+    parser.add_argument('--path', default=YELLOW, help='Dataset read from the time_series feature group.')
+    parser.add_argument('--time-series', default=None, help='Time series parquet file to read instead of the feature store.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--batch-timeout', type=float, default=0.005)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--refresh-interval', type=float, default=300, help='Seconds between reloads of the new hours.')
+    parser.add_argument('--lags', nargs='+', default=None, metavar='LAG', help='Lags the model was trained on.')
+    parser.add_argument('--rolling-windows', nargs='*', type=int, default=[], metavar='HOURS',
+                        help='Rolling windows the model was trained on.')
+    args = parser.parse_args()
+    try:
+        lag_spec = parse_lag_spec(args.lags, args.rolling_windows) if args.lags else None
+    except ValueError as error:
+        parser.error(str(error))
+
+    serve(args.model, args.time_series, args.path, args.port, args.max_batch_size, args.batch_timeout, args.workers,
+          args.refresh_interval, lag_spec)
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import hashlib
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+import pandas as pd
+from src.logger import get_logger
+from src.paths import CACHE_DIR
+
+logger = get_logger()
+
+# Bump to invalidate every entry, e.g. after changing the cached file format
+CACHE_VERSION = 1
+
+def file_fingerprint(file_path) -> list:
+    """Cheap fingerprint of an input file: name, size and modification time in nanoseconds."""
+    stat = Path(file_path).stat()
+    return [Path(file_path).name, stat.st_size, stat.st_mtime_ns]
+
+def code_version(*modules) -> str:
+    """Hash of the source files of `modules`, so that editing a stage's code invalidates its entries."""
+    digest = hashlib.sha256(str(CACHE_VERSION).encode())
+    for module in modules:
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()[:16]
+
+class StageCache:
+    """
+    Content-addressed store of pipeline stage outputs under `cache_dir`.
+
+    An entry is keyed on the fingerprints of the stage inputs, its parameters and its code version,
+    so changing any of them computes the stage again instead of reusing a stale output. Outputs are
+    parquet files under `cache_dir/{stage}/{key}.parquet`, indexed with their size and last access time
+    in `cache_dir/index.json`; the least recently used entries are evicted once the total size exceeds
+    `max_bytes`.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes: int = 2 * 1024**3):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.index_path = self.cache_dir / 'index.json'
+        self.index = self._load_index()
+        self._evict()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def key(self, stage: str, inputs: Iterable = (), params: Optional[dict] = None, code: str = '') -> str:
+        """Hash the input file fingerprints, the parameters and the code version of a stage."""
+        payload = {
+            'stage': stage,
+            'inputs': [file_fingerprint(file_path) for file_path in inputs],
+            'params': params or {},
+            'code': code,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, stage: str, key: str) -> Optional[pd.DataFrame]:
+        """Return the cached output of `stage` for `key`, or None on a miss."""
+        entry = self.index['entries'].get(key)
+        file_path = self.cache_dir / entry['file'] if entry else None
+        if file_path is None or not file_path.exists():
+            self.misses[stage] += 1
+            return None
+
+        self.hits[stage] += 1
+        entry['last_access'] = time.time()
+        self._save_index()
+        return pd.read_parquet(file_path)
+
+    def put(self, stage: str, key: str, df: pd.DataFrame):
+        """Store the output of `stage` for `key`, then evict entries until the cache fits `max_bytes`."""
+        file_path = self.cache_dir / stage / f'{key}.parquet'
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = file_path.with_name(f'{file_path.name}.part')
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, file_path)
+
+        self.index['entries'][key] = {
+            'stage': stage,
+            'file': str(file_path.relative_to(self.cache_dir)),
+            'size': file_path.stat().st_size,
+            'last_access': time.time(),
+        }
+        self._evict(keep=key)
+        self._save_index()
+
+    def get_or_compute(self, stage: str, func: Callable, *args, inputs: Iterable = (),
+                       params: Optional[dict] = None, code: str = '', **kwargs):
+        """
+        Return the cached output of a stage, computing and storing it with `func(*args, **kwargs)` on a miss.
+
+        Returns:
+        - A (DataFrame, key) tuple. The key can be passed in the `params` of a downstream stage.
+        """
+        key = self.key(stage, inputs, params, code)
+        df = self.get(stage, key)
+        if df is not None:
+            logger.info(f"Cache hit for {stage} ({key[:12]})")
+            return df, key
+
+        logger.info(f"Cache miss for {stage} ({key[:12]}), computing it")
+        df = func(*args, **kwargs)
+        self.put(stage, key, df)
+        return df, key
+
+    def is_published(self, name: str, key: str) -> bool:
+        """Whether the output of `key` is the one last written to the destination `name`."""
+        return self.index['published'].get(name) == key
+
+    def mark_published(self, name: str, key: str):
+        """Record that the output of `key` was written to the destination `name`, e.g. a feature group."""
+        self.index['published'][name] = key
+        self._save_index()
+
+    def stats(self) -> dict:
+        """Hits and misses per stage since this cache was opened."""
+        return {
+            stage: {'hits': self.hits[stage], 'misses': self.misses[stage]}
+            for stage in sorted(set(self.hits) | set(self.misses))
+        }
+
+    def log_stats(self):
+        """Log the hits and misses per stage and the size of the cache."""
+        size_mb = sum(entry['size'] for entry in self.index['entries'].values()) / 2**20
+        logger.info(f"Stage cache: {self.stats()}, {len(self.index['entries'])} entries, {size_mb:.1f} MB")
+
+    def _evict(self, keep: Optional[str] = None):
+        entries = self.index['entries']
+        total = sum(entry['size'] for entry in entries.values())
+        for key in sorted(entries, key=lambda key: entries[key]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            entry = entries.pop(key)
+            (self.cache_dir / entry['file']).unlink(missing_ok=True)
+            total -= entry['size']
+            logger.info(f"Evicted {entry['stage']} ({key[:12]}) from the stage cache")
+
+    def _load_index(self) -> dict:
+        if not self.index_path.exists():
+            return {'entries': {}, 'published': {}}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def _save_index(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_name(f'{self.index_path.name}.part')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
@@ -2,6 +2,8 @@ from datetime import datetime
 from typing import Tuple
 import pandas as pd
 from src.logger import get_logger
+from src.feature_store import read_feature_group
+from src.training_matrix import TrainingMatrix
 
 def train_test_split(
         df: pd.DataFrame,
@@ -59,6 +61,58 @@ def create_training_sets(PATH, cutoff_date, target_column_name):
 
     return training_sets
 
+def create_training_sets_from_store(PATH, cutoff_date, target_column_name, zones=None, start=None, end=None):
+    """
+    Generate separate training and testing sets for each PULocationID from the local feature store.
+
+    Unlike `create_training_sets`, each location only reads its own partitions of the
+    'features_target' feature group instead of the whole table.
+
+    :param PATH: Identifier for the dataset, e.g. YELLOW.
+    :param cutoff_date: The cutoff date for splitting into train/test sets.
+    :param target_column_name: The name of the target column.
+    :param zones: PULocationIDs to build sets for. All stored zones if None.
+    :param start: First pickup_hour to read, inclusive. No lower bound if None.
+    :param end: Last pickup_hour to read, exclusive. No upper bound if None.
+    :return: A dictionary where each PULocationID has its (X_train, X_test, y_train, y_test).
+    """
+    logger = get_logger()
+    if zones is None:
+        zones = read_feature_group('features_target', PATH, columns=['PULocationID'])['PULocationID'].unique()
+
+    training_sets = {}
+    for pulocation_id in zones:
+        logger.info(f"Processing PULocationID: {pulocation_id}")
+
+        location_data = read_feature_group('features_target', PATH, zones=[pulocation_id], start=start, end=end)
+        location_data.drop(columns=['PULocationID'], inplace=True)
+        X_train, X_test, y_train, y_test = train_test_split(
+            location_data,
+            cutoff_date,
+            target_column_name
+        )
+
+        training_sets[pulocation_id] = (X_train, X_test, y_train, y_test)
+
+    return training_sets
+
+def create_training_sets_from_matrix(directory, cutoff_date, zones=None):
+    """
+    Generate separate training and testing sets for each PULocationID from a training matrix.
+
+    Unlike `create_training_sets`, nothing is decoded up front: each location's sets wrap memory-mapped
+    views of the matrix written by `export_training_matrix`, split with a binary search on pickup_hour
+    instead of boolean masks over a DataFrame.
+
+    :param directory: Directory of the training matrix, e.g. TRANSFORMED_DATA_DIR / f'{PATH}_training_matrix'.
+    :param cutoff_date: The cutoff date for splitting into train/test sets.
+    :param zones: PULocationIDs to build sets for. All zones of the matrix if None.
+    :return: A dictionary where each PULocationID has its (X_train, y_train, X_test, y_test).
+    """
+    matrix = TrainingMatrix(directory)
+    zones = matrix.zones() if zones is None else zones
+    return {int(zone): matrix.train_test_split(cutoff_date, [zone]) for zone in zones}
+
 def get_cutoff_training_date(data: pd.DataFrame, n_months=6) -> pd.Timestamp:
     """
     Determines the cutoff date for training data based on a specified number of months before the latest date in the dataset.
@@ -0,0 +1,196 @@
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+from src.logger import get_logger
+
+logger = get_logger()
+
+ARRAYS = ('features', 'target', 'pickup_hour', 'PULocationID')
+
+def arrays_fingerprint(arrays: Iterable[np.ndarray]) -> str:
+    """SHA-256 of the content of `arrays`, identifying a training matrix without engineering its features."""
+    digest = hashlib.sha256()
+    for array in arrays:
+        # Raw bytes: datetime64 arrays do not export a buffer
+        digest.update(np.ascontiguousarray(array).view(np.uint8).data)
+    return digest.hexdigest()
+
+def export_training_matrix(df: pd.DataFrame, directory, target_column_name: str = 'target_rides_next_hour',
+                           order: str = 'zone') -> Path:
+    """
+    Write a feature-target table as a training matrix: one C-contiguous float32 `features.npy` with
+    `target.npy`, `pickup_hour.npy` and `PULocationID.npy` sidecars and a `metadata.json` holding,
+    among others, the `arrays_fingerprint` of the four arrays.
+
+    Args:
+    - df: Feature-target table as built by `process_feature_target_by_PULocationID`.
+    - directory: Directory of the training matrix. It is replaced as a whole.
+    - target_column_name: The name of the target column.
+    - order: 'zone' sorts rows by PULocationID then pickup_hour, so one zone's rows are contiguous;
+      'time' sorts by pickup_hour then PULocationID, so a time split of all zones is contiguous.
+
+    Returns:
+    - The directory of the training matrix.
+    """
+    sort_columns = {'zone': ['PULocationID', 'pickup_hour'], 'time': ['pickup_hour', 'PULocationID']}[order]
+    directory = Path(directory)
+    tmp_dir = directory.with_name(f'{directory.name}.part')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    df = df.sort_values(sort_columns, kind='stable')
+    feature_columns = [column for column in df.columns if column not in ('pickup_hour', 'PULocationID', target_column_name)]
+
+    arrays = {
+        'features': np.ascontiguousarray(df[feature_columns].to_numpy(dtype=np.float32)),
+        'target': df[target_column_name].to_numpy(dtype=np.float32),
+        'pickup_hour': df['pickup_hour'].to_numpy(dtype='datetime64[ns]'),
+        'PULocationID': df['PULocationID'].to_numpy(dtype=np.uint16),
+    }
+    for name in ARRAYS:
+        np.save(tmp_dir / f'{name}.npy', arrays[name])
+
+    zones, starts, counts = np.unique(df['PULocationID'].to_numpy(), return_index=True, return_counts=True)
+    metadata = {
+        'columns': list(df.columns.drop([target_column_name, 'PULocationID'])),
+        'target_column_name': target_column_name,
+        'order': order,
+        'n_rows': len(df),
+        'fingerprint': arrays_fingerprint(arrays[name] for name in ARRAYS),
+        'zone_rows': {int(zone): [int(start), int(start + count)] for zone, start, count in zip(zones, starts, counts)}
+                     if order == 'zone' else {},
+    }
+    with open(tmp_dir / 'metadata.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    # Readers never see a half-written matrix
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    logger.info(f"Saved training matrix of {len(df)} rows x {len(feature_columns)} features to {directory}")
+    return directory
+
+class TrainingMatrix:
+    """
+    Read side of `export_training_matrix`.
+
+    The arrays are memory-mapped, so opening a matrix reads nothing but its metadata, and row ranges
+    come back as views of the mapped files rather than copies.
+    """
+
+    def __init__(self, directory, mmap: bool = True):
+        self.directory = Path(directory)
+        with open(self.directory / 'metadata.json') as f:
+            self.metadata = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        for name in ARRAYS:
+            setattr(self, name if name != 'PULocationID' else 'location_ids',
+                    np.load(self.directory / f'{name}.npy', mmap_mode=mmap_mode))
+        self.columns = self.metadata['columns']
+        self.feature_columns = [column for column in self.columns if column != 'pickup_hour']
+        self.target_column_name = self.metadata['target_column_name']
+        self.zone_rows = {int(zone): tuple(rows) for zone, rows in self.metadata['zone_rows'].items()}
+
+    def __len__(self):
+        return self.metadata['n_rows']
+
+    @property
+    def fingerprint(self) -> str:
+        """The `arrays_fingerprint` recorded at export, computed from the arrays for older matrices."""
+        if 'fingerprint' not in self.metadata:
+            self.metadata['fingerprint'] = arrays_fingerprint(
+                [self.features, self.target, self.pickup_hour, self.location_ids]
+            )
+        return self.metadata['fingerprint']
+
+    def zones(self) -> np.ndarray:
+        """The PULocationIDs in the matrix."""
+        if self.zone_rows:
+            return np.array(sorted(self.zone_rows))
+        return np.unique(self.location_ids)
+
+    def rows(self, zones: Optional[Iterable[int]] = None):
+        """
+        Rows of `zones`, or all rows if None.
+
+        Returns a slice when the rows are contiguous (all rows, or a single zone of a 'zone'-ordered
+        matrix), so indexing with it yields views; otherwise an array of row indices.
+        """
+        if zones is None:
+            return slice(0, len(self))
+        zones = [int(zone) for zone in zones]
+        if self.zone_rows:
+            ranges = [self.zone_rows[zone] for zone in zones if zone in self.zone_rows]
+            if len(ranges) == 1:
+                return slice(*ranges[0])
+            return np.concatenate([np.arange(start, end) for start, end in ranges]) if ranges else np.empty(0, dtype=np.int64)
+        return np.flatnonzero(np.isin(self.location_ids, zones))
+
+    def between(self, start=None, end=None):
+        """
+        Rows with `start` <= pickup_hour < `end`, either bound being optional.
+
+        A slice (views) for a 'time'-ordered matrix, an array of row indices otherwise.
+        """
+        start = np.datetime64(pd.Timestamp(start), 'ns') if start is not None else None
+        end = np.datetime64(pd.Timestamp(end), 'ns') if end is not None else None
+        if self.metadata['order'] == 'time':
+            first = int(np.searchsorted(self.pickup_hour, start, side='left')) if start is not None else 0
+            last = int(np.searchsorted(self.pickup_hour, end, side='left')) if end is not None else len(self)
+            return slice(first, max(first, last))
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.pickup_hour >= start
+        if end is not None:
+            mask &= self.pickup_hour < end
+        return np.flatnonzero(mask)
+
+    def split_rows(self, cutoff_date, zones: Optional[Iterable[int]] = None) -> tuple:
+        """
+        Split the rows of `zones` into the ones before and from `cutoff_date`.
+
+        Rows within a zone ('zone' order) or overall ('time' order) are sorted by pickup_hour, so the
+        split is a binary search and both halves stay slices wherever `rows` returns one.
+        """
+        rows = self.rows(zones)
+        cutoff = np.datetime64(pd.Timestamp(cutoff_date), 'ns')
+        if isinstance(rows, slice):
+            hours = self.pickup_hour[rows]
+            if self.metadata['order'] == 'time' or zones is not None:
+                middle = rows.start + int(np.searchsorted(hours, cutoff, side='left'))
+                return slice(rows.start, middle), slice(middle, rows.stop)
+            rows = np.arange(rows.start, rows.stop)
+        before = self.pickup_hour[rows] < cutoff
+        return rows[before], rows[~before]
+
+    def arrays(self, rows) -> tuple:
+        """(features, target) arrays of `rows`; views for slices, copies for index arrays."""
+        return self.features[rows], self.target[rows]
+
+    def frame(self, rows) -> tuple:
+        """
+        (X, y) of `rows` with the columns of the feature-target table minus PULocationID, as expected
+        by `get_pipeline`. The features block of X wraps the array of `arrays` without copying it.
+        """
+        features, target = self.arrays(rows)
+        X = pd.DataFrame(features, columns=self.feature_columns, copy=False)
+        X.insert(self.columns.index('pickup_hour'), 'pickup_hour', self.pickup_hour[rows])
+        y = pd.Series(target, name=self.target_column_name, copy=False)
+        return X, y
+
+    def train_test_split(self, cutoff_date, zones: Optional[Iterable[int]] = None, as_frame: bool = True) -> tuple:
+        """
+        Time-based split of the rows of `zones`, like `training.train_test_split` on the table.
+
+        Returns:
+        - (X_train, y_train, X_test, y_test), as DataFrames/Series or, with `as_frame=False`, arrays.
+        """
+        train_rows, test_rows = self.split_rows(cutoff_date, zones)
+        take = self.frame if as_frame else self.arrays
+        X_train, y_train = take(train_rows)
+        X_test, y_test = take(test_rows)
+        return X_train, y_train, X_test, y_test
@@ -1,15 +1,82 @@
 import os
+import re
+import json
+from pathlib import Path
 import pandas as pd
-from tqdm import tqdm
 import numpy as np
+import pyarrow.dataset as ds
 from src.logger import get_logger
-from src.extract import concatenate_filtered_data
+from src.extract import list_filtered_months
+from src.paths import FILTERED_DATA_DIR, TIME_SERIES_DATA_DIR
+from src.schema import compact_schema, count_dtype
+from src.stage_cache import file_fingerprint
 
 logger = get_logger()
 # Step 1: Function to add the 'pickup_hour' column and group data by 'pickup_hour' and 'PULocationID'
+def count_rides_per_hour(pickup_datetime, location_ids, rides=None) -> pd.DataFrame:
+    """
+    Count rides per hour and location without flooring datetimes or grouping in pandas.
+
+    Timestamps are divided as epoch integers into hour buckets, each (hour, location) pair is packed
+    into one integer key, and the keys are counted with `np.bincount` over the hour x location grid.
+    When the grid would be much larger than the input (e.g. a few stray timestamps years away) the keys
+    are counted with `np.unique` instead. Rows with a missing timestamp or location are dropped, like
+    in `groupby`.
+
+    Args:
+    - pickup_datetime: Pickup timestamps, datetime64 of any unit.
+    - location_ids: The PULocationID of each ride.
+    - rides: Optional weight of each row, to merge partial counts instead of counting rides.
+
+    Returns:
+    - A DataFrame with the number of rides for each 'pickup_hour' and 'PULocationID', sorted by both,
+      as returned by `process_filtered_dataframe`.
+    """
+    timestamps = np.asarray(pickup_datetime)
+    zones = np.asarray(location_ids)
+    unit, _ = np.datetime_data(timestamps.dtype)
+    ticks_per_hour = np.timedelta64(1, 'h') // np.timedelta64(1, unit)
+
+    ticks = timestamps.view(np.int64)
+    valid = ticks != np.iinfo(np.int64).min  # NaT
+    if zones.dtype.kind == 'f':
+        valid &= ~np.isnan(zones)
+    if not valid.all():
+        ticks, zones = ticks[valid], zones[valid]
+        rides = np.asarray(rides)[valid] if rides is not None else None
+
+    if len(ticks) == 0:
+        return compact_schema(pd.DataFrame({
+            'pickup_hour': np.empty(0, dtype=timestamps.dtype),
+            'PULocationID': np.empty(0, dtype=zones.dtype),
+            'rides': np.empty(0, dtype=np.int64),
+        }))
+
+    hours = ticks // ticks_per_hour
+    zone_ids = zones.astype(np.int64)
+    first_hour, first_zone = hours.min(), zone_ids.min()
+    n_zones = int(zone_ids.max() - first_zone) + 1
+    n_slots = (int(hours.max() - first_hour) + 1) * n_zones
+
+    keys = (hours - first_hour) * n_zones + (zone_ids - first_zone)
+    if n_slots <= max(4 * len(keys), 1 << 22):
+        counts = np.bincount(keys, weights=rides, minlength=n_slots)
+        slots = np.flatnonzero(counts)
+        counts = counts[slots]
+    else:
+        slots, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=rides)
+
+    counts = counts.astype(np.int64)
+    return compact_schema(pd.DataFrame({
+        'pickup_hour': ((slots // n_zones + first_hour) * ticks_per_hour).view(timestamps.dtype),
+        'PULocationID': (slots % n_zones + first_zone).astype(zones.dtype),
+        'rides': counts.astype(count_dtype(counts)),
+    }))
+
 def process_filtered_dataframe(df) -> pd.DataFrame:
     """
-    Process a filtered DataFrame by adding a 'pickup_hour' column and grouping the data by 'pickup_hour' and 'PULocationID'.
+    Process a filtered DataFrame by grouping its rides by pickup hour and 'PULocationID'.
 
     Args:
 
@@ -20,58 +87,193 @@ def process_filtered_dataframe(df) -> pd.DataFrame:
     - A DataFrame with the number of rides for each 'pickup_hour' and 'PULocationID'.
 
     """
-    # Add a column for the pickup hour
-    df['pickup_hour'] = df['pickup_datetime'].dt.floor('h')
+    return count_rides_per_hour(df['pickup_datetime'], df['PULocationID'])
+
+def _merge_counts(partials) -> pd.DataFrame:
+    """Sum partial (pickup_hour, PULocationID) ride counts of `count_rides_per_hour` into one table."""
+    partials = [partial for partial in partials if len(partial)]
+    if len(partials) == 1:
+        return partials[0]
+    if not partials:
+        return pd.DataFrame(columns=['pickup_hour', 'PULocationID', 'rides'])
+    df = pd.concat(partials, ignore_index=True)
+    return count_rides_per_hour(df['pickup_hour'], df['PULocationID'], df['rides'].to_numpy(dtype=np.int64))
+
+def aggregate_filtered_month(path, year, month, filtered_dir=FILTERED_DATA_DIR, batch_size=1_000_000) -> pd.DataFrame:
+    """
+    Count the rides of one filtered month per 'pickup_hour' and 'PULocationID', one record batch at a time.
 
-    # Group by pickup hour and PULocationID, count the number of rides
-    df_grouped = df.groupby(['pickup_hour', 'PULocationID']).size().reset_index(name='rides')
-    
+    Only the pickup columns are decoded, and each batch of at most `batch_size` rides is reduced to
+    hourly counts before the next one is read, so memory is bounded by the batch size and the number of
+    (hour, zone) slots rather than by the number of rides in the file.
+
+    Args:
+    - path: Identifier for the dataset.
+    - year, month: The month to aggregate.
+    - filtered_dir: Directory of the filtered monthly files.
+    - batch_size: Maximum number of rides decoded at once.
+
+    Returns:
+    - A DataFrame with the number of rides for each 'pickup_hour' and 'PULocationID'.
+    """
+    file_path = Path(filtered_dir) / f"{path}_{year}-{str(month).zfill(2)}.parquet"
+    dataset = ds.dataset(file_path, format='parquet')
+
+    partials = [
+        count_rides_per_hour(
+            batch.column('pickup_datetime').to_numpy(zero_copy_only=False),
+            batch.column('pickup_location_id').to_numpy(zero_copy_only=False),
+        )
+        for batch in dataset.to_batches(columns=['pickup_datetime', 'pickup_location_id'], batch_size=batch_size)
+    ]
+    return _merge_counts(partials)
+
+def aggregate_filtered_data(path, filtered_dir=FILTERED_DATA_DIR, batch_size=1_000_000, years=None) -> pd.DataFrame:
+    """
+    Streaming equivalent of `process_filtered_dataframe(concatenate_filtered_data(path))`.
+
+    Every filtered month is reduced to hourly counts with `aggregate_filtered_month` before the next one
+    is read and the monthly counts are summed at the end, so the ride table is never held in memory as a
+    whole: peak memory depends on the number of zones x hours, not on the number of rides.
+
+    Args:
+    - path: Identifier for the dataset.
+    - filtered_dir: Directory of the filtered monthly files.
+    - batch_size: Maximum number of rides decoded at once.
+    - years: Only aggregate the months of these years. Every filtered month if None.
+
+    Returns:
+    - A DataFrame with the number of rides for each 'pickup_hour' and 'PULocationID'.
+    """
+    # Each month holds at most zones x hours-in-month slots, so the partials stay bounded by the grid
+    df_grouped = _merge_counts([
+        aggregate_filtered_month(path, year, month, filtered_dir, batch_size)
+        for year, month in list_filtered_months(path, filtered_dir, years)
+    ])
+    if df_grouped.empty:
+        logger.warning("No data available to aggregate.")
     return df_grouped
 
 # Step 2: Function to add missing slots (time series transformation)
-def add_missing_slots(df_grouped) -> pd.DataFrame:
+def build_dense_matrix(df_grouped):
+    """
+    Scatter the grouped rides into a dense hour x location matrix in a single pass.
+
+    Args:
+    - df_grouped: A DataFrame with the number of rides for each 'pickup_hour' and 'PULocationID'.
+
+    Returns:
+    - matrix: An int32 NumPy array of shape (n_hours, n_locations) with the rides of each slot,
+      zero where no ride was recorded.
+    - pickup_hours: A DatetimeIndex with the hour of each matrix row.
+    - location_ids: A NumPy array with the PULocationID of each matrix column, in order of first appearance.
+    """
+    pickup_hour = df_grouped['pickup_hour'].to_numpy().astype('datetime64[h]')
+    first_hour = pickup_hour.min()
+    n_hours = int((pickup_hour.max() - first_hour).astype(np.int64)) + 1
+
+    # Hours become row offsets and location ids become column indices
+    hour_offsets = (pickup_hour - first_hour).astype(np.int64)
+    location_columns, location_ids = pd.factorize(df_grouped['PULocationID'])
+
+    matrix = np.zeros((n_hours, len(location_ids)), dtype=np.int32)
+    np.add.at(matrix, (hour_offsets, location_columns), df_grouped['rides'].to_numpy(dtype=np.int32))
+
+    pickup_hours = pd.date_range(start=df_grouped['pickup_hour'].min(), periods=n_hours, freq='h')
+
+    return matrix, pickup_hours, location_ids.to_numpy()
+
+def dense_matrix_to_long(matrix, pickup_hours, location_ids) -> pd.DataFrame:
+    """
+    Convert a dense hour x location matrix back into the long format returned by `add_missing_slots`.
+
+    Args:
+    - matrix: Array of shape (n_hours, n_locations) as returned by `build_dense_matrix`.
+    - pickup_hours: The hour of each matrix row.
+    - location_ids: The PULocationID of each matrix column.
+
+    Returns:
+    - A DataFrame with columns ['pickup_hour', 'rides', 'PULocationID'], one block of hours per location,
+      in the compact schema of `compact_schema`.
+    """
+    n_hours, n_locations = matrix.shape
+
+    return compact_schema(pd.DataFrame({
+        'pickup_hour': np.tile(np.asarray(pickup_hours), n_locations),
+        'rides': matrix.T.ravel().astype(count_dtype(matrix)),
+        'PULocationID': np.repeat(location_ids, n_hours),
+    }))
+
+def time_series_to_dense_matrix(df_time_series):
+    """
+    Reshape a dense time series as returned by `add_missing_slots` into its hour x location matrix
+    without re-scattering the rows. Raises a ValueError when the rows are not the same consecutive hours
+    for every location, e.g. a slice of a feature group in which some zones miss hours.
+
+    Args:
+    - df_time_series: A DataFrame with one block of consecutive hours per 'PULocationID'.
+
+    Returns:
+    - The (matrix, pickup_hours, location_ids) tuple of `build_dense_matrix`, with the rides dtype of `df_time_series`.
+    """
+    location_ids = df_time_series['PULocationID'].unique()
+    n_hours = len(df_time_series) // len(location_ids)
+    pickup_hours = pd.DatetimeIndex(df_time_series['pickup_hour'].iloc[:n_hours])
+    complete = (
+        n_hours * len(location_ids) == len(df_time_series) and
+        (pickup_hours == pd.date_range(pickup_hours[0], periods=n_hours, freq='h')).all() and
+        np.array_equal(df_time_series['pickup_hour'].to_numpy(), np.tile(pickup_hours.to_numpy(), len(location_ids))) and
+        np.array_equal(df_time_series['PULocationID'].to_numpy(), np.repeat(location_ids, n_hours))
+    )
+    if not complete:
+        raise ValueError(
+            f"Time series is not a complete grid of consecutive hours x {len(location_ids)} locations "
+            f"({len(df_time_series)} rows)"
+        )
+    matrix = df_time_series['rides'].to_numpy().reshape(len(location_ids), n_hours).T
+    return matrix, pickup_hours, location_ids
+
+def add_missing_slots(df_grouped, as_matrix=False):
     """
     Add missing slots to the time series data by filling in zeros for missing hours.
 
+    The full grid is built at once with `build_dense_matrix` instead of reindexing every location separately.
+
     Args:
     - df_grouped: A DataFrame with the number of rides for each 'pickup_hour' and 'PULocationID'.
+    - as_matrix: If True, return the dense (matrix, pickup_hours, location_ids) tuple of `build_dense_matrix`
+      instead of the long DataFrame, so later stages can work on the matrix directly.
 
     Returns:
     - A DataFrame with all missing hours filled in with zeros for each 'PULocationID'.
     """
-    location_ids = df_grouped['PULocationID'].unique()
-    full_range = pd.date_range(
-        start=df_grouped['pickup_hour'].min(), end=df_grouped['pickup_hour'].max(), freq='h'
-    )
-    
-    output_list = []  # Use a list for better performance
-    
-    for location_id in tqdm(location_ids):
-        # Filter only rides for this location
-        df_location = df_grouped.loc[df_grouped['PULocationID'] == location_id, ['pickup_hour', 'rides']]
-        
-        # Add missing dates with 0 in rides
-        df_location = df_location.set_index('pickup_hour').reindex(full_range).fillna(0).reset_index()
-        df_location = df_location.rename(columns={'index': 'pickup_hour'})  # Rename the reindexed column
-        
-        # Add the location ID back
-        df_location['PULocationID'] = location_id
-        
-        # Append to the list instead of concatenating in each iteration
-        output_list.append(df_location)
-    
-    # Concatenate all at once
-    output = pd.concat(output_list, ignore_index=True)
+    dense = build_dense_matrix(df_grouped)
+    if as_matrix:
+        return dense
 
-    # Ensure the DataFrame is well-formed and reset index correctly
-    output = output.reset_index(drop=True)
-    
-    return output
+    return dense_matrix_to_long(*dense)
+
+def combine_time_series(time_series) -> pd.DataFrame:
+    """
+    Sum the hourly time series of several taxi types into one demand series per zone.
+
+    The series may cover different hours and zones; the sum is densified again over their union.
+
+    Args:
+    - time_series: DataFrames with 'pickup_hour', 'PULocationID' and 'rides', as built by `add_missing_slots`.
+
+    Returns:
+    - The combined dense time series, empty if every input is.
+    """
+    df_grouped = _merge_counts(list(time_series))
+    if df_grouped.empty:
+        return df_grouped
+    return add_missing_slots(df_grouped)
 
 def transform_to_time_series_data(path,logger):
     """
     Transforms filtered data for a specific path into time-series format by
-    concatenating, filling missing slots, and grouping data.
+    aggregating the filtered months one at a time and filling missing slots.
 
     Args:
         path (str): Identifier for the dataset.
@@ -80,11 +282,11 @@ def transform_to_time_series_data(path,logger):
     Returns:
         pd.DataFrame: Transformed time-series DataFrame.
     """
-    # Concatenate filtered data
-    df_filtered = concatenate_filtered_data(path)
-
-    # Process and group data
-    df_grouped = add_missing_slots(process_filtered_dataframe(df_filtered))
+    # Stream the filtered months into hourly counts
+    df_grouped = aggregate_filtered_data(path)
+    if df_grouped.empty:
+        return df_grouped
+    df_grouped = add_missing_slots(df_grouped)
     logger.info(f"Data transformed to time-series format for {path}")
     
     return df_grouped
@@ -149,69 +351,418 @@ def create_feature_matrix_and_target(df, cutoff_indices):
 
 
 # Step 5: Function to process a parquet file by PULocationID
-def process_feature_target_by_PULocationID(df, n_features, step_size=1):
+def build_window_index(df, n_features, step_size=1) -> dict:
     """
-    Process data by PULocationID and apply sliding window transformation for each PULocationID.
-    
+    Lay out the sliding windows of every PULocationID over one contiguous rides array without
+    materializing them.
+
+    Locations keep their order of first appearance and hours are sorted within each location. The
+    windows are those of `get_cutoff_indices`: start `s` gives features [s, s + n_features) and the
+    target at `s + n_features + 1`, stepping by `step_size`.
+
     Args:
     - df: DataFrame containing the time series data with columns ['PULocationID', 'rides', 'pickup_hour'].
     - n_features: Number of previous time steps to use as features.
     - step_size: Step size for sliding window.
-    
+
     Returns:
-    - A DataFrame with PULocationID, features, and target.
+    - A dictionary with the sorted float32 'rides' and 'pickup_hours', the 'location_ids', the start
+      of every window in 'window_starts', its location code in 'window_location', and 'n_features'.
     """
-    
     assert set(df.columns) == {'pickup_hour', 'rides', 'PULocationID'}
 
-    unique_pulocation_ids = df['PULocationID'].unique()
-    features = pd.DataFrame()
-    targets = pd.DataFrame()
+    location_codes, unique_pulocation_ids = pd.factorize(df['PULocationID'])
+    order = np.lexsort((df['pickup_hour'].to_numpy(), location_codes))
 
     logger.info(f"Processing {len(unique_pulocation_ids)} unique PULocationIDs...")
+
+    # First row of every location inside the sorted arrays
+    location_lengths = np.bincount(location_codes, minlength=len(unique_pulocation_ids))
+    location_offsets = np.concatenate(([0], np.cumsum(location_lengths)[:-1]))
+
+    n_windows = np.where(
+        location_lengths >= n_features + 2,
+        (location_lengths - n_features - 2) // step_size + 1,
+        0
+    )
+    window_location = np.repeat(np.arange(len(unique_pulocation_ids)), n_windows)
+    window_rank = np.arange(n_windows.sum()) - np.repeat(np.cumsum(n_windows) - n_windows, n_windows)
+
+    return {
+        'rides': df['rides'].to_numpy(dtype=np.float32)[order],
+        'pickup_hours': df['pickup_hour'].to_numpy()[order],
+        'location_ids': unique_pulocation_ids.to_numpy(),
+        'window_starts': location_offsets[window_location] + window_rank * step_size,
+        'window_location': window_location,
+        'n_features': n_features,
+    }
+
+def window_features(window_index, windows=slice(None)) -> np.ndarray:
+    """
+    Gather the feature rows of `windows` (a slice or an array of window positions) into one float32 block.
+
+    Windows are read from a zero-copy strided view of the rides array, so only the requested rows are
+    allocated.
+    """
+    rides, n_features = window_index['rides'], window_index['n_features']
+    window_starts = window_index['window_starts'][windows]
+    if len(rides) < n_features:
+        return np.empty((0, n_features), dtype=np.float32)
+    return np.lib.stride_tricks.sliding_window_view(rides, n_features)[window_starts]
+
+# Lags 1-24 and the same hour 1 to 4 weeks back (the lags of `average_rides_last_4_weeks`), with the
+# mean and max of the last day and week
+DEFAULT_LAG_SPEC = {
+    'lags': list(range(1, 25)) + [168, 336, 504, 672],
+    'mean_windows': [24, 168],
+    'max_windows': [24, 168],
+}
+
+# Lags averaged by `average_rides_last_4_weeks`, which every model pipeline computes
+REQUIRED_LAGS = [24 * 7 * week for week in range(1, 5)]
+
+LAG_PATTERN = re.compile(r'(\d+)(?:-(\d+))?')
+
+def validate_lag_spec(lag_spec: dict) -> dict:
+    """
+    Check that a lag specification can be computed and fed to `get_pipeline`: its lags and windows are
+    integers of at least 1 hour, and its lags include `REQUIRED_LAGS`.
+
+    Returns:
+    - The lag specification.
+    """
+    for name in ('lags', 'mean_windows', 'max_windows'):
+        invalid = [value for value in lag_spec.get(name, ()) if not isinstance(value, (int, np.integer)) or value < 1]
+        if invalid:
+            raise ValueError(f"The {name.replace('_', ' ')} of a lag specification must be integers of at least 1 hour, got {invalid}")
+    missing = [lag for lag in REQUIRED_LAGS if lag not in lag_spec['lags']]
+    if missing:
+        raise ValueError(f"The lag specification must include lags {missing}, which average_rides_last_4_weeks averages")
+    return lag_spec
+
+def parse_lag_spec(lags, windows=()) -> dict:
+    """
+    Lag specification from command line values.
+
+    Args:
+    - lags: Lags or inclusive ranges of lags, e.g. ['1-24', '168', '336', '504', '672'].
+    - windows: Windows, in hours, of the rolling mean and max features.
+
+    Returns:
+    - A lag specification for `process_feature_target_by_PULocationID`, checked by `validate_lag_spec`.
+    """
+    parsed = []
+    for value in lags:
+        match = LAG_PATTERN.fullmatch(str(value).strip())
+        if match is None:
+            raise ValueError(f"Invalid lag '{value}': expected a lag of at least 1 hour, e.g. 168, or a range, e.g. 1-24")
+        first, last = int(match[1]), int(match[2] or match[1])
+        if first > last:
+            raise ValueError(f"Invalid lag range '{value}': the first lag is larger than the last")
+        parsed.extend(range(first, last + 1))
+    windows = [int(window) for window in windows]
+    return validate_lag_spec({'lags': sorted(set(parsed)), 'mean_windows': windows, 'max_windows': windows})
+
+def lag_spec_span(lag_spec: dict) -> int:
+    """Number of past hours a lag specification reads."""
+    return max([*lag_spec['lags'], *lag_spec.get('mean_windows', ()), *lag_spec.get('max_windows', ())])
+
+def lag_spec_columns(lag_spec: dict) -> list:
+    """Feature columns of a lag specification: the lags oldest first as in the dense table, then the rolling features."""
+    return (
+        [f'rides_previous_{lag}' for lag in sorted(lag_spec['lags'], reverse=True)] +
+        [f'rides_rolling_mean_{window}' for window in lag_spec.get('mean_windows', ())] +
+        [f'rides_rolling_max_{window}' for window in lag_spec.get('max_windows', ())]
+    )
+
+def _rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    max(values[i:i + window]) for every i, in log2(window) vectorized passes: maxima over spans of
+    1, 2, 4... are combined pairwise, and the window is covered by two overlapping power-of-two spans.
+    """
+    maxima, span = values, 1
+    while span * 2 <= window:
+        maxima = np.maximum(maxima[:-span], maxima[span:])
+        span *= 2
+    return np.maximum(maxima[:len(values) - window + 1], maxima[window - span:])
+
+def lag_features(rides: np.ndarray, anchors: np.ndarray, lag_spec: dict) -> np.ndarray:
+    """
+    Feature block of a lag specification, gathered directly from a contiguous rides array.
+
+    Row i describes the hour at position `anchors[i]`: lag k is `rides[anchors[i] - k]`, and the
+    rolling features of window w cover `rides[anchors[i] - w:anchors[i]]`. Rolling means are
+    differences of one float64 cumulative sum, rolling maxima gathers from `_rolling_max`.
+
+    Args:
+    - rides: The float32 rides of all locations back to back.
+    - anchors: Position of the hour of each row. The `lag_spec_span` hours before it must belong to
+      the same location.
+    - lag_spec: Dictionary with the 'lags' and optionally the 'mean_windows' and 'max_windows' in hours.
+
+    Returns:
+    - A float32 array with the columns of `lag_spec_columns`.
+    """
+    lags = sorted(lag_spec['lags'], reverse=True)
+    mean_windows, max_windows = lag_spec.get('mean_windows', ()), lag_spec.get('max_windows', ())
+    features = np.empty((len(anchors), len(lags) + len(mean_windows) + len(max_windows)), dtype=np.float32)
+    if len(anchors) == 0:
+        return features
+
+    for column, lag in enumerate(lags):
+        features[:, column] = rides[anchors - lag]
+    column = len(lags)
+    if mean_windows:
+        cumulative = np.concatenate(([0.0], np.cumsum(rides, dtype=np.float64)))
+        for window in mean_windows:
+            features[:, column] = (cumulative[anchors] - cumulative[anchors - window]) / window
+            column += 1
+    for window in max_windows:
+        features[:, column] = _rolling_max(rides, window)[anchors - window]
+        column += 1
+    return features
+
+def windows_to_frame(window_index, windows=slice(None), lag_spec=None):
+    """
+    Build the rows `windows` of the feature-target table from a `build_window_index` layout.
+
+    With a `lag_spec` only its columns are computed, by `lag_features`, instead of every lag of the window.
+
+    Returns:
+    - The (features, targets) of `process_feature_target_by_PULocationID` for those rows, indexed by
+      their position in the full table.
+    """
+    n_features = window_index['n_features']
+    window_starts = window_index['window_starts'][windows]
+    n_windows = len(window_index['window_starts'])
+    if isinstance(windows, slice):
+        index = pd.RangeIndex.from_range(range(n_windows)[windows])
+    else:
+        index = pd.Index(np.arange(n_windows)[windows])
+
+    if lag_spec is not None:
+        features = pd.DataFrame(
+            lag_features(window_index['rides'], window_starts + n_features, lag_spec),
+            columns=lag_spec_columns(lag_spec),
+            index=index,
+        )
+    else:
+        features = pd.DataFrame(
+            window_features(window_index, windows),
+            columns=[f'rides_previous_{i+1}' for i in reversed(range(n_features))],
+            index=index,
+        )
+    features['pickup_hour'] = window_index['pickup_hours'][window_starts + n_features]
+    features['PULocationID'] = window_index['location_ids'][window_index['window_location'][windows]]
+    features = compact_schema(features)
+
+    targets = pd.Series(window_index['rides'][window_starts + n_features + 1], name='target_rides_next_hour', index=index)
+
+    return features, targets
+
+def process_feature_target_by_PULocationID(df, n_features, step_size=1, lag_spec=None):
+    """
+    Process data by PULocationID and apply sliding window transformation for each PULocationID.
+
+    The windows are read from zero-copy strided views over one contiguous rides array
+    (all locations back to back) and gathered into a single pre-allocated feature matrix,
+    so the cost is linear in the number of samples instead of one `iloc` and one `pd.concat`
+    per window and location. `WindowDataset` serves the same rows lazily, in batches.
+
+    With a `lag_spec` (see `DEFAULT_LAG_SPEC`) the rows are the same but only the listed lags and
+    rolling features are computed, e.g. 32 columns instead of 672.
+
+    Args:
+    - df: DataFrame containing the time series data with columns ['PULocationID', 'rides', 'pickup_hour'].
+    - n_features: Number of previous time steps to use as features. With a `lag_spec`, the length of
+      the windows, which must cover its `lag_spec_span`.
+    - step_size: Step size for sliding window.
+    - lag_spec: Lags and rolling windows to compute, checked by `validate_lag_spec`. Every lag from 1 to
+      `n_features` if None.
     
-    for pulocation_id in tqdm(unique_pulocation_ids):
-        df_location = df[df['PULocationID'] == pulocation_id].sort_values('pickup_hour')
-         # keep only ts data for this `location_id`
-        df_location = df_location.loc[
-            df_location['PULocationID'] == pulocation_id, 
-            ['pickup_hour', 'rides']
-        ]
-
-        if len(df_location) < n_features:
-            continue
-
-        # Get cut indices with `step_size`
-        cutoff_indices = get_cutoff_indices(df_location, n_features, step_size)
-
-        # Pre-allocate arrays for features and targets
-        n_examples = len(cutoff_indices)
-        feature_matrix = np.ndarray((n_examples, n_features), dtype=np.float32)
-        target_vector = np.ndarray((n_examples,), dtype=np.float32)
-        pickup_hours = []
-
-        # Assembles `feature_matrix` and `target_vector`
-        for i, (start_idx, mid_idx, end_idx) in enumerate(cutoff_indices):
-            feature_matrix[i, :] = df_location.iloc[start_idx:mid_idx]['rides'].values
-            target_vector[i] = df_location.iloc[end_idx]['rides']
-            pickup_hours.append(df_location.iloc[mid_idx]['pickup_hour'])
-
-        # Creates DataFrames of features and targets
-        df_location = pd.DataFrame(
-            feature_matrix,
-            columns=[f'rides_previous_{i+1}' for i in reversed(range(n_features))]
+    Returns:
+    - A DataFrame with PULocationID, features, and target.
+    """
+    if lag_spec is not None and lag_spec_span(validate_lag_spec(lag_spec)) > n_features:
+        raise ValueError(f"The lag specification reads {lag_spec_span(lag_spec)} hours, more than n_features={n_features}")
+    return windows_to_frame(build_window_index(df, n_features, step_size), lag_spec=lag_spec)
+
+
+# Step 6: Incremental updates when new months arrive
+def load_time_series_state(path, time_series_dir=TIME_SERIES_DATA_DIR) -> dict:
+    """
+    Load the incremental state of a path: the months already aggregated, the watermark (latest month
+    merged into the time series), the `file_fingerprint` of the time series file written with them and,
+    under 'features', the window parameters and watermark of the saved feature-target table.
+    """
+    state_path = Path(time_series_dir) / f"{path}_time_series_state.json"
+    if not state_path.exists():
+        return {'months': [], 'watermark': None, 'time_series_file': None, 'features': None}
+    with open(state_path) as f:
+        return json.load(f)
+
+def save_time_series_state(state, path, time_series_dir=TIME_SERIES_DATA_DIR):
+    """Atomically write the incremental state of a path."""
+    state_path = Path(time_series_dir) / f"{path}_time_series_state.json"
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_name(f'{state_path.name}.part')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+def merge_time_series(df_time_series, df_grouped) -> pd.DataFrame:
+    """
+    Append the grouped rides of later hours to a dense time series, as `add_missing_slots` would
+    have produced from all the grouped rides at once.
+
+    Existing locations keep their order and locations seen for the first time are appended after them,
+    which is their order of first appearance in the full grouped table.
+
+    Args:
+    - df_time_series: A dense time series as returned by `add_missing_slots`.
+    - df_grouped: Rides per 'pickup_hour' and 'PULocationID', all later than the last hour of `df_time_series`.
+
+    Returns:
+    - The dense time series covering both inputs.
+    """
+    old_matrix, old_pickup_hours, location_ids = time_series_to_dense_matrix(df_time_series)
+    n_hours = len(old_pickup_hours)
+    first_hour = old_pickup_hours[0]
+
+    known_locations = pd.Index(location_ids)
+    new_location_ids = pd.Index(df_grouped['PULocationID'].unique()).difference(known_locations, sort=False)
+    all_location_ids = np.concatenate([location_ids, new_location_ids.to_numpy(dtype=location_ids.dtype)])
+
+    last_hour = max(old_pickup_hours[-1], df_grouped['pickup_hour'].max())
+    total_hours = int((last_hour - first_hour) / pd.Timedelta(hours=1)) + 1
+
+    matrix = np.zeros((total_hours, len(all_location_ids)), dtype=np.int32)
+    matrix[:n_hours, :len(location_ids)] = old_matrix
+
+    hour_offsets = ((df_grouped['pickup_hour'] - first_hour) // pd.Timedelta(hours=1)).to_numpy()
+    location_columns = pd.Index(all_location_ids).get_indexer(df_grouped['PULocationID'])
+    np.add.at(matrix, (hour_offsets, location_columns), df_grouped['rides'].to_numpy(dtype=np.int32))
+
+    pickup_hours = pd.date_range(start=first_hour, periods=total_hours, freq='h')
+    return dense_matrix_to_long(matrix, pickup_hours, all_location_ids)
+
+def update_time_series_data(
+        path,
+        logger,
+        filtered_dir=FILTERED_DATA_DIR,
+        time_series_dir=TIME_SERIES_DATA_DIR):
+    """
+    Incrementally build the time series of a path, processing only the filtered months not seen before.
+
+    Every new month is reduced to hourly counts once and stored under `{time_series_dir}/hourly`.
+    When all new months come after the watermark, the saved `{path}_time_series.parquet` is still the
+    file the state was written with, and its last hour precedes the new rides, they are merged into it;
+    otherwise (first run, a backfilled older month, or a file rewritten since, e.g. by a full run) the
+    time series is densified again from the stored hourly aggregates. The updated time series is saved to
+    `{path}_time_series.parquet` and is identical to `transform_to_time_series_data` over the same months.
+
+    Args:
+        path (str): Identifier for the dataset.
+        logger: Logger instance for logging info and errors.
+        filtered_dir (Path): Directory of the filtered monthly files.
+        time_series_dir (Path): Directory of the time series, the hourly aggregates and the state file.
+
+    Returns:
+        tuple: The time series DataFrame (empty if there is no data) and a boolean telling whether it changed.
+    """
+    state = load_time_series_state(path, time_series_dir)
+    hourly_dir = Path(time_series_dir) / 'hourly'
+    time_series_path = Path(time_series_dir) / f"{path}_time_series.parquet"
+
+    new_months = [
+        f"{year}-{str(month).zfill(2)}" for year, month in list_filtered_months(path, filtered_dir)
+        if f"{year}-{str(month).zfill(2)}" not in state['months']
+    ]
+    if not new_months:
+        logger.info(f"No new months for {path}. Time series is up to date.")
+        df_time_series = pd.read_parquet(time_series_path) if time_series_path.exists() else pd.DataFrame()
+        return df_time_series, False
+
+    hourly_dir.mkdir(parents=True, exist_ok=True)
+    new_grouped = []
+    for key in new_months:
+        year, month = map(int, key.split('-'))
+        df_grouped = aggregate_filtered_month(path, year, month, filtered_dir)
+        df_grouped.to_parquet(hourly_dir / f"{path}_{key}.parquet")
+        new_grouped.append(df_grouped)
+    logger.info(f"Aggregated {len(new_months)} new months for {path}: {', '.join(new_months)}")
+
+    df_new = pd.concat(new_grouped, ignore_index=True)
+    appended = (
+        state['watermark'] is not None and min(new_months) > state['watermark'] and time_series_path.exists() and
+        state.get('time_series_file') == file_fingerprint(time_series_path)
+    )
+    if appended:
+        df_saved = pd.read_parquet(time_series_path)
+        # Appending hours the saved series already covers would count their rides twice
+        appended = df_new.empty or df_new['pickup_hour'].min() > df_saved['pickup_hour'].max()
+    if appended:
+        df_time_series = merge_time_series(df_saved, df_new)
+        logger.info(f"Merged {len(new_months)} new months into the time series of {path}")
+    else:
+        all_months = sorted(state['months'] + new_months)
+        df_grouped = pd.concat(
+            [pd.read_parquet(hourly_dir / f"{path}_{key}.parquet") for key in all_months], ignore_index=True
         )
-        df_location['pickup_hour'] = pickup_hours
-        df_location['PULocationID'] = pulocation_id
+        df_time_series = add_missing_slots(df_grouped)
+        # Earlier windows may have shifted, the feature-target table has to be rebuilt
+        state['features'] = None
+        logger.info(f"Rebuilt the time series of {path} from {len(all_months)} hourly aggregates")
+
+    # The time series is written before the state, so an interrupted run merges the months again
+    time_series_path.parent.mkdir(parents=True, exist_ok=True)
+    df_time_series.to_parquet(time_series_path)
+    logger.info(f"Saved final time-series data to {time_series_path}")
+
+    state['months'] = sorted(state['months'] + new_months)
+    state['watermark'] = state['months'][-1]
+    state['time_series_file'] = file_fingerprint(time_series_path)
+    save_time_series_state(state, path, time_series_dir)
 
-        # numpy -> pandas
-        target_vector = pd.DataFrame(target_vector, columns=[f'target_rides_next_hour'])
+    return df_time_series, True
 
-        # Concatenates features and target
-        features = pd.concat([features, df_location])
-        targets = pd.concat([targets, target_vector])
+def update_feature_target_data(df_time_series, df_features_target, n_features, step_size=1, lag_spec=None) -> pd.DataFrame:
+    """
+    Extend a feature-target table after `merge_time_series` appended hours to its time series.
+
+    Windows already in `df_features_target` are kept as they are; only the windows starting after the
+    last existing one of each location are computed, and rows are put back in the order of
+    `process_feature_target_by_PULocationID` over the whole time series.
+
+    Args:
+    - df_time_series: The merged dense time series.
+    - df_features_target: The feature-target table built with the same `n_features` and `step_size`
+      from the time series before the merge.
+    - n_features: Number of previous time steps to use as features.
+    - step_size: Step size for sliding window.
+    - lag_spec: The lag specification of `df_features_target`, None for every lag.
 
-    features.reset_index(inplace=True, drop=True)
-    targets.reset_index(inplace=True, drop=True)
+    Returns:
+    - The feature-target table of the merged time series.
+    """
+    location_ids = df_time_series['PULocationID'].unique()
+    n_hours = len(df_time_series) // len(location_ids)
 
-    return features, targets['target_rides_next_hour']
+    # Position of the first window each location still misses
+    existing_windows = df_features_target['PULocationID'].value_counts()
+    first_new_start = pd.Series(location_ids).map(existing_windows).fillna(0).to_numpy(dtype=np.int64) * step_size
+    hour_position = np.tile(np.arange(n_hours), len(location_ids))
+    keep = hour_position >= np.repeat(first_new_start, n_hours)
+
+    features, targets = process_feature_target_by_PULocationID(
+        df_time_series[keep], n_features=n_features, step_size=step_size, lag_spec=lag_spec
+    )
+    new_features_target = features.join(pd.DataFrame(targets, columns=['target_rides_next_hour']))
+    logger.info(f"Computed {len(new_features_target)} new feature-target rows")
+
+    merged = pd.concat([df_features_target, new_features_target], ignore_index=True)
+    order = np.lexsort((
+        merged['pickup_hour'].to_numpy(),
+        pd.Index(location_ids).get_indexer(merged['PULocationID'])
+    ))
+    return merged.take(order).reset_index(drop=True)
@@ -0,0 +1,273 @@
+import math
+import time
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import TimeSeriesSplit
+from src.logger import get_logger
+from src.model import get_pipeline
+from src.dataset_cache import engineered_arrays, library_of
+from src.parallel_training import with_threads
+from src.training_matrix import TrainingMatrix, export_training_matrix
+
+logger = get_logger()
+
+# (share of the zones, months of history before the cutoff) of each successive-halving rung, None
+# meaning all of the history. The last rung is the full training set.
+FIDELITIES = ((0.25, 3), (0.5, 12), (1.0, None))
+MAX_ROUNDS = 1000
+EARLY_STOPPING_ROUNDS = 20
+
+def fidelity_rows(matrix: TrainingMatrix, cutoff_date, zone_share: float = 1.0, months: Optional[int] = None,
+                  seed: int = 0) -> np.ndarray:
+    """
+    Training rows of one fidelity: a share of the zones and the last `months` before `cutoff_date`.
+
+    Zones are taken from one seeded permutation, so the zones of a smaller share are a subset of
+    those of a larger one. On a 'time'-ordered matrix the rows stay in chronological order.
+    """
+    zones = matrix.zones()
+    if zone_share < 1:
+        n_zones = max(1, round(len(zones) * zone_share))
+        zones = np.sort(np.random.default_rng(seed).permutation(zones)[:n_zones])
+    rows, _ = matrix.split_rows(cutoff_date, zones)
+    rows = np.arange(len(matrix))[rows]
+    if months is not None:
+        start = np.datetime64(pd.Timestamp(cutoff_date) - pd.DateOffset(months=months), 'ns')
+        rows = rows[matrix.pickup_hour[rows] >= start]
+    return rows
+
+def fit_with_early_stopping(model: Callable, hyperparameters: dict, X_train, y_train, X_valid, y_valid,
+                            early_stopping_rounds: int = EARLY_STOPPING_ROUNDS) -> tuple:
+    """
+    Fit `model` and stop boosting once the validation MAE has not improved for `early_stopping_rounds`.
+
+    LightGBM and XGBoost use their native early stopping with `n_estimators` as the upper bound, and
+    predict with the best iteration. Other models are fitted as they are.
+
+    Returns:
+    - (fitted estimator, number of boosting rounds kept), the rounds being None for other models.
+    """
+    library = library_of(model)
+    if library == 'lightgbm':
+        import lightgbm as lgb
+
+        estimator = model(**{**hyperparameters, 'metric': 'l1'})
+        estimator.fit(X_train, y_train, eval_set=[(X_valid, y_valid)],
+                      callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False)])
+        return estimator, estimator.best_iteration_ or estimator.n_estimators
+    if library == 'xgboost':
+        estimator = model(**{**hyperparameters, 'eval_metric': 'mae', 'early_stopping_rounds': early_stopping_rounds})
+        estimator.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+        return estimator, estimator.best_iteration + 1
+    return model(**hyperparameters).fit(X_train, y_train), None
+
+def cross_validate_mae(model: Callable, hyperparameters: dict, X: np.ndarray, y: np.ndarray, n_splits: int = 3,
+                       early_stopping_rounds: int = EARLY_STOPPING_ROUNDS, trial: Optional['optuna.Trial'] = None) -> tuple:
+    """
+    Mean validation MAE over `TimeSeriesSplit` folds, each fold early-stopped on its validation set.
+
+    With a `trial`, the running mean MAE is reported after every fold and the trial is pruned as soon
+    as its pruner decides to, so hopeless hyperparameters skip their remaining, larger folds.
+
+    Returns:
+    - (mean MAE, mean number of boosting rounds kept or None).
+    """
+    import optuna
+
+    maes, rounds = [], []
+    for fold, (train_index, valid_index) in enumerate(TimeSeriesSplit(n_splits=n_splits).split(X)):
+        train, valid = slice(train_index[0], train_index[-1] + 1), slice(valid_index[0], valid_index[-1] + 1)
+        estimator, n_rounds = fit_with_early_stopping(model, hyperparameters, X[train], y[train], X[valid], y[valid],
+                                                      early_stopping_rounds)
+        maes.append(mean_absolute_error(y[valid], estimator.predict(X[valid])))
+        rounds.append(n_rounds)
+        if trial is not None:
+            trial.report(float(np.mean(maes)), fold)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+    return float(np.mean(maes)), round(np.mean(rounds)) if rounds[0] is not None else None
+
+def test_mae(matrix: TrainingMatrix, model: Callable, hyperparameters: dict, cutoff_date) -> float:
+    """Fit the `get_pipeline` pipeline on all rows before `cutoff_date` and return its MAE on the others."""
+    X_train, y_train, X_test, y_test = matrix.train_test_split(cutoff_date)
+    pipeline = get_pipeline(model, **hyperparameters)
+    pipeline.fit(X_train, y_train)
+    return float(mean_absolute_error(y_test, pipeline.predict(X_test)))
+
+def _final_hyperparameters(hyperparameters: dict, n_rounds: Optional[int]) -> dict:
+    """Hyperparameters of the final fit: the boosting rounds kept by early stopping, if any."""
+    return {**hyperparameters, 'n_estimators': n_rounds} if n_rounds is not None else hyperparameters
+
+def _result(method: str, study, hyperparameters: dict, evaluations: list, matrix, model, cutoff_date, start) -> dict:
+    """Refit the best hyperparameters on the full training set and summarize a tuning run."""
+    tuning_seconds = time.perf_counter() - start
+    mae = test_mae(matrix, model, hyperparameters, cutoff_date)
+    logger.info(f"{method}: test MAE {mae:.4f} after {tuning_seconds:.1f}s of tuning with {hyperparameters}")
+    return {
+        'method': method,
+        'study': study,
+        'hyperparameters': hyperparameters,
+        'cv_mae': study.best_value,
+        'test_mae': mae,
+        'tuning_seconds': tuning_seconds,
+        'total_seconds': time.perf_counter() - start,
+        'evaluations': pd.DataFrame(evaluations),
+    }
+
+def tune_with_pruning(
+        df: pd.DataFrame,
+        model: Callable,
+        param_suggestion_func: Callable,
+        cutoff_date,
+        target_column_name: str = 'target_rides_next_hour',
+        n_trials: int = 20,
+        n_splits: int = 3,
+        max_rounds: int = MAX_ROUNDS,
+        early_stopping_rounds: int = EARLY_STOPPING_ROUNDS,
+        pruner: Optional['optuna.pruners.BasePruner'] = None,
+        threads: Optional[int] = None,
+        seed: int = 0) -> dict:
+    """
+    Optuna study on the full training set, with early stopping in every fold and a pruner fed by the
+    running validation MAE after each fold.
+
+    Trials run one after another in this process, each estimator using `threads` threads, because
+    pruning needs the live trial. The features are engineered once for all trials.
+
+    Args:
+    - df: Feature-target table as built by `process_feature_target_by_PULocationID`.
+    - model: Estimator class passed to `get_pipeline`, e.g. LGBMRegressor.
+    - param_suggestion_func: Function mapping a trial to hyperparameters, e.g. `lgbm_param_suggestion`.
+    - cutoff_date: Rows before it are used for tuning, the others for the final test MAE.
+    - target_column_name: The name of the target column.
+    - n_trials: Number of trials.
+    - n_splits: Number of `TimeSeriesSplit` folds per trial.
+    - max_rounds: Upper bound of the boosting rounds of LightGBM and XGBoost.
+    - early_stopping_rounds: Rounds without improvement of the validation MAE before boosting stops.
+    - pruner: Optuna pruner. A `MedianPruner` after 5 complete trials if None.
+    - threads: `n_jobs` of estimators that support it. None leaves it to the estimator.
+    - seed: Seed of the TPE sampler.
+
+    Returns:
+    - A dictionary with the study, the best hyperparameters (with the early-stopped `n_estimators`),
+      their cross-validated and test MAE, the tuning and total seconds, and one row per trial in
+      'evaluations' with its MAE and the seconds elapsed when it ended.
+    """
+    import optuna
+
+    pruner = pruner or optuna.pruners.MedianPruner(n_startup_trials=5)
+    study = optuna.create_study(direction='minimize', sampler=optuna.samplers.TPESampler(seed=seed), pruner=pruner)
+    start = time.perf_counter()
+    evaluations, trial_hyperparameters = [], {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        matrix = TrainingMatrix(export_training_matrix(df, Path(tmp) / 'matrix', target_column_name, order='time'))
+        X, y, _ = engineered_arrays(matrix, fidelity_rows(matrix, cutoff_date))
+
+        def objective(trial):
+            hyperparameters = {**param_suggestion_func(trial), 'n_estimators': max_rounds}
+            hyperparameters = with_threads(model, hyperparameters, threads)
+            evaluation = {'trial': trial.number, 'rows': len(X), 'mae': None, 'n_estimators': None, 'pruned': True}
+            try:
+                evaluation['mae'], n_rounds = cross_validate_mae(model, hyperparameters, X, y, n_splits,
+                                                                 early_stopping_rounds, trial)
+                evaluation.update(n_estimators=n_rounds, pruned=False)
+                trial_hyperparameters[trial.number] = _final_hyperparameters(hyperparameters, n_rounds)
+                return evaluation['mae']
+            finally:
+                evaluation['elapsed_seconds'] = time.perf_counter() - start
+                evaluations.append(evaluation)
+
+        study.optimize(objective, n_trials=n_trials)
+        n_pruned = sum(evaluation['pruned'] for evaluation in evaluations)
+        logger.info(f"Pruned {n_pruned} of {n_trials} trials, best CV MAE {study.best_value:.4f}")
+        return _result('pruning', study, trial_hyperparameters[study.best_trial.number], evaluations, matrix,
+                       model, cutoff_date, start)
+
+def successive_halving(
+        df: pd.DataFrame,
+        model: Callable,
+        param_suggestion_func: Callable,
+        cutoff_date,
+        target_column_name: str = 'target_rides_next_hour',
+        n_trials: int = 27,
+        eta: int = 3,
+        fidelities=FIDELITIES,
+        n_splits: int = 3,
+        max_rounds: int = MAX_ROUNDS,
+        early_stopping_rounds: int = EARLY_STOPPING_ROUNDS,
+        threads: Optional[int] = None,
+        seed: int = 0) -> dict:
+    """
+    Multi-fidelity successive halving: every trial is scored on a small subsample of the zones and
+    months, and only the best 1/`eta` of each rung moves on to the next, larger fidelity, up to the
+    full training set.
+
+    All trials are asked from the study up front, so the sampler draws them before seeing any score.
+    Each trial reports its MAE at every rung it reaches; eliminated trials end as pruned and the
+    survivors of the last rung as complete with their full-data MAE. Folds are early-stopped as in
+    `tune_with_pruning`.
+
+    Args:
+    - df: Feature-target table as built by `process_feature_target_by_PULocationID`.
+    - model: Estimator class passed to `get_pipeline`, e.g. LGBMRegressor.
+    - param_suggestion_func: Function mapping a trial to hyperparameters, e.g. `lgbm_param_suggestion`.
+    - cutoff_date: Rows before it are used for tuning, the others for the final test MAE.
+    - target_column_name: The name of the target column.
+    - n_trials: Number of trials of the first rung.
+    - eta: Reduction factor between rungs.
+    - fidelities: (share of the zones, months of history or None) of each rung, see `FIDELITIES`.
+    - n_splits: Number of `TimeSeriesSplit` folds per evaluation.
+    - max_rounds: Upper bound of the boosting rounds of LightGBM and XGBoost.
+    - early_stopping_rounds: Rounds without improvement of the validation MAE before boosting stops.
+    - threads: `n_jobs` of estimators that support it. None leaves it to the estimator.
+    - seed: Seed of the TPE sampler and of the zone subsample.
+
+    Returns:
+    - The dictionary of `tune_with_pruning`, 'evaluations' holding one row per trial and rung.
+    """
+    import optuna
+    from optuna.trial import TrialState
+
+    study = optuna.create_study(direction='minimize', sampler=optuna.samplers.TPESampler(seed=seed))
+    start = time.perf_counter()
+    evaluations = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        matrix = TrainingMatrix(export_training_matrix(df, Path(tmp) / 'matrix', target_column_name, order='time'))
+        trials = [study.ask() for _ in range(n_trials)]
+        trial_hyperparameters = {
+            trial.number: with_threads(model, {**param_suggestion_func(trial), 'n_estimators': max_rounds}, threads)
+            for trial in trials
+        }
+
+        for rung, (zone_share, months) in enumerate(fidelities):
+            X, y, _ = engineered_arrays(matrix, fidelity_rows(matrix, cutoff_date, zone_share, months, seed))
+            scores = {}
+            for trial in trials:
+                mae, n_rounds = cross_validate_mae(model, trial_hyperparameters[trial.number], X, y, n_splits,
+                                                   early_stopping_rounds)
+                trial.report(mae, rung)
+                scores[trial.number] = mae
+                evaluations.append({'trial': trial.number, 'rung': rung, 'rows': len(X), 'mae': mae,
+                                    'n_estimators': n_rounds, 'elapsed_seconds': time.perf_counter() - start})
+                if rung == len(fidelities) - 1:
+                    trial_hyperparameters[trial.number] = _final_hyperparameters(trial_hyperparameters[trial.number], n_rounds)
+
+            if rung == len(fidelities) - 1:
+                for trial in trials:
+                    study.tell(trial, scores[trial.number])
+                break
+            trials = sorted(trials, key=lambda trial: scores[trial.number])
+            n_keep = max(1, math.ceil(len(trials) / eta))
+            for trial in trials[n_keep:]:
+                study.tell(trial, state=TrialState.PRUNED)
+            logger.info(f"Rung {rung}: {len(X)} rows, kept {n_keep} of {len(trials)} trials, best MAE {scores[trials[0].number]:.4f}")
+            trials = trials[:n_keep]
+
+        return _result('successive_halving', study, trial_hyperparameters[study.best_trial.number], evaluations,
+                       matrix, model, cutoff_date, start)
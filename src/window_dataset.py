@@ -0,0 +1,88 @@
+from typing import Iterator
+import numpy as np
+import pandas as pd
+from src.logger import get_logger
+from src.transform import build_window_index, window_features, windows_to_frame
+
+logger = get_logger()
+
+class WindowDataset:
+    """
+    Lazy view of the feature-target table of `process_feature_target_by_PULocationID`.
+
+    Only the dense per-zone series and one start offset per window are kept in memory; feature rows
+    are gathered from a strided view of the series when they are requested. With `step_size=23` and
+    672 features the materialized table is about 29x the series, this dataset about 1x.
+
+    Row `i` of the dataset is row `i` of the materialized table:
+
+        dataset = WindowDataset(df_time_series, n_features=672, step_size=23)
+        len(dataset)                          # number of windows
+        x, y = dataset[0]                     # one float32 window (a view) and its target
+        X, y = dataset[100:200]               # a float32 block and its targets
+        for X, y in dataset.batches(4096):    # fixed-size float32 blocks
+            ...
+        for X, y in dataset.batches(4096, as_frame=True):   # DataFrame batches for `get_pipeline`
+            ...
+        features, targets = dataset.to_frame()               # optional full materialization
+    """
+
+    def __init__(self, df_time_series: pd.DataFrame, n_features: int, step_size: int = 1):
+        self.n_features = n_features
+        self.step_size = step_size
+        self.index = build_window_index(df_time_series, n_features, step_size)
+
+    def __len__(self) -> int:
+        return len(self.index['window_starts'])
+
+    def __getitem__(self, item):
+        """
+        An int returns (features, target) of one window, the features being a read-only view of the
+        series. A slice or an array of positions returns a (k, n_features) float32 block and k targets.
+        """
+        if isinstance(item, (int, np.integer)):
+            position = range(len(self))[item]
+            start = self.index['window_starts'][position]
+            rides = self.index['rides']
+            view = rides[start:start + self.n_features]
+            view.flags.writeable = False  # writes would change every window sharing these hours
+            return view, rides[start + self.n_features + 1]
+
+        window_starts = self.index['window_starts'][item]
+        return window_features(self.index, item), self.index['rides'][window_starts + self.n_features + 1]
+
+    def batches(self, batch_size: int = 4096, as_frame: bool = False, shuffle: bool = False,
+                seed: int = 0) -> Iterator[tuple]:
+        """
+        Iterate over the windows in blocks of `batch_size` rows (the last one may be smaller).
+
+        Args:
+        - batch_size: Number of windows per block.
+        - as_frame: Yield (features, targets) with the columns of `process_feature_target_by_PULocationID`
+          instead of (float32 array, float32 array).
+        - shuffle: Visit the windows in a random order, e.g. for minibatch training.
+        - seed: Seed of the shuffle.
+        """
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else None
+        for start in range(0, len(self), batch_size):
+            windows = slice(start, start + batch_size) if order is None else order[start:start + batch_size]
+            yield windows_to_frame(self.index, windows) if as_frame else self[windows]
+
+    def predict(self, model, batch_size: int = 4096) -> np.ndarray:
+        """Predict every window with a fitted `get_pipeline` model, one DataFrame batch at a time."""
+        predictions = [model.predict(features) for features, _ in self.batches(batch_size, as_frame=True)]
+        return np.concatenate(predictions) if predictions else np.empty(0)
+
+    def to_frame(self):
+        """Materialize the whole table, identical to `process_feature_target_by_PULocationID`."""
+        return windows_to_frame(self.index)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the dataset: the series, its hours and the window offsets."""
+        return sum(self.index[key].nbytes for key in ('rides', 'pickup_hours', 'window_starts', 'window_location'))
+
+    @property
+    def materialized_nbytes(self) -> int:
+        """Memory the float32 feature block of the materialized table would take."""
+        return len(self) * self.n_features * np.dtype(np.float32).itemsize
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+from benchmarks.synthetic import make_synthetic_time_series, write_synthetic_raw_files
+from src.extract import validate_and_process_data
+from src.paths import YELLOW
+from src.transform import process_feature_target_by_PULocationID
+
+N_FEATURES = 24 * 28
+
+@pytest.fixture
+def time_series() -> pd.DataFrame:
+    """Five zones over five weeks: enough hours for `N_FEATURES`-hour windows and a test period."""
+    return make_synthetic_time_series(5, 24 * 35)
+
+@pytest.fixture
+def features_target(time_series) -> pd.DataFrame:
+    features, targets = process_feature_target_by_PULocationID(time_series, N_FEATURES, step_size=5)
+    return features.assign(target_rides_next_hour=targets)
+
+@pytest.fixture
+def filtered_dir(tmp_path):
+    """Three filtered months of synthetic yellow taxi rides."""
+    write_synthetic_raw_files(tmp_path / 'raw', YELLOW, [2022], [1, 2, 3], n_rides=5_000)
+    for month in (1, 2, 3):
+        validate_and_process_data(YELLOW, 2022, month, tmp_path / 'raw', tmp_path / 'filtered')
+    return tmp_path / 'filtered'
+
+@pytest.fixture
+def training_table() -> pd.DataFrame:
+    """Feature-target table of six zones over two months: a month of windows to train and test on."""
+    features, targets = process_feature_target_by_PULocationID(make_synthetic_time_series(6, 24 * 60), N_FEATURES, step_size=5)
+    return features.assign(target_rides_next_hour=targets)
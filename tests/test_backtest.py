@@ -0,0 +1,18 @@
+import numpy as np
+from lightgbm import LGBMRegressor
+from benchmarks.legacy import legacy_backtest
+from src.backtest import backtest, walk_forward_cutoffs
+
+HYPERPARAMETERS = dict(n_estimators=20, verbosity=-1, n_jobs=1)
+
+def test_backtest_matches_refitting_at_every_cutoff(training_table):
+    # Same row order as the time-ordered training matrix, so both fits see identical data
+    df = training_table.sort_values(['pickup_hour', 'PULocationID'], ignore_index=True)
+    cutoffs = walk_forward_cutoffs(df['pickup_hour'], n_folds=3, horizon='3D')
+    assert cutoffs == sorted(cutoffs) and cutoffs[-1] + np.timedelta64(3, 'D') > df['pickup_hour'].max()
+
+    result = backtest(df, LGBMRegressor, cutoffs, horizon='3D', hyperparameters=HYPERPARAMETERS, n_workers=1)
+
+    np.testing.assert_allclose(result['folds']['mae'], legacy_backtest(df, LGBMRegressor, cutoffs, '3D', **HYPERPARAMETERS),
+                               rtol=1e-5)
+    assert len(result['zones']) == len(cutoffs) * df['PULocationID'].nunique()
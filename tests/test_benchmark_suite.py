@@ -0,0 +1,17 @@
+from benchmarks.suite import compare_to_baseline, time_case
+
+def results(**min_seconds):
+    return {'results': [{'case': case, 'scale': 'small', 'rows': 10, 'min_seconds': seconds}
+                        for case, seconds in min_seconds.items()]}
+
+def test_compare_to_baseline_flags_slowdowns_over_the_threshold():
+    report = compare_to_baseline(results(fast=1.0, slow=1.5, new=1.0), results(fast=1.1, slow=1.0), threshold=0.2)
+
+    assert report.set_index('case')['regression'].to_dict() == {'fast': False, 'slow': True, 'new': False}
+    assert report.set_index('case')['ratio'].isna().to_dict() == {'fast': False, 'slow': False, 'new': True}
+
+def test_time_case_summarises_every_repeat():
+    summary = time_case(sorted, ([3, 1, 2],), repeat=3)
+
+    assert summary['repeat'] == 3
+    assert 0 <= summary['min_seconds'] <= summary['median_seconds']
@@ -0,0 +1,15 @@
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+def test_importing_the_cli_loads_no_heavy_dependency():
+    code = ("import sys, src.cli; "
+            "print(sorted(m for m in ('pandas', 'numpy', 'sklearn', 'lightgbm', 'xgboost') if m in sys.modules))")
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == '[]'
+
+def test_help_lists_the_commands():
+    output = subprocess.run([sys.executable, '-m', 'src.cli', '--help'], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    assert 'predict' in output.stdout
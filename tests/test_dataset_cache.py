@@ -0,0 +1,47 @@
+import numpy as np
+import optuna
+import pytest
+from lightgbm import LGBMRegressor
+from xgboost import XGBRegressor
+import src.dataset_cache
+from src.dataset_cache import build_fold_datasets
+from src.parallel_training import lgbm_param_suggestion, tune_hyperparameters
+from src.training_matrix import TrainingMatrix, export_training_matrix
+
+optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+def xgb_param_suggestion(trial) -> dict:
+    return {"max_depth": trial.suggest_int("max_depth", 2, 8), "subsample": trial.suggest_float("subsample", 0.5, 1.0)}
+
+@pytest.mark.parametrize('model, suggestion', [
+    # The cached datasets do not pre-filter features, so the pipeline trials must not either
+    (LGBMRegressor, lambda trial: {**lgbm_param_suggestion(trial), 'n_estimators': 20, 'feature_pre_filter': False}),
+    (XGBRegressor, lambda trial: {**xgb_param_suggestion(trial), 'n_estimators': 20}),
+])
+def test_cached_datasets_score_trials_like_the_pipeline(tmp_path, training_table, model, suggestion):
+    cutoff_date = training_table['pickup_hour'].quantile(0.8)
+
+    scores = {}
+    for variant, cache_dir in (('pipeline', None), ('cached', tmp_path), ('cached_reuse', tmp_path)):
+        study = optuna.create_study(direction='minimize', sampler=optuna.samplers.TPESampler(seed=0))
+        tune_hyperparameters(training_table, model, suggestion, cutoff_date, n_trials=3, n_splits=2, n_workers=1,
+                             study=study, dataset_cache_dir=cache_dir)
+        scores[variant] = [trial.value for trial in study.trials]
+
+    np.testing.assert_allclose(scores['cached'], scores['pipeline'], rtol=1e-4)
+    np.testing.assert_allclose(scores['cached_reuse'], scores['cached'])
+
+def test_cached_datasets_are_found_before_engineering_features(tmp_path, training_table, monkeypatch):
+    cutoff_date = training_table['pickup_hour'].quantile(0.8)
+    directory = build_fold_datasets(TrainingMatrix(export_training_matrix(training_table, tmp_path / 'first')),
+                                    cutoff_date, n_splits=2, cache_dir=tmp_path / 'datasets')
+
+    def engineered_arrays(*args):
+        raise AssertionError('features engineered for a cached dataset')
+    monkeypatch.setattr(src.dataset_cache, 'engineered_arrays', engineered_arrays)
+
+    # The same table exported again is recognised by its fingerprint
+    matrix = TrainingMatrix(export_training_matrix(training_table, tmp_path / 'second'))
+    assert build_fold_datasets(matrix, cutoff_date, n_splits=2, cache_dir=tmp_path / 'datasets') == directory
+    with pytest.raises(AssertionError):
+        build_fold_datasets(matrix, cutoff_date - np.timedelta64(1, 'D'), n_splits=2, cache_dir=tmp_path / 'datasets')
@@ -0,0 +1,29 @@
+import os
+import pandas as pd
+import pytest
+from src.dataset_ref import dataset_ref, load_dataset
+
+@pytest.fixture
+def ref(tmp_path):
+    df = pd.DataFrame({'rides': range(10)})
+    df.to_parquet(tmp_path / 'data.parquet')
+    return dataset_ref(tmp_path / 'data.parquet', len(df))
+
+def test_load_dataset_detects_a_rewritten_file(ref):
+    assert ref['n_rows'] == 10
+    pd.testing.assert_frame_equal(load_dataset(ref), pd.DataFrame({'rides': range(10)}))
+
+    pd.DataFrame({'rides': range(1, 11)}).to_parquet(ref['path'])
+    with pytest.raises(ValueError):
+        load_dataset(ref)
+
+def test_verify_hashes_the_content(ref):
+    # Same size and modification time, different content: only the hash tells them apart
+    content = bytearray(open(ref['path'], 'rb').read())
+    content[-9] ^= 1
+    with open(ref['path'], 'wb') as f:
+        f.write(content)
+    os.utime(ref['path'], ns=(ref['mtime_ns'], ref['mtime_ns']))
+
+    with pytest.raises(ValueError):
+        load_dataset(ref, verify=True)
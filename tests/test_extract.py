@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+from benchmarks.legacy import legacy_read_raw_month
+from benchmarks.synthetic import serve_directory, write_synthetic_raw_files
+from src.extract import fetch_data_if_not_exists, ingest_months, read_raw_month, validate_and_process_data
+from src.filtering import select_important_columns
+from src.paths import FHV, YELLOW
+from src.profiling import RunProfiler
+
+def test_ingest_months_matches_sequential_and_resumes(tmp_path):
+    write_synthetic_raw_files(tmp_path / 'served', YELLOW, [2022], [1, 2], 2_000)
+    server = serve_directory(tmp_path / 'served')
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        for month in (1, 2):
+            fetch_data_if_not_exists(YELLOW, 2022, month, base_url, tmp_path / 'sequential' / 'raw')
+            validate_and_process_data(YELLOW, 2022, month, tmp_path / 'sequential' / 'raw', tmp_path / 'sequential' / 'filtered')
+
+        kwargs = dict(base_url=base_url, raw_dir=tmp_path / 'concurrent' / 'raw', filtered_dir=tmp_path / 'concurrent' / 'filtered')
+        manifest = ingest_months(YELLOW, [2022], [1, 2], **kwargs)
+        assert set(manifest.values()) == {'filtered'}
+
+        filtered = sorted((tmp_path / 'concurrent' / 'filtered').glob('*.parquet'))
+        mtimes = [file_path.stat().st_mtime_ns for file_path in filtered]
+        assert ingest_months(YELLOW, [2022], [1, 2], **kwargs) == manifest
+        assert [file_path.stat().st_mtime_ns for file_path in filtered] == mtimes
+    finally:
+        server.shutdown()
+
+    for file_path in filtered:
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(file_path), pd.read_parquet(tmp_path / 'sequential' / 'filtered' / file_path.name)
+        )
+
+def test_profiled_ingest_records_fetch_and_validate(tmp_path):
+    write_synthetic_raw_files(tmp_path / 'served', YELLOW, [2022], [1, 2], 2_000)
+    server = serve_directory(tmp_path / 'served')
+    profiler = RunProfiler('run', report_dir=tmp_path / 'reports')
+    try:
+        manifest = ingest_months(YELLOW, [2022], [1, 2], base_url=f"http://127.0.0.1:{server.server_address[1]}/",
+                                 raw_dir=tmp_path / 'raw', filtered_dir=tmp_path / 'filtered', profiler=profiler)
+    finally:
+        server.shutdown()
+
+    assert set(manifest.values()) == {'filtered'}
+    report = profiler.report()
+    assert report['stage'].tolist() == ['fetch', 'validate']
+    assert report['rows_out'].tolist() == [2, 2]
+
+@pytest.mark.parametrize('path', [YELLOW, FHV])
+def test_read_raw_month_matches_full_read(tmp_path, path):
+    file_path = write_synthetic_raw_files(tmp_path, path, [2022], [1], 5_000)[0]
+
+    pd.testing.assert_frame_equal(
+        select_important_columns(read_raw_month(file_path, path, 2022, 1), path).dropna().reset_index(drop=True),
+        legacy_read_raw_month(file_path, path, 2022, 1).reset_index(drop=True),
+    )
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from lightgbm import LGBMRegressor
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import FunctionTransformer
+from benchmarks.legacy import LegacyTemporalFeatures, legacy_average_rides_last_4_weeks
+from src.feature_engineering import TemporalFeatures, average_rides_last_4_weeks, feature_array
+from src.model import get_array_pipeline, get_pipeline
+
+HYPERPARAMETERS = dict(n_estimators=20, verbosity=-1)
+
+def test_features_and_predictions_match_the_copying_transformers(training_table):
+    X = training_table.drop(columns=['PULocationID', 'target_rides_next_hour'])
+    y = training_table['target_rides_next_hour']
+    lag_columns = [column for column in X.columns if column != 'pickup_hour']
+    X_array = feature_array(X[lag_columns].to_numpy(), X['pickup_hour'])
+
+    expected = LegacyTemporalFeatures().transform(legacy_average_rides_last_4_weeks(X))
+    pd.testing.assert_frame_equal(TemporalFeatures().transform(average_rides_last_4_weeks(X)), expected)
+    np.testing.assert_array_equal(get_array_pipeline(LGBMRegressor, lag_columns)[0].transform(X_array),
+                                  expected.to_numpy(dtype=np.float32))
+
+    legacy_pipeline = make_pipeline(FunctionTransformer(legacy_average_rides_last_4_weeks, validate=False),
+                                    LegacyTemporalFeatures(), LGBMRegressor(**HYPERPARAMETERS))
+    legacy = legacy_pipeline.fit(X, y).predict(X)
+    np.testing.assert_allclose(get_pipeline(LGBMRegressor, **HYPERPARAMETERS).fit(X, y).predict(X), legacy)
+    np.testing.assert_allclose(
+        get_array_pipeline(LGBMRegressor, lag_columns, **HYPERPARAMETERS).fit(X_array, y).predict(X_array), legacy
+    )
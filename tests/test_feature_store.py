@@ -0,0 +1,30 @@
+import pandas as pd
+from src.feature_store import read_feature_group, read_latest_hours, write_feature_group
+from src.paths import YELLOW
+
+def test_slice_matches_filtering_the_table(tmp_path, time_series, features_target):
+    zone = time_series['PULocationID'].iloc[0]
+    start, end = pd.Timestamp('2022-01-10'), pd.Timestamp('2022-02-01')
+    for name, df in (('time_series', time_series), ('features_target', features_target)):
+        write_feature_group(df, name, YELLOW, store_dir=tmp_path)
+
+        sliced = read_feature_group(name, YELLOW, zones=[zone], start=start, end=end, store_dir=tmp_path)
+        expected = df[(df['PULocationID'] == zone) & (df['pickup_hour'] >= start) & (df['pickup_hour'] < end)]
+        pd.testing.assert_frame_equal(sliced[df.columns], expected.reset_index(drop=True))
+
+def test_rewriting_a_month_keeps_the_others(tmp_path, time_series):
+    write_feature_group(time_series, 'time_series', YELLOW, store_dir=tmp_path)
+    february = time_series[time_series['pickup_hour'] >= pd.Timestamp('2022-02-01')]
+    write_feature_group(february.assign(rides=february['rides'] + 1), 'time_series', YELLOW, store_dir=tmp_path)
+
+    stored = read_feature_group('time_series', YELLOW, store_dir=tmp_path)[time_series.columns]
+    expected = time_series.copy()
+    expected.loc[february.index, 'rides'] += 1
+    pd.testing.assert_frame_equal(
+        stored.sort_values(['pickup_hour', 'PULocationID'], ignore_index=True),
+        expected.sort_values(['pickup_hour', 'PULocationID'], ignore_index=True),
+    )
+
+    latest = read_latest_hours('time_series', YELLOW, 24, store_dir=tmp_path)
+    assert latest['pickup_hour'].nunique() == 24
+    assert latest['pickup_hour'].max() == time_series['pickup_hour'].max()
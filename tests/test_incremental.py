@@ -0,0 +1,89 @@
+import pandas as pd
+import pytest
+from benchmarks.synthetic import write_synthetic_raw_files
+from src.extract import read_filtered_month, validate_and_process_data
+from src.feature_store import read_feature_group, read_latest_hours, write_feature_group
+from src.logger import get_logger
+from src.paths import YELLOW
+from src.pipeline import changed_rows, month_start
+from src.transform import (add_missing_slots, process_feature_target_by_PULocationID, process_filtered_dataframe,
+                           time_series_to_dense_matrix, update_feature_target_data, update_time_series_data)
+
+logger = get_logger()
+
+N_FEATURES, STEP_SIZE = 24 * 7, 23
+
+def full_rebuild(filtered_dir, months):
+    df_filtered = pd.concat([read_filtered_month(YELLOW, 2022, month, filtered_dir) for month in months], ignore_index=True)
+    df_time_series = add_missing_slots(process_filtered_dataframe(df_filtered))
+    features, targets = process_feature_target_by_PULocationID(df_time_series, N_FEATURES, STEP_SIZE)
+    return df_time_series, features.join(pd.DataFrame(targets, columns=['target_rides_next_hour']))
+
+def test_incremental_update_matches_full_rebuild(tmp_path):
+    months = [1, 2, 3]
+    write_synthetic_raw_files(tmp_path / 'raw', YELLOW, [2022], months, 5_000)
+    for month in months:
+        validate_and_process_data(YELLOW, 2022, month, tmp_path / 'raw', tmp_path / 'filtered')
+
+    # Existing outputs built from every month but the last one
+    last_month = tmp_path / 'filtered' / f"{YELLOW}_2022-03.parquet"
+    last_month.rename(tmp_path / 'last_month.parquet')
+    df_time_series, _ = update_time_series_data(YELLOW, logger, tmp_path / 'filtered', tmp_path / 'time_series')
+    features, targets = process_feature_target_by_PULocationID(df_time_series, N_FEATURES, STEP_SIZE)
+    df_features_target = features.join(pd.DataFrame(targets, columns=['target_rides_next_hour']))
+    (tmp_path / 'last_month.parquet').rename(last_month)
+
+    df_time_series, changed = update_time_series_data(YELLOW, logger, tmp_path / 'filtered', tmp_path / 'time_series')
+    full_series, full_features = full_rebuild(tmp_path / 'filtered', months)
+    assert changed
+    pd.testing.assert_frame_equal(df_time_series, full_series)
+    pd.testing.assert_frame_equal(
+        update_feature_target_data(df_time_series, df_features_target, N_FEATURES, STEP_SIZE), full_features
+    )
+
+def test_rebuilds_when_the_saved_time_series_changed(tmp_path):
+    write_synthetic_raw_files(tmp_path / 'raw', YELLOW, [2022], [1, 2], 5_000)
+    validate_and_process_data(YELLOW, 2022, 1, tmp_path / 'raw', tmp_path / 'filtered')
+    df_time_series, _ = update_time_series_data(YELLOW, logger, tmp_path / 'filtered', tmp_path / 'time_series')
+
+    # The saved time series is rewritten behind the state's back, e.g. by a full run, then a new month arrives
+    saved = tmp_path / 'time_series' / f"{YELLOW}_time_series.parquet"
+    df_time_series.assign(rides=df_time_series['rides'] * 2).to_parquet(saved)
+    validate_and_process_data(YELLOW, 2022, 2, tmp_path / 'raw', tmp_path / 'filtered')
+
+    df_time_series, _ = update_time_series_data(YELLOW, logger, tmp_path / 'filtered', tmp_path / 'time_series')
+    pd.testing.assert_frame_equal(df_time_series, full_rebuild(tmp_path / 'filtered', [1, 2])[0])
+
+def test_zones_seen_for_the_first_time_are_stored_with_their_history(tmp_path, filtered_dir):
+    # A zone with rides in March only
+    zone = read_filtered_month(YELLOW, 2022, 3, filtered_dir)['PULocationID'].value_counts().index[0]
+    for month in (1, 2):
+        file_path = filtered_dir / f"{YELLOW}_2022-0{month}.parquet"
+        df = pd.read_parquet(file_path)
+        df[df['pickup_location_id'] != zone].to_parquet(file_path)
+
+    last_month = filtered_dir / f"{YELLOW}_2022-03.parquet"
+    last_month.rename(tmp_path / 'last_month.parquet')
+    df_time_series, _ = update_time_series_data(YELLOW, logger, filtered_dir, tmp_path / 'time_series')
+    write_feature_group(df_time_series, 'time_series', YELLOW, store_dir=tmp_path / 'store')
+    known_zones = set(df_time_series['PULocationID'])
+    (tmp_path / 'last_month.parquet').rename(last_month)
+
+    df_time_series, _ = update_time_series_data(YELLOW, logger, filtered_dir, tmp_path / 'time_series')
+    new_zones = set(df_time_series['PULocationID']) - known_zones
+    assert zone in new_zones
+    write_feature_group(changed_rows(df_time_series, month_start('2022-03'), new_zones), 'time_series', YELLOW,
+                        store_dir=tmp_path / 'store')
+
+    stored = read_feature_group('time_series', YELLOW, store_dir=tmp_path / 'store')[df_time_series.columns]
+    pd.testing.assert_frame_equal(
+        stored.sort_values(['PULocationID', 'pickup_hour'], ignore_index=True),
+        df_time_series.sort_values(['PULocationID', 'pickup_hour'], ignore_index=True),
+    )
+    latest = read_latest_hours('time_series', YELLOW, 24 * 40, store_dir=tmp_path / 'store')
+    matrix, pickup_hours, _ = time_series_to_dense_matrix(latest)
+    assert matrix.shape == (24 * 40, df_time_series['PULocationID'].nunique())
+
+def test_incomplete_time_series_are_rejected(time_series):
+    with pytest.raises(ValueError, match='complete grid'):
+        time_series_to_dense_matrix(time_series.iloc[1:])
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.legacy import legacy_predict_all_zones
+from benchmarks.synthetic import make_synthetic_time_series, train_synthetic_model
+from src.inference import build_latest_windows, predict_all_zones
+from src.transform import (DEFAULT_LAG_SPEC, lag_spec_columns, process_feature_target_by_PULocationID,
+                           time_series_to_dense_matrix)
+
+N_FEATURES = 24 * 28
+
+def test_predict_all_zones_scores_the_row_targeting_the_hour(tmp_path):
+    df_time_series = make_synthetic_time_series(5, 24 * 35)
+    model = train_synthetic_model(df_time_series, tmp_path / 'model.joblib', N_FEATURES, n_estimators=20)
+
+    # The last row of each zone in the table targets the last hour, which is held out of the history
+    features, targets = process_feature_target_by_PULocationID(df_time_series, N_FEATURES, step_size=1)
+    at_hour = df_time_series['pickup_hour'].max()
+    last_rows = features.groupby('PULocationID', sort=False).tail(1)
+    observed = df_time_series[df_time_series['pickup_hour'] == at_hour].set_index('PULocationID')['rides']
+    np.testing.assert_array_equal(targets.loc[last_rows.index], observed[last_rows['PULocationID']])
+
+    history = df_time_series[df_time_series['pickup_hour'] < at_hour]
+    predictions = predict_all_zones(model, history, at_hour, N_FEATURES)
+    assert (predictions['pickup_hour'] == at_hour).all()
+    np.testing.assert_allclose(predictions['predicted_rides'], model.predict(last_rows), rtol=1e-6)
+
+    # Scoring from the dense matrix or zone by zone gives the same predictions
+    at_hour = history['pickup_hour'].max() + pd.Timedelta(hours=1)
+    from_long = predict_all_zones(model, history, at_hour, N_FEATURES)
+    pd.testing.assert_frame_equal(from_long, legacy_predict_all_zones(model, history, at_hour, N_FEATURES), check_dtype=False)
+    pd.testing.assert_frame_equal(predict_all_zones(model, time_series_to_dense_matrix(history), at_hour, N_FEATURES), from_long)
+
+def test_latest_sparse_windows_are_the_last_rows_of_the_table():
+    df_time_series = make_synthetic_time_series(5, 24 * 35)
+    features, _ = process_feature_target_by_PULocationID(df_time_series, N_FEATURES, step_size=5, lag_spec=DEFAULT_LAG_SPEC)
+
+    # The window predicting the hour after the last target of each zone is the last row of the table
+    last_rows = features.groupby('PULocationID', sort=False).tail(1)
+    latest = build_latest_windows(*time_series_to_dense_matrix(df_time_series),
+                                  last_rows['pickup_hour'].iloc[0] + pd.Timedelta(hours=1), N_FEATURES, DEFAULT_LAG_SPEC)
+    columns = lag_spec_columns(DEFAULT_LAG_SPEC)
+    np.testing.assert_allclose(latest[columns], last_rows[columns], rtol=1e-6)
+
+def test_lag_spec_longer_than_the_windows_is_rejected():
+    df_time_series = make_synthetic_time_series(5, 24 * 35)
+    lag_spec = {**DEFAULT_LAG_SPEC, 'lags': [*DEFAULT_LAG_SPEC['lags'], N_FEATURES + 1]}
+    with pytest.raises(ValueError, match='more than n_features'):
+        build_latest_windows(*time_series_to_dense_matrix(df_time_series), df_time_series['pickup_hour'].max(),
+                             N_FEATURES, lag_spec)
@@ -0,0 +1,36 @@
+import json
+import numpy as np
+import pytest
+from lightgbm.basic import LightGBMError
+from lightgbm import LGBMRegressor
+from benchmarks.legacy import legacy_train_zone_models
+from src.parallel_training import train_zone_models
+
+HYPERPARAMETERS = dict(n_estimators=20, verbosity=-1, n_jobs=1)
+
+def test_train_zone_models_matches_sequential_loop(tmp_path, training_table):
+    cutoff_date = training_table['pickup_hour'].quantile(0.8)
+    legacy_rmse = legacy_train_zone_models(training_table, LGBMRegressor, cutoff_date, **HYPERPARAMETERS)
+
+    metrics = train_zone_models(training_table, LGBMRegressor, cutoff_date, hyperparameters=HYPERPARAMETERS,
+                                n_workers=1, registry_dir=tmp_path)
+
+    assert len(metrics) == training_table['PULocationID'].nunique()
+    for entry in metrics.itertuples():
+        assert np.isclose(entry.rmse, legacy_rmse[entry.zones[0]], rtol=1e-4), entry.group
+    registry = json.loads((tmp_path / 'lgbm' / 'registry.json').read_text())
+    assert len(list((tmp_path / 'lgbm').glob('*.joblib'))) == len(metrics)
+    assert registry['hyperparameters']['n_estimators'] == HYPERPARAMETERS['n_estimators']
+
+def test_failed_training_keeps_the_previous_models(tmp_path, training_table):
+    cutoff_date = training_table['pickup_hour'].quantile(0.8)
+    train_zone_models(training_table, LGBMRegressor, cutoff_date, hyperparameters=HYPERPARAMETERS,
+                      n_workers=1, registry_dir=tmp_path)
+    models = sorted(path.name for path in (tmp_path / 'lgbm').iterdir())
+
+    with pytest.raises(LightGBMError):
+        train_zone_models(training_table, LGBMRegressor, cutoff_date, n_workers=1, registry_dir=tmp_path,
+                          hyperparameters={**HYPERPARAMETERS, 'objective': 'not_an_objective'})
+
+    assert sorted(path.name for path in (tmp_path / 'lgbm').iterdir()) == models
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['lgbm']
@@ -0,0 +1,37 @@
+import json
+import numpy as np
+import pytest
+from src.profiling import RunProfiler
+
+def test_stages_are_recorded_and_reported(tmp_path):
+    profiler = RunProfiler('run', report_dir=tmp_path, profile_stages=['square'])
+    with profiler.stage('square', rows_in=1000) as record:
+        record['rows_out'] = len([i * i for i in range(1000)])
+    with profiler.stage('noop'):
+        pass
+
+    report = profiler.report()
+    assert report['stage'].tolist() == ['square', 'noop']
+    assert report.loc[0, 'rows_in'] == report.loc[0, 'rows_out'] == 1000
+    assert (report['wall_seconds'] >= 0).all()
+    assert (tmp_path / 'run' / 'square.prof').exists()
+    assert report.loc[1, 'profile'] is None
+
+    profiler.write_report()
+    RunProfiler('run', report_dir=tmp_path).write_report(append=True)
+    with open(tmp_path / 'run.json') as f:
+        assert [stage['stage'] for stage in json.load(f)['stages']] == ['square', 'noop']
+    assert (tmp_path / 'run.csv').exists()
+
+def test_nested_stages_keep_the_peak_of_the_outer_stage(tmp_path):
+    profiler = RunProfiler('run', report_dir=tmp_path)
+    with profiler.stage('outer'):
+        block = np.ones(2**27 // 8)  # 128 MB, freed before the inner stage resets the high-water mark
+        del block
+        with profiler.stage('inner'):
+            pass
+
+    report = profiler.report().set_index('stage')['peak_rss_mb']
+    if report.isna().any():
+        pytest.skip('The peak RSS cannot be reset on this platform')
+    assert report['outer'] >= report['inner'] + 100
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+from src.schema import compact_schema
+
+def test_compact_schema_casts_pipeline_columns():
+    df = pd.DataFrame({
+        'PULocationID': np.array([1, 265], dtype=np.int64),
+        'rides': np.array([3, 40_000], dtype=np.int64),
+        'rides_previous_1': [1.0, 2.0],
+        'target_rides_next_hour': [2.0, 3.0],
+        'type': ['yellow', 'green'],
+        'pickup_hour': pd.to_datetime(['2022-01-01 00:00', '2022-01-01 01:00']),
+    })
+
+    compact_schema(df)
+
+    assert df['PULocationID'].dtype == np.uint16
+    assert df['rides'].dtype == np.int32  # 40 000 rides do not fit in int16
+    assert df['rides_previous_1'].dtype == df['target_rides_next_hour'].dtype == np.float32
+    assert isinstance(df['type'].dtype, pd.CategoricalDtype)
+    assert df['pickup_hour'].dtype == 'datetime64[ns]'
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pydantic import ValidationError
+from benchmarks.synthetic import train_synthetic_model
+from src.inference import predict_all_zones
+from src.serving import NextHourDemandAPI, RideHistoryBuffer, ZonesRequest
+from src.transform import DEFAULT_LAG_SPEC, process_feature_target_by_PULocationID
+
+N_FEATURES = 24 * 28
+
+def test_buffer_appends_hours_in_place(time_series):
+    last_hour = time_series['pickup_hour'].max()
+    buffer = RideHistoryBuffer.from_time_series(time_series[time_series['pickup_hour'] < last_hour], n_hours=48)
+    latest = time_series[time_series['pickup_hour'] == last_hour].set_index('PULocationID')['rides']
+    buffer.append(last_hour, latest)
+
+    zones = time_series['PULocationID'].unique()[:3]
+    expected = RideHistoryBuffer.from_time_series(time_series, n_hours=48)
+    np.testing.assert_array_equal(buffer.windows(zones), expected.windows(zones))
+    assert buffer.last_hour == last_hour
+
+    with pytest.raises(ValueError):
+        buffer.append(last_hour + pd.Timedelta(hours=2), latest)
+
+def test_features_match_the_row_targeting_the_next_hour(time_series):
+    n_features = 24
+    last_hour = time_series['pickup_hour'].max()
+    features, targets = process_feature_target_by_PULocationID(time_series, n_features, step_size=1)
+    # The row labelled last_hour - 1 targets last_hour and holds the hours before last_hour - 1
+    expected = features[features['pickup_hour'] == last_hour - pd.Timedelta(hours=1)]
+
+    history = time_series[time_series['pickup_hour'] < last_hour]
+    buffer = RideHistoryBuffer.from_time_series(history, n_hours=n_features + 1)
+    pd.testing.assert_frame_equal(
+        buffer.features(expected['PULocationID'].to_numpy())[expected.columns],
+        expected.reset_index(drop=True), check_dtype=False,
+    )
+
+def test_request_without_zones_is_rejected():
+    assert ZonesRequest.model_validate({'zones': [43, 161]}).zones == [43, 161]
+    with pytest.raises(ValidationError):
+        ZonesRequest.model_validate({'zone': [43]})
+    with pytest.raises(ValidationError):
+        ZonesRequest.model_validate({'zones': 'all'})
+
+def test_serves_a_model_trained_with_a_lag_spec(tmp_path, time_series):
+    last_hour = time_series['pickup_hour'].max()
+    history = time_series[time_series['pickup_hour'] < last_hour]
+    history.to_parquet(tmp_path / 'time_series.parquet')
+    model = train_synthetic_model(history, tmp_path / 'model.joblib', N_FEATURES, lag_spec=DEFAULT_LAG_SPEC, n_estimators=20)
+
+    api = NextHourDemandAPI(tmp_path / 'model.joblib', tmp_path / 'time_series.parquet', n_features=N_FEATURES,
+                            lag_spec=DEFAULT_LAG_SPEC)
+    api.setup('cpu')
+    zones = history['PULocationID'].unique()[:3].tolist()
+    response = api.encode_response(api.predict(api.decode_request(ZonesRequest(zones=zones))))
+
+    expected = predict_all_zones(model, history, last_hour, N_FEATURES, DEFAULT_LAG_SPEC).set_index('PULocationID')
+    assert response['pickup_hour'] == str(last_hour)
+    np.testing.assert_allclose([response['predictions'][str(zone)] for zone in zones],
+                               expected.loc[zones, 'predicted_rides'], rtol=1e-6)
+
+def test_unknown_zones_fail_only_their_request(tmp_path, time_series):
+    time_series.to_parquet(tmp_path / 'time_series.parquet')
+    train_synthetic_model(time_series, tmp_path / 'model.joblib', N_FEATURES, n_estimators=5)
+    api = NextHourDemandAPI(tmp_path / 'model.joblib', tmp_path / 'time_series.parquet', n_features=N_FEATURES)
+    api.setup('cpu')
+
+    zones = time_series['PULocationID'].unique()[:2].tolist()
+    batch = api.batch([api.decode_request(ZonesRequest(zones=request)) for request in ([zones[0]], [999], zones)])
+    first, unknown, both = (api.encode_response(output) for output in api.unbatch(api.predict(batch)))
+    assert unknown.status_code == 422
+    assert first['predictions'][str(zones[0])] == both['predictions'][str(zones[0])]
+    assert list(both['predictions']) == [str(zone) for zone in zones]
@@ -0,0 +1,59 @@
+import pandas as pd
+import src.transform
+from benchmarks.synthetic import write_synthetic_raw_files
+from src.extract import list_filtered_months, validate_and_process_data
+from src.paths import YELLOW
+from src.pipeline import build_feature_target
+from src.stage_cache import StageCache, code_version
+from src.transform import add_missing_slots, aggregate_filtered_data
+
+N_FEATURES = 24 * 7
+
+def run_stages(cache, filtered_dir, step_size):
+    """The time series and feature-target stages of `run_pipeline` on the months in `filtered_dir`."""
+    filtered_files = [filtered_dir / f"{YELLOW}_{year}-{str(month).zfill(2)}.parquet"
+                      for year, month in list_filtered_months(YELLOW, filtered_dir)]
+    df_time_series, time_series_key = cache.get_or_compute(
+        'time_series', lambda: add_missing_slots(aggregate_filtered_data(YELLOW, filtered_dir)),
+        inputs=filtered_files, params={'path': YELLOW}, code=code_version(src.transform)
+    )
+    return cache.get_or_compute(
+        'features_target', build_feature_target, df_time_series, N_FEATURES, step_size,
+        params={'time_series': time_series_key, 'n_features': N_FEATURES, 'step_size': step_size},
+        code=code_version(src.transform)
+    )[0]
+
+def test_changed_parameters_or_inputs_miss_the_cache(tmp_path, filtered_dir):
+    cold = run_stages(StageCache(tmp_path / 'cache'), filtered_dir, 23)
+    cache = StageCache(tmp_path / 'cache')
+    pd.testing.assert_frame_equal(run_stages(cache, filtered_dir, 23), cold)
+    assert cache.stats() == {'features_target': {'hits': 1, 'misses': 0}, 'time_series': {'hits': 1, 'misses': 0}}
+
+    # A new step size only recomputes the feature-target stage
+    cache = StageCache(tmp_path / 'cache')
+    run_stages(cache, filtered_dir, 24)
+    assert cache.stats() == {'features_target': {'hits': 0, 'misses': 1}, 'time_series': {'hits': 1, 'misses': 0}}
+
+    # Rewriting a filtered month recomputes both stages
+    first_month = filtered_dir / f"{YELLOW}_2022-01.parquet"
+    pd.read_parquet(first_month).iloc[1:].to_parquet(first_month)
+    cache = StageCache(tmp_path / 'cache')
+    run_stages(cache, filtered_dir, 23)
+    assert cache.stats() == {'features_target': {'hits': 0, 'misses': 1}, 'time_series': {'hits': 0, 'misses': 1}}
+
+def test_cache_evicts_least_recently_used_entries(tmp_path, filtered_dir):
+    cache = StageCache(tmp_path / 'cache', max_bytes=1)
+    run_stages(cache, filtered_dir, 23)
+
+    # A cache that only fits one entry keeps the most recent one
+    assert [entry['stage'] for entry in cache.index['entries'].values()] == ['features_target']
+    assert len(list((tmp_path / 'cache').glob('*/*.parquet'))) == 1
+
+def test_time_series_only_aggregates_the_requested_years(tmp_path, filtered_dir):
+    expected = aggregate_filtered_data(YELLOW, filtered_dir)
+    write_synthetic_raw_files(tmp_path / 'raw', YELLOW, [2023], [1], 5_000)
+    validate_and_process_data(YELLOW, 2023, 1, tmp_path / 'raw', filtered_dir)
+
+    assert list_filtered_months(YELLOW, filtered_dir, years=[2022]) == [(2022, 1), (2022, 2), (2022, 3)]
+    pd.testing.assert_frame_equal(aggregate_filtered_data(YELLOW, filtered_dir, years=[2022]), expected)
+    assert aggregate_filtered_data(YELLOW, filtered_dir)['pickup_hour'].max().year == 2023
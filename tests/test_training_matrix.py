@@ -0,0 +1,19 @@
+import pandas as pd
+from src.training import create_training_sets, create_training_sets_from_matrix
+from src.training_matrix import export_training_matrix
+
+def test_matrix_sets_match_the_parquet_sets(tmp_path, features_target):
+    cutoff_date = features_target['pickup_hour'].quantile(0.8)
+    features_target.to_parquet(tmp_path / 'features_target.parquet')
+    export_training_matrix(features_target, tmp_path / 'training_matrix')
+
+    legacy_sets = create_training_sets(tmp_path / 'features_target.parquet', cutoff_date, 'target_rides_next_hour')
+    matrix_sets = create_training_sets_from_matrix(tmp_path / 'training_matrix', cutoff_date)
+
+    assert sorted(matrix_sets) == sorted(int(zone) for zone in legacy_sets)
+    for zone, legacy_split in legacy_sets.items():
+        for legacy_part, matrix_part in zip(legacy_split, matrix_sets[int(zone)]):
+            if isinstance(legacy_part, pd.DataFrame):
+                pd.testing.assert_frame_equal(matrix_part, legacy_part, check_dtype=False)
+            else:
+                pd.testing.assert_series_equal(matrix_part, legacy_part, check_dtype=False)
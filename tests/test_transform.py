@@ -0,0 +1,81 @@
+import re
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.legacy import (legacy_add_missing_slots, legacy_aggregate_filtered_data,
+                               legacy_process_feature_target_by_PULocationID, legacy_process_filtered_dataframe)
+from benchmarks.synthetic import make_synthetic_grouped, make_synthetic_pickups
+from src.paths import FHVHV, GREEN, YELLOW
+from src.pipeline import schedule_paths
+from src.schema import compact_schema
+from src.transform import (DEFAULT_LAG_SPEC, add_missing_slots, aggregate_filtered_data, combine_time_series, parse_lag_spec,
+                           process_feature_target_by_PULocationID, process_filtered_dataframe)
+
+def test_feature_target_matches_legacy_loop(time_series):
+    features, targets = process_feature_target_by_PULocationID(time_series, n_features=24, step_size=5)
+    legacy_features, legacy_targets = legacy_process_feature_target_by_PULocationID(time_series, 24, 5)
+
+    pd.testing.assert_frame_equal(features, compact_schema(legacy_features))
+    pd.testing.assert_series_equal(targets, legacy_targets)
+
+def test_add_missing_slots_matches_legacy_reindex():
+    df_grouped = make_synthetic_grouped(n_locations=10, n_hours=24 * 7)
+
+    pd.testing.assert_frame_equal(add_missing_slots(df_grouped), compact_schema(legacy_add_missing_slots(df_grouped)))
+
+def test_aggregate_filtered_data_matches_concatenation(filtered_dir):
+    pd.testing.assert_frame_equal(
+        aggregate_filtered_data(YELLOW, filtered_dir), legacy_aggregate_filtered_data(YELLOW, filtered_dir)
+    )
+
+def test_process_filtered_dataframe_matches_floor_groupby():
+    df = make_synthetic_pickups(n_months=2, rides_per_month=20_000)
+
+    pd.testing.assert_frame_equal(process_filtered_dataframe(df.copy()), legacy_process_filtered_dataframe(df))
+
+def test_combine_time_series_sums_every_type():
+    first = add_missing_slots(make_synthetic_grouped(n_locations=4, n_hours=48, seed=0))
+    second = add_missing_slots(make_synthetic_grouped(n_locations=4, n_hours=72, seed=1))
+
+    combined = combine_time_series([first, second]).set_index(['pickup_hour', 'PULocationID'])['rides']
+    expected = pd.concat([first, second]).groupby(['pickup_hour', 'PULocationID'])['rides'].sum()
+    assert combined.sum() == expected.sum()
+    pd.testing.assert_series_equal(combined[expected.index], expected, check_dtype=False, check_names=False)
+
+def test_largest_taxi_types_are_scheduled_first():
+    assert schedule_paths([GREEN, FHVHV, YELLOW], [2022]) == [FHVHV, YELLOW, GREEN]
+
+def test_sparse_lag_spec_matches_dense_columns(time_series):
+    dense, dense_target = process_feature_target_by_PULocationID(time_series, 24 * 28, step_size=5)
+    sparse, sparse_target = process_feature_target_by_PULocationID(time_series, 24 * 28, step_size=5,
+                                                                   lag_spec=DEFAULT_LAG_SPEC)
+
+    np.testing.assert_array_equal(sparse_target, dense_target)
+    lag_columns = [column for column in sparse.columns if column in dense.columns]
+    pd.testing.assert_frame_equal(sparse[lag_columns], dense[lag_columns])
+    for window in DEFAULT_LAG_SPEC['mean_windows']:
+        lags = dense[[f'rides_previous_{lag}' for lag in range(1, window + 1)]].to_numpy(dtype=np.float64)
+        np.testing.assert_allclose(sparse[f'rides_rolling_mean_{window}'], lags.mean(axis=1), rtol=1e-6)
+    for window in DEFAULT_LAG_SPEC['max_windows']:
+        lags = dense[[f'rides_previous_{lag}' for lag in range(1, window + 1)]].to_numpy()
+        np.testing.assert_array_equal(sparse[f'rides_rolling_max_{window}'], lags.max(axis=1))
+
+def test_parse_lag_spec_expands_ranges():
+    lag_spec = parse_lag_spec(['1-24', '168', '336', '504', '672'], [24, 168])
+
+    assert lag_spec == DEFAULT_LAG_SPEC
+
+@pytest.mark.parametrize('lags, message', [
+    (['-5', '168', '336', '504', '672'], "Invalid lag '-5'"),
+    (['0-24', '168', '336', '504', '672'], 'at least 1 hour'),
+    (['24-1', '168', '336', '504', '672'], 'first lag is larger'),
+    (['1-24', 'week'], "Invalid lag 'week'"),
+    (['1-24', '168', '336'], 'must include lags [504, 672]'),
+])
+def test_parse_lag_spec_rejects_unusable_lags(lags, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        parse_lag_spec(lags)
+
+def test_lag_spec_without_the_last_4_weeks_is_rejected(time_series):
+    with pytest.raises(ValueError, match='average_rides_last_4_weeks'):
+        process_feature_target_by_PULocationID(time_series, 24 * 28, lag_spec={'lags': list(range(1, 25))})
@@ -0,0 +1,19 @@
+import numpy as np
+import optuna
+import pytest
+from lightgbm import LGBMRegressor
+from src.parallel_training import lgbm_param_suggestion
+from src.tuning import successive_halving, tune_with_pruning
+
+optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+@pytest.mark.parametrize('tune, kwargs', [(tune_with_pruning, {}), (successive_halving, {'eta': 3})])
+def test_tuning_returns_early_stopped_hyperparameters(training_table, tune, kwargs):
+    cutoff_date = training_table['pickup_hour'].max() - np.timedelta64(7, 'D')
+
+    result = tune(training_table, LGBMRegressor, lgbm_param_suggestion, cutoff_date, n_trials=3, n_splits=2,
+                  max_rounds=50, early_stopping_rounds=5, **kwargs)
+
+    assert 1 <= result['hyperparameters']['n_estimators'] <= 50
+    assert np.isfinite(result['cv_mae']) and np.isfinite(result['test_mae'])
+    assert result['total_seconds'] >= result['tuning_seconds']
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.transform import process_feature_target_by_PULocationID
+from src.window_dataset import WindowDataset
+
+N_FEATURES = 48
+
+def test_batches_match_the_materialized_table(time_series):
+    dataset = WindowDataset(time_series, N_FEATURES, step_size=5)
+    features, targets = process_feature_target_by_PULocationID(time_series, N_FEATURES, step_size=5)
+
+    assert len(dataset) == len(features)
+    for batch_features, batch_targets in dataset.batches(100, as_frame=True):
+        pd.testing.assert_frame_equal(batch_features, features.loc[batch_features.index])
+        pd.testing.assert_series_equal(batch_targets, targets.loc[batch_targets.index])
+    block, block_targets = dataset[10:20]
+    np.testing.assert_array_equal(block, features.iloc[10:20, :N_FEATURES].to_numpy())
+    np.testing.assert_array_equal(block_targets, targets.iloc[10:20].to_numpy())
+    np.testing.assert_array_equal(dataset[-1][0], features.iloc[-1, :N_FEATURES].to_numpy(dtype=np.float32))
+
+    features_frame, targets_frame = dataset.to_frame()
+    pd.testing.assert_frame_equal(features_frame, features)
+    pd.testing.assert_series_equal(targets_frame, targets)
+
+def test_single_windows_are_read_only_views(time_series):
+    dataset = WindowDataset(time_series, N_FEATURES)
+    window, _ = dataset[1]
+
+    assert np.shares_memory(window, dataset.index['rides'])
+    with pytest.raises(ValueError):
+        window[0] = -1
+    np.testing.assert_array_equal(dataset[0][0][1:], window[:-1])